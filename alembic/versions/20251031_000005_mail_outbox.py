@@ -0,0 +1,62 @@
+"""mail outbox
+
+Revision ID: 20251031_000005
+Revises: 20251030_000002
+Create Date: 2025-10-31 00:00:05.000000
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "20251031_000005"
+down_revision: str | None = "20251030_000002"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "mail_outbox",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("recipient", sa.String(length=320), nullable=False),
+        sa.Column("subject", sa.String(length=255), nullable=False),
+        sa.Column("html", sa.Text(), nullable=False),
+        sa.Column(
+            "status", sa.String(length=16), nullable=False, server_default="pending"
+        ),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column(
+            "next_attempt_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.func.now(),
+        ),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.func.now(),
+        ),
+        sa.Column("sent_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_mail_outbox_status_next_attempt_at",
+        "mail_outbox",
+        ["status", "next_attempt_at"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_mail_outbox_created_at"), "mail_outbox", ["created_at"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_mail_outbox_created_at"), table_name="mail_outbox")
+    op.drop_index("ix_mail_outbox_status_next_attempt_at", table_name="mail_outbox")
+    op.drop_table("mail_outbox")
@@ -0,0 +1,116 @@
+"""content-addressed attachment blobs
+
+Revision ID: 20251101_000006
+Revises: 20251031_000005
+Create Date: 2025-11-01 00:00:06.000000
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "20251101_000006"
+down_revision: str | None = "20251031_000005"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+REFCOUNT_FUNCTION = """
+CREATE OR REPLACE FUNCTION attachment_blob_refcount() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.checksum IS NOT DISTINCT FROM NEW.checksum THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.checksum IS NOT NULL THEN
+        UPDATE attachment_blobs
+           SET ref_count = ref_count - 1,
+               unreferenced_at = CASE WHEN ref_count <= 1 THEN now() END
+         WHERE checksum = OLD.checksum;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.checksum IS NOT NULL THEN
+        UPDATE attachment_blobs
+           SET ref_count = ref_count + 1,
+               unreferenced_at = NULL
+         WHERE checksum = NEW.checksum;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade() -> None:
+    op.create_table(
+        "attachment_blobs",
+        sa.Column("checksum", sa.String(length=64), nullable=False),
+        sa.Column("storage_key", sa.Text(), nullable=False),
+        sa.Column("size_bytes", sa.BigInteger(), nullable=False),
+        sa.Column("ref_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column(
+            "created_at",
+            sa.DateTime(),
+            nullable=False,
+            server_default=sa.func.now(),
+        ),
+        sa.Column("unreferenced_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("checksum"),
+    )
+    op.create_index(
+        "ix_attachment_blobs_unreferenced",
+        "attachment_blobs",
+        ["unreferenced_at"],
+        unique=False,
+        postgresql_where=sa.text("ref_count = 0"),
+    )
+
+    # Existing duplicates collapse onto one of their files; the other copies
+    # are no longer referenced by any row and are left for file reconciliation.
+    op.execute(
+        """
+        INSERT INTO attachment_blobs (checksum, storage_key, size_bytes, ref_count, created_at)
+        SELECT checksum, min(s3_key), max(size_bytes), count(*), min(created_at)
+          FROM attachments
+         WHERE checksum IS NOT NULL
+         GROUP BY checksum
+        """
+    )
+    op.execute(
+        """
+        UPDATE attachments AS a
+           SET s3_key = b.storage_key
+          FROM attachment_blobs AS b
+         WHERE a.checksum = b.checksum AND a.s3_key <> b.storage_key
+        """
+    )
+
+    op.create_index(
+        op.f("ix_attachments_checksum"), "attachments", ["checksum"], unique=False
+    )
+    op.create_foreign_key(
+        "attachments_checksum_fkey",
+        "attachments",
+        "attachment_blobs",
+        ["checksum"],
+        ["checksum"],
+        ondelete="RESTRICT",
+    )
+    op.execute(REFCOUNT_FUNCTION)
+    op.execute(
+        """
+        CREATE TRIGGER attachments_blob_refcount
+        AFTER INSERT OR DELETE OR UPDATE OF checksum ON attachments
+        FOR EACH ROW EXECUTE FUNCTION attachment_blob_refcount()
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS attachments_blob_refcount ON attachments")
+    op.execute("DROP FUNCTION IF EXISTS attachment_blob_refcount()")
+    op.drop_constraint("attachments_checksum_fkey", "attachments", type_="foreignkey")
+    op.drop_index(op.f("ix_attachments_checksum"), table_name="attachments")
+    op.drop_index("ix_attachment_blobs_unreferenced", table_name="attachment_blobs")
+    op.drop_table("attachment_blobs")
@@ -0,0 +1,36 @@
+"""resumable attachment upload sessions
+
+Revision ID: 20251102_000007
+Revises: 20251101_000006
+Create Date: 2025-11-02 00:00:07.000000
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "20251102_000007"
+down_revision: str | None = "20251101_000006"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column("attachments", sa.Column("part_size", sa.Integer(), nullable=True))
+    op.add_column("attachments", sa.Column("expires_at", sa.DateTime(), nullable=True))
+    op.create_index(
+        "ix_attachments_pending_expires_at",
+        "attachments",
+        ["expires_at"],
+        unique=False,
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_attachments_pending_expires_at", table_name="attachments")
+    op.drop_column("attachments", "expires_at")
+    op.drop_column("attachments", "part_size")
@@ -0,0 +1,78 @@
+"""resume text extraction and full-text search
+
+Revision ID: 20251103_000008
+Revises: 20251102_000007
+Create Date: 2025-11-03 00:00:08.000000
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = "20251103_000008"
+down_revision: str | None = "20251102_000007"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    # existing resumes start out pending and are indexed in the background
+    op.add_column(
+        "user_resumes",
+        sa.Column(
+            "text_status", sa.String(length=16), nullable=False, server_default="pending"
+        ),
+    )
+    op.add_column(
+        "user_resumes",
+        sa.Column("text_attempts", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.add_column(
+        "user_resumes",
+        sa.Column(
+            "text_next_attempt_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.func.now(),
+        ),
+    )
+    op.add_column("user_resumes", sa.Column("content_text", sa.Text(), nullable=True))
+    op.add_column(
+        "user_resumes",
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed(
+                "to_tsvector('simple', coalesce(content_text, ''))", persisted=True
+            ),
+            nullable=True,
+        ),
+    )
+    op.create_index(
+        "ix_user_resumes_search_vector",
+        "user_resumes",
+        ["search_vector"],
+        unique=False,
+        postgresql_using="gin",
+    )
+    op.create_index(
+        "ix_user_resumes_text_due",
+        "user_resumes",
+        ["text_next_attempt_at"],
+        unique=False,
+        postgresql_where=sa.text("text_status IN ('pending', 'extracting')"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_user_resumes_text_due", table_name="user_resumes")
+    op.drop_index("ix_user_resumes_search_vector", table_name="user_resumes")
+    op.drop_column("user_resumes", "search_vector")
+    op.drop_column("user_resumes", "content_text")
+    op.drop_column("user_resumes", "text_next_attempt_at")
+    op.drop_column("user_resumes", "text_attempts")
+    op.drop_column("user_resumes", "text_status")
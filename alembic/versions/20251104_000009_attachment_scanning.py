@@ -0,0 +1,71 @@
+"""attachment scanning pipeline
+
+Revision ID: 20251104_000009
+Revises: 20251103_000008
+Create Date: 2025-11-04 00:00:09.000000
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "20251104_000009"
+down_revision: str | None = "20251103_000008"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "attachments",
+        sa.Column("scan_attempts", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.add_column(
+        "attachments",
+        sa.Column(
+            "scan_next_attempt_at",
+            sa.DateTime(),
+            nullable=False,
+            server_default=sa.func.now(),
+        ),
+    )
+    # "pending" now means stored and waiting for the scanner; the upload
+    # sessions that held it so far become "uploading". Files already ready
+    # stay ready without a scan.
+    op.drop_index("ix_attachments_pending_expires_at", table_name="attachments")
+    op.execute("UPDATE attachments SET status = 'uploading' WHERE status = 'pending'")
+    op.create_index(
+        "ix_attachments_uploading_expires_at",
+        "attachments",
+        ["expires_at"],
+        unique=False,
+        postgresql_where=sa.text("status = 'uploading'"),
+    )
+    op.create_index(
+        "ix_attachments_scan_due",
+        "attachments",
+        ["scan_next_attempt_at"],
+        unique=False,
+        postgresql_where=sa.text("status IN ('pending', 'scanning')"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_attachments_scan_due", table_name="attachments")
+    op.drop_index("ix_attachments_uploading_expires_at", table_name="attachments")
+    op.execute(
+        "UPDATE attachments SET status = 'ready' WHERE status IN ('pending', 'scanning')"
+    )
+    op.execute("UPDATE attachments SET status = 'pending' WHERE status = 'uploading'")
+    op.create_index(
+        "ix_attachments_pending_expires_at",
+        "attachments",
+        ["expires_at"],
+        unique=False,
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+    op.drop_column("attachments", "scan_next_attempt_at")
+    op.drop_column("attachments", "scan_attempts")
@@ -0,0 +1,41 @@
+"""indexes for file garbage collection
+
+Revision ID: 20251105_000010
+Revises: 20251104_000009
+Create Date: 2025-11-05 00:00:10.000000
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "20251105_000010"
+down_revision: str | None = "20251104_000009"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    # only unlinked uploads are indexed, so the orphan scan never walks the
+    # (much larger) set of attachments that belong to messages
+    op.create_index(
+        "ix_attachments_unlinked_created_at",
+        "attachments",
+        ["created_at"],
+        unique=False,
+        postgresql_where=sa.text("message_id IS NULL"),
+    )
+    op.create_index(
+        "ix_user_resumes_attachment_id",
+        "user_resumes",
+        ["attachment_id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_user_resumes_attachment_id", table_name="user_resumes")
+    op.drop_index("ix_attachments_unlinked_created_at", table_name="attachments")
@@ -1,3 +1,4 @@
+from collections.abc import AsyncIterator
 from typing import Annotated
 
 from fastapi import Depends
@@ -6,8 +7,14 @@ from jose import JWTError, jwt
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
-from app.core.exceptions import Unauthorized
-from app.db.session import get_db
+from app.core.exceptions import Forbidden, Unauthorized
+from app.core.security import jwt_claims
+from app.db.session import (
+    AsyncSessionLocal,
+    mark_read_your_writes,
+    open_read_session,
+    release_connection,
+)
 from app.models.user import User
 from sqlalchemy import select
 
@@ -15,12 +22,45 @@ from sqlalchemy import select
 security = HTTPBearer(auto_error=False)
 
 
+def _sticky_key(credentials: HTTPAuthorizationCredentials | None) -> str | None:
+    # routing hint only: the token is verified separately by get_current_user
+    if credentials is None:
+        return None
+    return jwt_claims(credentials.credentials).sub
+
+
+async def get_db(
+    credentials: HTTPAuthorizationCredentials | None = Depends(security),
+) -> AsyncIterator[AsyncSession]:
+    """Request-scoped session.
+
+    No connection is checked out until the first statement, and services end
+    their transaction (commit or ``release_connection``) before slow non-DB I/O,
+    so a connection is only held while SQL is actually running.
+    """
+    async with AsyncSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            sticky_key = _sticky_key(credentials)
+            if sticky_key and session.info.get("wrote"):
+                await mark_read_your_writes(sticky_key)
+
+
+async def get_read_db(
+    credentials: HTTPAuthorizationCredentials | None = Depends(security),
+) -> AsyncIterator[AsyncSession]:
+    """Session for read-only paths; served by a replica when one is healthy."""
+    session = await open_read_session(_sticky_key(credentials))
+    async with session:
+        yield session
+
+
 DBSession = Annotated[AsyncSession, Depends(get_db)]
+ReadDBSession = Annotated[AsyncSession, Depends(get_read_db)]
 
 
-async def get_current_user(
-    db: DBSession, credentials: HTTPAuthorizationCredentials | None = Depends(security)
-) -> User:
+def _token_subject(credentials: HTTPAuthorizationCredentials | None) -> str:
     if credentials is None:
         raise Unauthorized("Could not validate credentials")
     try:
@@ -34,9 +74,49 @@ async def get_current_user(
             raise Unauthorized("Could not validate credentials")
     except JWTError:
         raise Unauthorized("Invalid token")
+    return sub
+
 
-    result = await db.execute(select(User).where(User.email == sub))
+async def _load_user(db: AsyncSession, email: str) -> User | None:
+    result = await db.execute(select(User).where(User.email == email))
     user = result.scalar_one_or_none()
+    # the handler re-acquires a connection lazily on its first query
+    await release_connection(db)
+    return user
+
+
+def _require_active(user: User | None) -> User:
     if user is None or not user.is_active:
         raise Unauthorized("Could not validate credentials")
     return user
+
+
+async def get_current_user(
+    db: DBSession, credentials: HTTPAuthorizationCredentials | None = Depends(security)
+) -> User:
+    return _require_active(await _load_user(db, _token_subject(credentials)))
+
+
+async def get_current_user_read(
+    db: ReadDBSession, credentials: HTTPAuthorizationCredentials | None = Depends(security)
+) -> User:
+    """``get_current_user`` for ReadDBSession routes: the lookup shares their replica."""
+    email = _token_subject(credentials)
+    user = await _load_user(db, email)
+    if user is None:
+        # an account created moments ago may not have reached the replica yet
+        async with AsyncSessionLocal() as primary:
+            user = await _load_user(primary, email)
+    return _require_active(user)
+
+
+async def get_current_superuser(user: User = Depends(get_current_user)) -> User:
+    if not user.is_superuser:
+        raise Forbidden("Superuser privileges required")
+    return user
+
+
+async def get_current_superuser_read(user: User = Depends(get_current_user_read)) -> User:
+    if not user.is_superuser:
+        raise Forbidden("Superuser privileges required")
+    return user
@@ -2,10 +2,57 @@ from __future__ import annotations
 
 import time
 import uuid
+from starlette.datastructures import MutableHeaders
 from starlette.types import ASGIApp, Scope, Receive, Send, Message
 
-from app.core.context import set_request_id, set_request_start_time
+from app.core.context import (
+    RequestCost,
+    set_request_cost,
+    set_request_id,
+    set_request_start_time,
+)
 from app.core.logging import get_logger
+from app.core.metrics import registry
+
+
+REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template and status",
+    ("method", "route", "status"),
+)
+
+
+def route_template(scope: Scope) -> str:
+    """Matched route pattern (``/api/chat/rooms/{room_id}``), never the raw path.
+
+    Raw paths would create one series per id; unmatched requests share a label.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path_format", None)
+    if not isinstance(template, str):
+        return "unmatched"
+    # routes of an included router may only know their own part of the path;
+    # the static prefix is whatever precedes the rendered template
+    path = scope.get("path", "")
+    try:
+        rendered = template.format(**scope.get("path_params", {}))
+    except (KeyError, IndexError, ValueError):
+        return template
+    if rendered and path.endswith(rendered):
+        return path[: len(path) - len(rendered)] + template
+    return template
+
+
+def server_timing(cost: RequestCost, elapsed_ms: float) -> str:
+    """``Server-Timing`` value; ``total`` is the time until headers were sent."""
+    return ", ".join(
+        [
+            f'db;dur={cost.sql_ms:.1f};desc="{cost.sql_count} queries"',
+            f'redis;dur={cost.redis_ms:.1f};desc="{cost.redis_count} commands"',
+            f"serialize;dur={cost.serialize_ms:.1f}",
+            f"total;dur={elapsed_ms:.1f}",
+        ]
+    )
 
 
 class RequestContextMiddleware:
@@ -22,6 +69,8 @@ class RequestContextMiddleware:
         set_request_id(request_id)
         start = time.perf_counter()
         set_request_start_time(start)
+        cost = RequestCost()
+        set_request_cost(cost)
         logger = get_logger("app.request")
         status_code: int | None = None
 
@@ -29,13 +78,21 @@ class RequestContextMiddleware:
             nonlocal status_code
             if message.get("type") == "http.response.start":
                 status_code = int(message.get("status", 0))
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                MutableHeaders(scope=message).append(
+                    "Server-Timing", server_timing(cost, elapsed_ms)
+                )
             await send(message)
 
         try:
             await self.app(scope, receive, send_wrapper)
         finally:
-            duration_ms = int((time.perf_counter() - start) * 1000)
+            elapsed = time.perf_counter() - start
+            duration_ms = int(elapsed * 1000)
             method = scope.get("method", "-")
+            REQUEST_DURATION.observe(
+                elapsed, (method, route_template(scope), str(status_code or 500))
+            )
             path = scope.get("path", "-")
             client = (scope.get("client") or (None, None))[0] or "-"
             ua = headers.get("user-agent", "-")[:200]
@@ -52,7 +109,9 @@ class RequestContextMiddleware:
                     "duration_ms": duration_ms,
                     "client": client,
                     "user_agent": ua,
+                    **cost.as_fields(),
                 },
             )
             set_request_id(None)
             set_request_start_time(None)
+            set_request_cost(None)
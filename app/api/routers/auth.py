@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, Response
 from fastapi.responses import RedirectResponse
 
 from app.api.deps import DBSession, get_current_user
+from app.api.routing import TimedRoute
 from app.models.user import User
 from app.schemas.auth import LoginIn, TokenPair
 from app.schemas.common import AckOut
@@ -16,7 +17,7 @@ from app.services.auth_service import (
 )
 
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 
 @router.post("/register", response_model=AckOut)
@@ -1,10 +1,10 @@
 from __future__ import annotations
 
 
-from fastapi import APIRouter, Depends, Query, WebSocket, UploadFile, File
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, Header, Query, Request, Response, WebSocket, UploadFile, File
 
-from app.api.deps import DBSession, get_current_user
+from app.api.deps import DBSession, ReadDBSession, get_current_user, get_current_user_read
+from app.api.routing import BodyLimitRoute, max_body_size
 from app.models.user import User
 from app.schemas.common import AckOut
 from app.schemas.chat import (
@@ -18,7 +18,15 @@ from app.schemas.chat import (
     RoomCreateGroup,
     ParticipantsChangeIn,
     PeerOut,
+    AttachmentInitIn,
+    AttachmentInitOut,
     AttachmentOut,
+    DirectUploadIn,
+    DirectUploadOut,
+    UploadPartOut,
+    UploadSessionOut,
+    WSTicketIn,
+    WSTicketOut,
 )
 from app.services.chat_service import (
     create_direct_room_service,
@@ -32,31 +40,46 @@ from app.services.chat_service import (
     add_participants_service,
     remove_participants_service,
     list_all_users_service,
+    issue_ws_ticket_service,
 )
+from app.services.attachment_delivery import (
+    attachment_url,
+    download_grant,
+    serve_file,
+)
+from app.services.attachment_scanner import notify_attachment_scanner, status_after_upload
+from app.services.upload_sessions import (
+    complete_upload_service,
+    init_direct_upload_service,
+    init_upload_service,
+    upload_part_service,
+    upload_session_status_service,
+)
+from app.services.uploads import store_uploads
 from app.core.config import settings
-from app.core.exceptions import BadRequest, Forbidden, NotFound
+from app.core.exceptions import BadRequest, Conflict, Forbidden, NotFound
+from app.core.security import verify_download
+from app.db.session import release_connection
 from app.models.chat import ChatParticipant, Message
 from app.models.attachment import Attachment
-from sqlalchemy import and_, select
+from sqlalchemy import and_, insert, select
 from pathlib import Path
-from datetime import datetime, timezone
-import re, uuid, hashlib
 
 
-router = APIRouter()
+router = APIRouter(route_class=BodyLimitRoute)
 
 
 @router.get("/rooms", response_model=list[RoomSummaryOut])
 async def list_rooms(
-    db: DBSession, user: User = Depends(get_current_user)
+    db: ReadDBSession, user: User = Depends(get_current_user_read)
 ) -> list[RoomSummaryOut]:
     return await list_rooms_service(db, user.id)
 
 
 @router.get("/users", response_model=list[PeerOut])
 async def list_all_users(
-    db: DBSession,
-    user: User = Depends(get_current_user),
+    db: ReadDBSession,
+    user: User = Depends(get_current_user_read),
     query: str | None = Query(None, description="按姓名或邮箱模糊搜索"),
     limit: int = Query(200, ge=1, le=1000),
 ) -> list[PeerOut]:
@@ -100,8 +123,8 @@ async def remove_participants(
 @router.get("/rooms/{room_id}/messages", response_model=list[MessageOut])
 async def list_messages(
     room_id: int,
-    db: DBSession,
-    user: User = Depends(get_current_user),
+    db: ReadDBSession,
+    user: User = Depends(get_current_user_read),
     limit: int = Query(50, ge=1, le=200),
     cursor: int | None = Query(None, description="cursor for pagination"),
 ) -> list[MessageOut]:
@@ -135,6 +158,15 @@ async def unread_count(
 # -------- WebSocket (basic) --------
 
 
+@router.post("/ws-ticket", response_model=WSTicketOut)
+async def issue_ws_ticket(
+    db: DBSession,
+    user: User = Depends(get_current_user),
+    payload: WSTicketIn | None = None,
+) -> WSTicketOut:
+    return await issue_ws_ticket_service(db, payload or WSTicketIn(), user.id)
+
+
 @router.websocket("/ws")
 async def ws_endpoint(ws: WebSocket):
     await ws_handler(ws)
@@ -143,46 +175,8 @@ async def ws_endpoint(ws: WebSocket):
 # -------- Attachments --------
 
 
-def _sanitize_filename(name: str) -> str:
-    base = name.rsplit("/", 1)[-1].rsplit("\\", 1)[-1]
-    return re.sub(r"[^A-Za-z0-9._-]+", "_", base)[:255] or f"file_{uuid.uuid4().hex}"
-
-
-def _attachment_url(att_id: int) -> str:
-    base = settings.BACKEND_PUBLIC_BASE_URL or ""
-    return f"{base}/api/chat/attachments/{att_id}/download"
-
-
-async def _persist_upload(
-    file: UploadFile, root: Path
-) -> tuple[str, int, str, str | None]:
-    root.mkdir(parents=True, exist_ok=True)
-    ext_name = _sanitize_filename(file.filename or "file")
-    sub = datetime.now(timezone.utc).strftime("%Y%m/%d")
-    d = root / sub
-    d.mkdir(parents=True, exist_ok=True)
-    key = f"{sub}/{uuid.uuid4().hex}_{ext_name}"
-    abs_path = root / key
-    hasher = hashlib.sha256()
-    size = 0
-    with abs_path.open("wb") as out:
-        while True:
-            chunk = await file.read(1024 * 1024)
-            if not chunk:
-                break
-            out.write(chunk)
-            size += len(chunk)
-            hasher.update(chunk)
-    await file.close()
-    return (
-        key,
-        size,
-        file.content_type or "application/octet-stream",
-        hasher.hexdigest(),
-    )
-
-
 @router.post("/attachments", response_model=list[AttachmentOut])
+@max_body_size(settings.UPLOAD_MAX_REQUEST_BYTES)
 async def upload_attachments(
     db: DBSession,
     user: User = Depends(get_current_user),
@@ -190,69 +184,146 @@ async def upload_attachments(
 ) -> list[AttachmentOut]:
     if not files:
         raise BadRequest("no files")
-    root = Path(settings.UPLOAD_DIR)
-    items: list[AttachmentOut] = []
-    for f in files:
-        key, size, ctype, checksum = await _persist_upload(f, root)
-        row = Attachment(
-            uploader_id=user.id,
-            s3_key=key,
-            filename=_sanitize_filename(f.filename or "file"),
-            content_type=ctype,
-            size_bytes=size,
-            status="ready",
-            checksum=checksum,
-        )
-        db.add(row)
-        await db.flush()
-        items.append(
-            AttachmentOut(
-                id=int(row.id),
-                message_id=None,
-                filename=row.filename,
-                content_type=row.content_type,
-                size_bytes=row.size_bytes,
-                status=row.status,
-                created_at=row.created_at,
-                url=_attachment_url(int(row.id)),
-            )
+    stored = await store_uploads(db, files, Path(settings.UPLOAD_DIR))
+    # one multi-row INSERT ... RETURNING; the refcount trigger counts them in.
+    # If it fails, the blobs written above lose their rows with the rollback
+    # and the file GC owns them: reconcile_files registers them unreferenced
+    # and collect_blobs removes them. They are not deleted here, since a
+    # concurrent upload of the same content may already rely on the file.
+    rows = (
+        await db.scalars(
+            insert(Attachment).returning(Attachment, sort_by_parameter_order=True),
+            [
+                {
+                    "uploader_id": user.id,
+                    "s3_key": s.key,
+                    "filename": s.filename,
+                    "content_type": s.content_type,
+                    "size_bytes": s.size,
+                    "status": status_after_upload(),
+                    "checksum": s.checksum,
+                }
+                for s in stored
+            ],
         )
+    ).all()
     await db.commit()
-    return items
+    notify_attachment_scanner()
+    return [_attachment_out(row) for row in rows]
+
+
+def _attachment_out(row: Attachment) -> AttachmentOut:
+    return AttachmentOut(
+        id=int(row.id),
+        message_id=row.message_id,
+        filename=row.filename,
+        content_type=row.content_type,
+        size_bytes=row.size_bytes,
+        status=row.status,
+        created_at=row.created_at,
+        url=attachment_url(row),
+    )
+
+
+# Resumable uploads: init -> PUT every part (any order, in parallel, retried
+# as needed) -> complete. GET .../parts tells a resuming client what is there.
+
+
+@router.post("/attachments/init", response_model=AttachmentInitOut)
+async def init_attachment_upload(
+    payload: AttachmentInitIn, db: DBSession, user: User = Depends(get_current_user)
+) -> AttachmentInitOut:
+    return await init_upload_service(db, user.id, payload)
+
+
+@router.get("/attachments/{attachment_id}/parts", response_model=UploadSessionOut)
+async def get_attachment_upload(
+    attachment_id: int, db: DBSession, user: User = Depends(get_current_user)
+) -> UploadSessionOut:
+    return await upload_session_status_service(db, attachment_id, user.id)
+
+
+@router.put(
+    "/attachments/{attachment_id}/parts/{part_number}", response_model=UploadPartOut
+)
+@max_body_size(settings.UPLOAD_PART_BYTES)
+async def put_attachment_part(
+    attachment_id: int,
+    part_number: int,
+    request: Request,
+    db: DBSession,
+    user: User = Depends(get_current_user),
+    x_part_sha256: str | None = Header(None),
+) -> UploadPartOut:
+    """Raw part bytes as the body; ``X-Part-SHA256`` is the part's hex SHA-256."""
+    return await upload_part_service(
+        db, attachment_id, part_number, user.id, request.stream(), x_part_sha256
+    )
+
+
+# Direct uploads: init with the file's SHA-256 -> send the returned request
+# straight to storage -> complete. Known content needs no upload at all.
+
+
+@router.post("/attachments/direct", response_model=DirectUploadOut)
+async def init_direct_attachment_upload(
+    payload: DirectUploadIn, db: DBSession, user: User = Depends(get_current_user)
+) -> DirectUploadOut:
+    return await init_direct_upload_service(db, user.id, payload)
+
+
+@router.post("/attachments/{attachment_id}/complete", response_model=AttachmentOut)
+async def complete_attachment_upload(
+    attachment_id: int, db: DBSession, user: User = Depends(get_current_user)
+) -> AttachmentOut:
+    row = await complete_upload_service(db, attachment_id, user.id)
+    return _attachment_out(row)
 
 
 @router.get("/attachments/{attachment_id}/download")
 async def download_attachment(
-    attachment_id: int, db: DBSession, user: User = Depends(get_current_user)
-):
-    row = (
-        await db.execute(select(Attachment).where(Attachment.id == attachment_id))
-    ).scalar_one_or_none()
-    if row is None:
+    attachment_id: int,
+    request: Request,
+    db: DBSession,
+    user: User = Depends(get_current_user),
+) -> Response:
+    # one round trip: the attachment plus, for a message attachment, whether
+    # the user is in that message's room
+    found = (
+        await db.execute(
+            select(Attachment, ChatParticipant.user_id)
+            .outerjoin(Message, Message.id == Attachment.message_id)
+            .outerjoin(
+                ChatParticipant,
+                and_(
+                    ChatParticipant.room_id == Message.room_id,
+                    ChatParticipant.user_id == user.id,
+                ),
+            )
+            .where(Attachment.id == attachment_id)
+        )
+    ).first()
+    if found is None:
         raise NotFound("attachment not found")
+    row, member_id = found
+    await release_connection(db)
+    if row.status != "ready":
+        raise Conflict("attachment not ready", data={"status": row.status})
     if row.message_id is not None:
-        msg = (
-            await db.execute(select(Message).where(Message.id == row.message_id))
-        ).scalar_one_or_none()
-        if msg is None:
-            raise NotFound("message not found for attachment")
-        exists = (
-            await db.execute(
-                select(ChatParticipant).where(
-                    and_(
-                        ChatParticipant.room_id == msg.room_id,
-                        ChatParticipant.user_id == user.id,
-                    )
-                )
-            )
-        ).scalar_one_or_none()
-        if exists is None:
+        if member_id is None:
             raise Forbidden("forbidden")
-    else:
-        if int(row.uploader_id) != int(user.id):
-            raise Forbidden("forbidden")
-
-    path = Path(settings.UPLOAD_DIR) / row.s3_key
-    if not path.is_file():
-        raise NotFound("file missing")
-    return FileResponse(path, media_type=row.content_type, filename=row.filename)
+    elif int(row.uploader_id) != int(user.id):
+        raise Forbidden("forbidden")
+    return await serve_file(request, download_grant(row))
+
+
+@router.get("/attachments/{attachment_id}/file")
+async def download_signed_attachment(
+    attachment_id: int, request: Request, token: str = Query(..., max_length=4096)
+) -> Response:
+    """Signed link from ``AttachmentOut.url``: no session and no DB lookup."""
+    try:
+        grant = verify_download(token, attachment_id)
+    except Exception:
+        raise Forbidden("invalid or expired download link") from None
+    return await serve_file(request, grant)
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import PlainTextResponse
+
+from app.api.deps import DBSession, get_current_superuser
+from app.api.routing import TimedRoute
+from app.core import memory
+from app.core.config import settings
+from app.core.decorators import SERVICE_CALL_DURATION
+from app.core.exceptions import BadRequest, Conflict
+from app.core.metrics import Histogram, bucket_quantile
+from app.core.metrics_sync import metrics_view
+from app.core.profiler import ProfileMode, profiler_busy, run_profile
+from app.db.slow_query import slow_queries
+from app.schemas.common import AckOut
+from app.schemas.debug import (
+    BlobGCOut,
+    FileGCOut,
+    ModuleAllocationOut,
+    SlowQueryOut,
+    TimingOut,
+    TracemallocOut,
+    WSMemoryOut,
+)
+from app.services.blob_store import collect_blobs
+from app.services.file_gc import run_file_gc
+from app.services.ws_broker import get_broker
+
+
+router = APIRouter(
+    dependencies=[Depends(get_current_superuser)], route_class=TimedRoute
+)
+
+
+def _ms(value: float | None) -> float | None:
+    return None if value is None else round(value * 1000, 3)
+
+
+@router.get("/timings", response_model=list[TimingOut])
+async def timings() -> list[TimingOut]:
+    """Per service function latency, most total time first.
+
+    Quantiles are interpolated within histogram buckets, so they are estimates
+    bounded by the bucket edges.
+    """
+    source = await metrics_view()
+    hist = next(
+        (
+            m
+            for m in source.metrics()
+            if m.name == SERVICE_CALL_DURATION.name and isinstance(m, Histogram)
+        ),
+        None,
+    )
+    if hist is None:
+        return []
+    out: list[TimingOut] = []
+    for (function,), idx in hist.series():
+        count = hist.count(idx)
+        if not count:
+            continue
+        counts = hist.bucket_counts(idx)
+        total = hist.sum(idx)
+        out.append(
+            TimingOut(
+                function=function,
+                count=count,
+                total_ms=round(total * 1000, 3),
+                mean_ms=round(total * 1000 / count, 3),
+                p50_ms=_ms(bucket_quantile(0.50, hist.buckets, counts)),
+                p95_ms=_ms(bucket_quantile(0.95, hist.buckets, counts)),
+                p99_ms=_ms(bucket_quantile(0.99, hist.buckets, counts)),
+            )
+        )
+    out.sort(key=lambda t: t.total_ms, reverse=True)
+    return out
+
+
+@router.get("/slow-queries", response_model=list[SlowQueryOut])
+async def slow_query_report(
+    limit: int = Query(20, ge=1, le=500),
+) -> list[SlowQueryOut]:
+    """Slowest statement fingerprints of this worker, by total time."""
+    return [SlowQueryOut(**row) for row in slow_queries.top(limit)]
+
+
+@router.delete("/slow-queries", response_model=AckOut)
+async def reset_slow_queries() -> AckOut:
+    slow_queries.reset()
+    return AckOut(ok=True)
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: float = Query(10.0, ge=1, le=1000),
+    mode: ProfileMode = Query("wall"),
+    tasks: bool = Query(True),
+) -> PlainTextResponse:
+    """Sample this worker for ``seconds`` and return folded stacks.
+
+    Feed the body to ``flamegraph.pl`` or speedscope. ``cpu`` mode drops
+    samples of threads parked in select/wait; ``tasks`` adds the await chain of
+    every suspended asyncio task. Sample count, effective interval and the
+    measured overhead are returned in ``X-Profile-*`` headers.
+    """
+    if seconds > settings.PROFILER_MAX_SECONDS:
+        raise BadRequest(f"seconds must be <= {settings.PROFILER_MAX_SECONDS:g}")
+    if profiler_busy():
+        raise Conflict("A profile is already running on this worker")
+    result = await run_profile(seconds, interval_ms / 1000, mode, tasks)
+    return PlainTextResponse(
+        result.collapsed(),
+        headers={
+            "X-Profile-Samples": str(result.samples),
+            "X-Profile-Duration-Seconds": f"{result.duration:.3f}",
+            "X-Profile-Interval-Ms": f"{result.interval * 1000:g}",
+            "X-Profile-Overhead": f"{result.overhead:.4f}",
+        },
+    )
+
+
+@router.get("/ws-memory", response_model=WSMemoryOut)
+async def ws_memory(top: int = Query(10, ge=0, le=200)) -> WSMemoryOut:
+    """WebSocket connections held by this worker and what they cost."""
+    broker = await get_broker()
+    return WSMemoryOut(**broker.memory_stats(top))
+
+
+@router.post("/tracemalloc/start", response_model=TracemallocOut)
+async def tracemalloc_start(frames: int = Query(1, ge=1, le=25)) -> TracemallocOut:
+    """Start tracing allocations; costs memory and some CPU until stopped."""
+    memory.start(frames)
+    return TracemallocOut(**memory.status())
+
+
+@router.post("/tracemalloc/stop", response_model=TracemallocOut)
+async def tracemalloc_stop() -> TracemallocOut:
+    memory.stop()
+    return TracemallocOut(**memory.status())
+
+
+@router.post("/tracemalloc/snapshot", response_model=TracemallocOut)
+async def tracemalloc_snapshot(limit: int = Query(30, ge=1, le=500)) -> TracemallocOut:
+    """Take a snapshot (the new diff baseline) and return the largest modules."""
+    if not memory.status()["tracing"]:
+        raise BadRequest("tracemalloc is not running")
+    rows = await asyncio.to_thread(memory.take_snapshot, limit)
+    return TracemallocOut(
+        **memory.status(), modules=[ModuleAllocationOut(**r) for r in rows]
+    )
+
+
+@router.get("/tracemalloc/diff", response_model=TracemallocOut)
+async def tracemalloc_diff(limit: int = Query(30, ge=1, le=500)) -> TracemallocOut:
+    """Allocation growth per module since the last snapshot."""
+    state = memory.status()
+    if not state["tracing"] or not state["has_baseline"]:
+        raise BadRequest("take a snapshot first")
+    rows = await asyncio.to_thread(memory.diff_snapshot, limit)
+    return TracemallocOut(
+        **memory.status(), modules=[ModuleAllocationOut(**r) for r in rows]
+    )
+
+
+@router.post("/blobs/gc", response_model=BlobGCOut)
+async def blob_gc(
+    db: DBSession, grace_seconds: int | None = Query(None, ge=0)
+) -> BlobGCOut:
+    """Delete one batch of attachment blobs nothing references any more."""
+    deleted, reclaimed = await collect_blobs(db, grace_seconds)
+    return BlobGCOut(deleted=deleted, reclaimed_bytes=reclaimed)
+
+
+@router.post("/files/gc", response_model=FileGCOut)
+async def file_gc(db: DBSession, reconcile: bool = Query(False)) -> FileGCOut:
+    """One garbage collection pass over orphaned uploads, old resumes and blobs.
+
+    ``reconcile`` also walks storage for files no row accounts for; on a large
+    store that takes a while.
+    """
+    return await run_file_gc(db, reconcile=reconcile)
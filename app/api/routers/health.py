@@ -1,9 +1,12 @@
 from fastapi import APIRouter
-from app.core.metrics import snapshot
+from fastapi.responses import PlainTextResponse
+from app.api.routing import TimedRoute
+from app.core.metrics import render_prometheus, snapshot
+from app.core.metrics_sync import metrics_view
 from app.schemas.common import MetricsOut, AckOut
 
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 
 @router.get("/healthz", response_model=AckOut)
@@ -13,5 +16,13 @@ async def healthz() -> AckOut:
 
 @router.get("/metrics", response_model=MetricsOut)
 async def metrics() -> MetricsOut:
-    data = snapshot()
+    data = snapshot(await metrics_view())
     return MetricsOut(**data)
+
+
+@router.get("/metrics/prometheus", response_class=PlainTextResponse)
+async def metrics_prometheus() -> PlainTextResponse:
+    return PlainTextResponse(
+        render_prometheus(await metrics_view()),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -2,23 +2,37 @@ from __future__ import annotations
 
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, File, Query, UploadFile
-
-from app.api.deps import DBSession, get_current_user
+from fastapi import APIRouter, Depends, File, Path, Query, Request, Response, UploadFile
+
+from app.api.deps import (
+    DBSession,
+    ReadDBSession,
+    get_current_superuser_read,
+    get_current_user,
+    get_current_user_read,
+)
+from app.api.routing import BodyLimitRoute, max_body_size
+from app.core.config import settings
+from app.core.exceptions import NotFound
 from app.models.user import User
-from app.schemas.user import ResumeVersionOut, UserOut, UserUpdate
+from app.schemas.user import ResumeSearchHitOut, ResumeVersionOut, UserOut, UserUpdate
 from app.services.profile_service import (
     get_me_service,
     list_resume_versions_service,
+    search_resumes_service,
     search_by_skills_service,
     update_me_service,
     upload_avatar_service,
     upload_resume_service,
     list_users_service,
 )
+from app.services.attachment_delivery import serve_stored
 
 
-router = APIRouter()
+router = APIRouter(route_class=BodyLimitRoute)
+
+# renditions are addressed by content version, so they never change
+AVATAR_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
 
 @router.get("/me", response_model=UserOut)
@@ -42,13 +56,57 @@ async def update_me(
 
 
 @router.post("/me/avatar", response_model=UserOut)
+# room for the multipart framing around the image
+@max_body_size(settings.AVATAR_MAX_BYTES + 64 * 1024)
 async def upload_avatar(
     db: DBSession, user: User = Depends(get_current_user), file: UploadFile = File(...)
 ) -> UserOut:
     return await upload_avatar_service(db, user.id, file)
 
 
+@router.get("/avatars/{user_id}/{version}/{size}.webp")
+async def get_avatar(
+    user_id: int,
+    size: int,
+    request: Request,
+    version: str = Path(..., pattern=r"^[0-9a-f]{16}$"),
+) -> Response:
+    """An avatar rendition from ``avatar_urls``; public, like an <img> src."""
+    if size not in settings.AVATAR_SIZES:
+        raise NotFound("avatar size not available")
+    return await serve_stored(
+        request,
+        f"avatars/{user_id}/{version}/{size}.webp",
+        filename=f"avatar-{size}.webp",
+        content_type="image/webp",
+        etag=f'"{version}-{size}"',
+        modified=None,
+        cache_control=AVATAR_CACHE_CONTROL,
+        disposition="inline",
+    )
+
+
+@router.get("/avatars/{name}")
+async def get_legacy_avatar(
+    request: Request,
+    name: str = Path(..., pattern=r"^\d+_\d{14}\.(jpg|png)$"),
+) -> Response:
+    """An original avatar stored before renditions existed, for ``avatar_urls``."""
+    return await serve_stored(
+        request,
+        f"avatars/{name}",
+        filename=name,
+        content_type="image/jpeg" if name.endswith(".jpg") else "image/png",
+        # the name carries the upload time, so it never changes either
+        etag=f'"{name}"',
+        modified=None,
+        cache_control=AVATAR_CACHE_CONTROL,
+        disposition="inline",
+    )
+
+
 @router.post("/me/resume", response_model=ResumeVersionOut)
+@max_body_size(settings.RESUME_MAX_BYTES + 64 * 1024)
 async def upload_resume(
     db: DBSession, user: User = Depends(get_current_user), file: UploadFile = File(...)
 ) -> ResumeVersionOut:
@@ -64,7 +122,7 @@ async def list_resume_versions(
 
 @router.get("/search", response_model=list[UserOut])
 async def search_users(
-    db: DBSession,
+    db: ReadDBSession,
     skills: list[str] = Query(
         ..., description="技能标签，如 ?skills=python&skills=react"
     ),
@@ -73,14 +131,27 @@ async def search_users(
     return await search_by_skills_service(db, skills, limit)
 
 
+@router.get("/resumes/search", response_model=list[ResumeSearchHitOut])
+async def search_resumes(
+    db: ReadDBSession,
+    q: str = Query(
+        ..., min_length=1, max_length=200, description="简历全文检索，支持 \"短语\"、OR、-排除"
+    ),
+    limit: int = Query(20, ge=1, le=100),
+    # resumes carry contact details: staff only
+    user: User = Depends(get_current_superuser_read),
+) -> list[ResumeSearchHitOut]:
+    return await search_resumes_service(db, q, limit)
+
+
 @router.get("/users", response_model=list[UserOut])
 async def list_users(
-    db: DBSession,
+    db: ReadDBSession,
     q: str | None = Query(None, description="按姓名或邮箱筛选"),
     limit: int = Query(200, ge=1, le=500),
     cursor: int | None = Query(
         None, description="基于id的游标分页，返回小于该id的数据"
     ),
-    user: User = Depends(get_current_user),
+    user: User = Depends(get_current_user_read),
 ) -> list[UserOut]:
     return await list_users_service(db, q=q, limit=limit, cursor=cursor)
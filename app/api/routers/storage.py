@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, Query, Request, Response
+
+from app.api.routing import BodyLimitRoute, max_body_size
+from app.core.config import settings
+from app.core.exceptions import Forbidden
+from app.core.security import verify_upload
+from app.services.uploads import receive_object
+
+
+router = APIRouter(route_class=BodyLimitRoute)
+
+
+@router.put("/objects", status_code=204)
+@max_body_size(settings.UPLOAD_RESUMABLE_MAX_BYTES)
+async def put_object(
+    request: Request, token: str = Query(..., max_length=4096)
+) -> Response:
+    """Presigned-PUT target of the local storage backend.
+
+    Like an S3 presigned URL the token alone authorizes the write; the body
+    is stored only if its size and SHA-256 match what was signed.
+    """
+    try:
+        grant = verify_upload(token)
+    except Exception:
+        raise Forbidden("invalid or expired upload link") from None
+    await receive_object(grant, request.stream())
+    return Response(status_code=204)
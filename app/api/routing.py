@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import functools
+import inspect
+import time
+from collections.abc import Callable
+from contextvars import ContextVar
+from typing import Any, TypeVar
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from starlette.types import Message
+
+from app.core.context import get_request_cost
+from app.core.exceptions import PayloadTooLarge
+
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# set by TimedRoute for the endpoint to record when it returned; a holder
+# rather than a value, since sync endpoints run in a copy of the context
+_returned_at: ContextVar[list[float] | None] = ContextVar("endpoint_returned_at", default=None)
+
+
+def _stamp() -> None:
+    holder = _returned_at.get()
+    if holder is not None:
+        holder.append(time.perf_counter())
+
+
+def _stamping(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+    if inspect.iscoroutinefunction(endpoint):
+
+        @functools.wraps(endpoint)
+        async def async_endpoint(*args: Any, **kwargs: Any) -> Any:
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                _stamp()
+
+        return async_endpoint
+
+    @functools.wraps(endpoint)
+    def sync_endpoint(*args: Any, **kwargs: Any) -> Any:
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            _stamp()
+
+    return sync_endpoint
+
+
+class TimedRoute(APIRoute):
+    """Charges the time from an endpoint's return to its response to ``serialize_ms``.
+
+    That covers ``response_model`` validation and encoding as well as
+    rendering the body, which FastAPI may do without a response class.
+    Dependency teardown runs after the handler returns and is not included.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any) -> None:
+        super().__init__(path, _stamping(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable[[Request], Any]:
+        handler = super().get_route_handler()
+
+        async def timed_handler(request: Request) -> Response:
+            returned: list[float] = []
+            token = _returned_at.set(returned)
+            try:
+                response = await handler(request)
+            finally:
+                _returned_at.reset(token)
+            cost = get_request_cost()
+            if returned and cost is not None:
+                cost.serialize_ms += (time.perf_counter() - returned[-1]) * 1000
+            return response
+
+        return timed_handler
+
+
+def max_body_size(limit: int) -> Callable[[F], F]:
+    """Cap the request body of an endpoint served by a ``BodyLimitRoute``."""
+
+    def decorator(func: F) -> F:
+        setattr(func, "__max_body_size__", limit)
+        return func
+
+    return decorator
+
+
+def _too_large(limit: int) -> PayloadTooLarge:
+    return PayloadTooLarge(
+        f"request body exceeds {limit} bytes", data={"max_bytes": limit}
+    )
+
+
+class BodyLimitRoute(TimedRoute):
+    """Enforces ``@max_body_size`` before FastAPI parses the body.
+
+    A declared ``Content-Length`` over the limit is refused before a single
+    byte is read, so an oversized multipart upload is never spooled to disk.
+    Chunked bodies without a length are counted as they arrive and cut off
+    at the limit.
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Any]:
+        handler = super().get_route_handler()
+        limit: int | None = getattr(self.endpoint, "__max_body_size__", None)
+        if limit is None:
+            return handler
+
+        async def limited_handler(request: Request) -> Response:
+            declared = request.headers.get("content-length")
+            if declared is not None and declared.isdigit() and int(declared) > limit:
+                raise _too_large(limit)
+
+            received = 0
+            exceeded = False
+
+            async def receive() -> Message:
+                nonlocal received, exceeded
+                message = await request.receive()
+                if message["type"] == "http.request":
+                    received += len(message.get("body", b""))
+                    if received > limit:
+                        exceeded = True
+                        raise _too_large(limit)
+                return message
+
+            try:
+                return await handler(Request(request.scope, receive))
+            except Exception:
+                # FastAPI reports any error raised while parsing a form as a
+                # generic 400; surface the real reason instead
+                if exceeded:
+                    raise _too_large(limit) from None
+                raise
+
+        return limited_handler
@@ -21,9 +21,42 @@ class Settings(BaseSettings):
     VERIFY_TOKEN_EXPIRE_MINUTES: int = 60 * 24
 
     DATABASE_URL: str
+    # Optional streaming replicas for read-only request paths
+    DATABASE_REPLICA_URLS: list[str] = []
+    DB_REPLICA_MAX_LAG_SECONDS: float = 5.0
+    DB_REPLICA_CHECK_INTERVAL_SECONDS: float = 5.0
+    DB_REPLICA_PROBE_TIMEOUT_SECONDS: float = 2.0
+    DB_READ_YOUR_WRITES_SECONDS: float = 5.0
+
+    # Connection pool (applies to the primary and every replica engine)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: float = 30.0
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    # always: ping on every checkout; idle: only connections idle longer than
+    # DB_POOL_PRE_PING_IDLE_SECONDS; never: rely on recycle/error handling
+    DB_POOL_PRE_PING: Literal["always", "idle", "never"] = "idle"
+    DB_POOL_PRE_PING_IDLE_SECONDS: float = 30.0
+    # asyncpg prepared statement cache; set to 0 behind pgbouncer transaction pooling
+    DB_STATEMENT_CACHE_SIZE: int = 100
+
+    # Slow-query log (0 disables); a sampled share of slow SELECTs is EXPLAINed
+    DB_SLOW_QUERY_MS: float = 200.0
+    DB_SLOW_QUERY_EXPLAIN_SAMPLE_RATE: float = 0.1
+    DB_SLOW_QUERY_EXPLAIN_CONCURRENCY: int = 2
+    DB_SLOW_QUERY_TOP_N: int = 100
 
     # Redis
     REDIS_URL: str
+    REDIS_MAX_CONNECTIONS: int = 50
+    # how long a caller may wait for a free pooled connection
+    REDIS_POOL_TIMEOUT_SECONDS: float = 0.2
+    REDIS_CONNECT_TIMEOUT_SECONDS: float = 0.5
+    REDIS_SOCKET_TIMEOUT_SECONDS: float = 0.5
+    REDIS_OP_TIMEOUT_SECONDS: float = 0.5
+    REDIS_HEALTH_CHECK_INTERVAL_SECONDS: int = 30
+    REDIS_BREAKER_FAILURE_THRESHOLD: int = 5
+    REDIS_BREAKER_RESET_SECONDS: float = 5.0
 
     BACKEND_CORS_ORIGINS: list[str] = []
 
@@ -38,17 +71,143 @@ class Settings(BaseSettings):
     SMTP_PASSWORD: str | None = None
     SMTP_STARTTLS: bool = True
     MAIL_FROM: str | None = None
+    SMTP_TIMEOUT_SECONDS: float = 10.0
+    SMTP_POOL_SIZE: int = 2
+    SMTP_POOL_IDLE_SECONDS: float = 60.0
+
+    # Mail outbox worker; when disabled, mail is sent inline by the request
+    MAIL_OUTBOX_ENABLED: bool = True
+    MAIL_OUTBOX_BATCH_SIZE: int = 20
+    MAIL_OUTBOX_POLL_SECONDS: float = 5.0
+    MAIL_OUTBOX_MAX_ATTEMPTS: int = 8
+    MAIL_OUTBOX_BACKOFF_BASE_SECONDS: float = 5.0
+    MAIL_OUTBOX_BACKOFF_MAX_SECONDS: float = 3600.0
+    MAIL_OUTBOX_LEASE_SECONDS: float = 120.0
+
+    # Metrics: with several uvicorn workers, flush each process's metrics to
+    # Redis and serve the merged view from /api/metrics
+    METRICS_MULTIPROCESS: bool = False
+    METRICS_FLUSH_SECONDS: float = 5.0
+    METRICS_WORKER_STALE_SECONDS: float = 30.0
+
+    # Event-loop lag monitor: heartbeat interval and the overdue time after
+    # which the loop counts as blocked and the blocking stack is logged
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL_SECONDS: float = 0.25
+    LOOP_BLOCK_THRESHOLD_SECONDS: float = 0.1
+
+    # On-demand sampling profiler (/api/debug/profile)
+    PROFILER_MAX_SECONDS: float = 60.0
+    # sampling may use at most this share of wall time; the interval stretches
+    PROFILER_MAX_OVERHEAD: float = 0.02
 
     # Logging
     LOG_LEVEL: Literal["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"] = "INFO"
     LOG_FORMAT: Literal["json", "console"] = "json"
     LOG_JSON_PRETTY: bool = False
-
+    # format and write records on a background thread instead of the event loop
+    LOG_ASYNC: bool = True
+    # records beyond this many waiting are dropped (counted in log_records_dropped)
+    LOG_QUEUE_SIZE: int = 10000
+    # keep probability per logger prefix for sub-WARNING records,
+    # e.g. {"app.request": 0.1, "app.ws.fanout": 0.01}
+    LOG_SAMPLE_RATES: dict[str, float] = {}
+    # fraction of @record_timing calls that also write a log line
+    TIMING_LOG_SAMPLE_RATE: float = 0.0
+
+    # Where stored files live. "local" keeps them under UPLOAD_DIR; "s3" puts
+    # them in S3_BUCKET (needs the "s3" extra) and UPLOAD_DIR only stages.
+    STORAGE_BACKEND: Literal["local", "s3"] = "local"
     UPLOAD_DIR: str = "uploads"
-
-    @field_validator("BACKEND_CORS_ORIGINS", mode="before")
+    S3_BUCKET: str = ""
+    S3_REGION: str = "us-east-1"
+    # unset for AWS; e.g. http://minio:9000 for an S3-compatible server
+    S3_ENDPOINT_URL: str | None = None
+    # host clients reach presigned URLs on, when it differs from S3_ENDPOINT_URL
+    S3_PUBLIC_ENDPOINT_URL: str | None = None
+    S3_ACCESS_KEY_ID: str | None = None
+    S3_SECRET_ACCESS_KEY: str | None = None
+    S3_ADDRESSING_STYLE: Literal["auto", "path", "virtual"] = "auto"
+    # lifetime of presigned direct-upload URLs
+    STORAGE_UPLOAD_URL_TTL_SECONDS: int = 3600
+    # whole multipart body; checked against Content-Length before parsing
+    UPLOAD_MAX_REQUEST_BYTES: int = 256 * 1024 * 1024
+    # files of one request written at the same time
+    UPLOAD_CONCURRENCY: int = 4
+    UPLOAD_CHUNK_BYTES: int = 1024 * 1024
+    # threads shared by all requests for hashing and writing upload chunks
+    UPLOAD_IO_THREADS: int = 8
+    # How attachment bytes leave the app: "stream" sends them from Python,
+    # "accel" answers with X-Accel-Redirect to ATTACHMENT_ACCEL_PREFIX + key
+    # and nginx serves the file from an internal location.
+    ATTACHMENT_DELIVERY: Literal["stream", "accel"] = "stream"
+    ATTACHMENT_ACCEL_PREFIX: str = "/_uploads/"
+    # Attachment URLs handed to authorized clients are HMAC-signed links that
+    # need no session or DB lookup to fetch, valid for this long.
+    ATTACHMENT_SIGNED_URLS: bool = False
+    ATTACHMENT_URL_TTL_SECONDS: int = 900
+    # resumable uploads: init -> PUT parts -> complete
+    UPLOAD_PART_BYTES: int = 8 * 1024 * 1024
+    UPLOAD_RESUMABLE_MAX_BYTES: int = 5 * 1024 * 1024 * 1024
+    UPLOAD_SESSION_TTL_SECONDS: int = 24 * 3600
+    # how often each worker discards expired upload sessions
+    UPLOAD_SESSION_REAP_SECONDS: float = 600.0
+    # content-addressed blobs with no references are deleted after this long
+    BLOB_GC_GRACE_SECONDS: int = 3600
+    BLOB_GC_BATCH_SIZE: int = 500
+    # File garbage collection: attachments never linked to a message, resume
+    # versions beyond RESUME_KEEP_VERSIONS, replaced avatars and files no row
+    # knows about. Each pass works in FILE_GC_BATCH_SIZE row batches, at most
+    # FILE_GC_MAX_BATCHES per kind; storage is walked once per reconcile
+    # interval by whichever worker takes the lease.
+    FILE_GC_ENABLED: bool = True
+    FILE_GC_INTERVAL_SECONDS: float = 900.0
+    FILE_GC_ORPHAN_GRACE_SECONDS: int = 24 * 3600
+    FILE_GC_BATCH_SIZE: int = 500
+    FILE_GC_MAX_BATCHES: int = 20
+    FILE_GC_RECONCILE_INTERVAL_SECONDS: int = 24 * 3600
+    # processes for CPU-bound work (images, resume text, attachment scans)
+    CPU_WORKERS: int = 2
+    # a worker is replaced after this many tasks (0: never)
+    CPU_WORKER_MAX_TASKS: int = 200
+    # Avatars are re-encoded into these square sizes (px); changing the list
+    # only affects avatars uploaded afterwards.
+    AVATAR_MAX_BYTES: int = 2 * 1024 * 1024
+    AVATAR_SIZES: list[int] = [48, 96, 256]
+    # the size behind the plain avatar_url
+    AVATAR_DEFAULT_SIZE: int = 96
+    AVATAR_WEBP_QUALITY: int = 80
+    # larger images are refused before decoding
+    AVATAR_MAX_PIXELS: int = 40_000_000
+    RESUME_MAX_BYTES: int = 10 * 1024 * 1024
+    # earlier versions kept besides the current resume
+    RESUME_KEEP_VERSIONS: int = 5
+    # Resume text is extracted by a background worker on every app process,
+    # claiming batches with SKIP LOCKED; search covers indexed resumes only.
+    RESUME_INDEX_ENABLED: bool = True
+    RESUME_INDEX_BATCH_SIZE: int = 8
+    RESUME_INDEX_POLL_SECONDS: float = 10.0
+    RESUME_INDEX_LEASE_SECONDS: int = 300
+    RESUME_INDEX_MAX_ATTEMPTS: int = 3
+    # extracted text beyond this is not indexed
+    RESUME_TEXT_MAX_CHARS: int = 200_000
+    # Stored attachments are scanned by a background worker on every app
+    # process before they are served. "eicar" is a local stand-in that only
+    # detects the EICAR test file; "none" makes uploads ready at once.
+    ATTACHMENT_SCANNER: Literal["none", "eicar"] = "eicar"
+    ATTACHMENT_SCAN_BATCH_SIZE: int = 16
+    # files fetched and scanned at the same time by one worker
+    ATTACHMENT_SCAN_CONCURRENCY: int = 4
+    ATTACHMENT_SCAN_POLL_SECONDS: float = 5.0
+    ATTACHMENT_SCAN_LEASE_SECONDS: int = 600
+    ATTACHMENT_SCAN_MAX_ATTEMPTS: int = 5
+
+    # WebSocket connect tickets
+    WS_TICKET_TTL_SECONDS: int = 30
+
+    @field_validator("BACKEND_CORS_ORIGINS", "DATABASE_REPLICA_URLS", mode="before")
     @classmethod
-    def parse_cors_origins(cls, v: object) -> list[str]:
+    def parse_str_list(cls, v: object) -> list[str]:
         if v is None or v == "":
             return []
         if isinstance(v, str):
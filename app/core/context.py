@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import asyncio
+import weakref
 from contextvars import ContextVar
 
 
@@ -14,8 +16,34 @@ def get_request_id() -> str | None:
     return request_id_ctx_var.get()
 
 
+# task -> request id, for observers on other threads (the loop monitor) that
+# cannot read a task's contextvars before Python 3.12's Task.get_context()
+_task_request_ids: weakref.WeakKeyDictionary[asyncio.Task[object], str] = (
+    weakref.WeakKeyDictionary()
+)
+
+
 def set_request_id(value: str | None) -> None:
     request_id_ctx_var.set(value)
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        return
+    if task is None:
+        return
+    if value is None:
+        _task_request_ids.pop(task, None)
+    else:
+        _task_request_ids[task] = value
+
+
+def request_id_for_task(task: asyncio.Task[object] | None) -> str | None:
+    if task is None:
+        return None
+    get_context = getattr(task, "get_context", None)
+    if get_context is not None:
+        return get_context().get(request_id_ctx_var)
+    return _task_request_ids.get(task)
 
 
 def set_request_start_time(value: float | None) -> None:
@@ -24,3 +52,54 @@ def set_request_start_time(value: float | None) -> None:
 
 def get_request_start_time() -> float | None:
     return request_start_time_ctx_var.get()
+
+
+class RequestCost:
+    """Resource usage accumulated while serving one request."""
+
+    __slots__ = (
+        "sql_count",
+        "sql_ms",
+        "redis_count",
+        "redis_ms",
+        "serialize_ms",
+    )
+
+    def __init__(self) -> None:
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.redis_count = 0
+        self.redis_ms = 0.0
+        self.serialize_ms = 0.0
+
+    def add_sql(self, elapsed_ms: float) -> None:
+        self.sql_count += 1
+        self.sql_ms += elapsed_ms
+
+    def add_redis(self, elapsed_ms: float) -> None:
+        self.redis_count += 1
+        self.redis_ms += elapsed_ms
+
+    def as_fields(self) -> dict[str, int | float]:
+        return {
+            "sql_count": self.sql_count,
+            "sql_ms": round(self.sql_ms, 2),
+            "redis_count": self.redis_count,
+            "redis_ms": round(self.redis_ms, 2),
+            "serialize_ms": round(self.serialize_ms, 2),
+        }
+
+
+# the object itself is shared, so work done in tasks spawned with a copy of
+# the request context is still accounted to the request
+request_cost_ctx_var: ContextVar[RequestCost | None] = ContextVar(
+    "request_cost", default=None
+)
+
+
+def get_request_cost() -> RequestCost | None:
+    return request_cost_ctx_var.get()
+
+
+def set_request_cost(value: RequestCost | None) -> None:
+    request_cost_ctx_var.set(value)
@@ -2,12 +2,15 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import random
 import time
 from functools import wraps
 from typing import Any, TypeVar, cast
 from collections.abc import Awaitable, Callable
 
+from app.core.config import settings
 from app.core.context import get_request_id
+from app.core.metrics import registry
 
 
 F = TypeVar("F", bound=Callable[..., Any])
@@ -46,8 +49,39 @@ def log_exceptions(logger: logging.Logger | None = None) -> Callable[[F], F]:
     return decorator
 
 
-def record_timing(metric_name: str) -> Callable[[F], F]:
+SERVICE_CALL_DURATION = registry.histogram(
+    "service_call_duration_seconds",
+    "Service function latency",
+    ("function",),
+    buckets=(
+        0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+    ),
+)
+
+
+def record_timing(
+    metric_name: str, log_sample_rate: float | None = None
+) -> Callable[[F], F]:
+    """Observe each call's latency in ``service_call_duration_seconds``.
+
+    The histogram update is cheap enough for every call; the per-call log line
+    is only written for a ``log_sample_rate`` fraction of calls (default
+    ``TIMING_LOG_SAMPLE_RATE``).
+    """
     logger = logging.getLogger("timing")
+    labels = (metric_name,)
+    rate = settings.TIMING_LOG_SAMPLE_RATE if log_sample_rate is None else log_sample_rate
+
+    def _record(start: float) -> None:
+        elapsed = time.perf_counter() - start
+        SERVICE_CALL_DURATION.observe(elapsed, labels)
+        if rate > 0 and random.random() < rate:
+            logger.info(
+                "metric=%s duration_ms=%s rid=%s",
+                metric_name,
+                int(elapsed * 1000),
+                get_request_id(),
+            )
 
     def decorator(func: F) -> F:
         if asyncio.iscoroutinefunction(func):
@@ -60,11 +94,7 @@ def record_timing(metric_name: str) -> Callable[[F], F]:
                         *args, **kwargs
                     )
                 finally:
-                    duration_ms = int((time.perf_counter() - start) * 1000)
-                    rid = get_request_id()
-                    logger.info(
-                        "metric=%s duration_ms=%s rid=%s", metric_name, duration_ms, rid
-                    )
+                    _record(start)
 
             return cast(F, async_wrapper)
 
@@ -74,11 +104,7 @@ def record_timing(metric_name: str) -> Callable[[F], F]:
             try:
                 return func(*args, **kwargs)
             finally:
-                duration_ms = int((time.perf_counter() - start) * 1000)
-                rid = get_request_id()
-                logger.info(
-                    "metric=%s duration_ms=%s rid=%s", metric_name, duration_ms, rid
-                )
+                _record(start)
 
         return cast(F, sync_wrapper)
 
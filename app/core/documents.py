@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import io
+import re
+import zipfile
+from xml.etree import ElementTree
+
+
+# Runs in the CPU process pool, like app.core.images: no app imports here.
+
+_PDF_TYPES = {"application/pdf", "application/x-pdf"}
+_DOCX_TYPES = {"application/vnd.openxmlformats-officedocument.wordprocessingml.document"}
+_TEXT_TYPES = {"text/plain", "text/markdown"}
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+# a document.xml larger than this is not a resume, it is a zip bomb
+_DOCX_XML_MAX_BYTES = 64 * 1024 * 1024
+_SPACES = re.compile(r"[ \t\r\f\v]+")
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+
+
+def document_kind(content_type: str, filename: str) -> str | None:
+    """"pdf", "docx" or "text" if text can be extracted from such a file."""
+    ctype = content_type.split(";", 1)[0].strip().lower()
+    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    if ctype in _PDF_TYPES or ext == "pdf":
+        return "pdf"
+    if ctype in _DOCX_TYPES or ext == "docx":
+        return "docx"
+    if ctype in _TEXT_TYPES or ext in ("txt", "md"):
+        return "text"
+    return None
+
+
+def _pdf_text(data: bytes, max_chars: int) -> str:
+    from pypdf import PdfReader
+
+    reader = PdfReader(io.BytesIO(data))
+    if reader.is_encrypted:
+        # resumes are sometimes "protected" with an empty user password
+        reader.decrypt("")
+    parts: list[str] = []
+    total = 0
+    for page in reader.pages:
+        text = page.extract_text() or ""
+        parts.append(text)
+        total += len(text)
+        if total >= max_chars:
+            break
+    return "\n".join(parts)
+
+
+def _docx_text(data: bytes, max_chars: int) -> str:
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        info = zf.getinfo("word/document.xml")
+        if info.file_size > _DOCX_XML_MAX_BYTES:
+            raise ValueError("document.xml too large")
+        parts: list[str] = []
+        total = 0
+        with zf.open(info) as xml:
+            for _, el in ElementTree.iterparse(xml, events=("end",)):
+                if el.tag == f"{_W}t" and el.text:
+                    parts.append(el.text)
+                    total += len(el.text)
+                elif el.tag == f"{_W}tab":
+                    parts.append("\t")
+                elif el.tag in (f"{_W}br", f"{_W}p"):
+                    parts.append("\n")
+                    # paragraphs are done with: keep memory flat on big files
+                    if el.tag == f"{_W}p":
+                        el.clear()
+                if total >= max_chars:
+                    break
+    return "".join(parts)
+
+
+def extract_text(
+    data: bytes, content_type: str, filename: str, max_chars: int
+) -> str | None:
+    """Plain text of a PDF, DOCX or text file, at most ``max_chars`` long.
+
+    Returns None for a type text is not extracted from; raises ValueError for
+    a file of a supported type that cannot be read.
+    """
+    kind = document_kind(content_type, filename)
+    if kind is None:
+        return None
+    try:
+        if kind == "pdf":
+            text = _pdf_text(data, max_chars)
+        elif kind == "docx":
+            text = _docx_text(data, max_chars)
+        else:
+            text = data[: max_chars * 4].decode("utf-8", errors="replace")
+    except ValueError:
+        raise
+    except Exception as exc:  # noqa: BLE001 - parsers raise all sorts on bad input
+        raise ValueError(f"{kind} could not be read: {type(exc).__name__}") from exc
+    # PostgreSQL text cannot hold NUL
+    text = _SPACES.sub(" ", text.replace("\x00", ""))
+    return _BLANK_LINES.sub("\n\n", text).strip()[:max_chars]
@@ -76,6 +76,17 @@ class Conflict(AppException):
         super().__init__(message, code=code, status_code=409, data=data)
 
 
+class PayloadTooLarge(AppException):
+    def __init__(
+        self,
+        message: str = "Payload Too Large",
+        *,
+        code: int = 41301,
+        data: Any | None = None,
+    ) -> None:
+        super().__init__(message, code=code, status_code=413, data=data)
+
+
 class ServiceUnavailable(AppException):
     def __init__(
         self,
@@ -87,6 +98,17 @@ class ServiceUnavailable(AppException):
         super().__init__(message, code=code, status_code=503, data=data)
 
 
+class RedisUnavailable(ServiceUnavailable):
+    def __init__(
+        self,
+        message: str = "Cache unavailable",
+        *,
+        code: int = 50302,
+        data: Any | None = None,
+    ) -> None:
+        super().__init__(message, code=code, data=data)
+
+
 class RegistrationError(AppException):
     def __init__(
         self,
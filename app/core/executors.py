@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import multiprocessing
+from collections.abc import AsyncIterator, Callable, Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, TypeVar
+
+from app.core.config import settings
+
+
+T = TypeVar("T")
+
+
+_io_executor: ThreadPoolExecutor | None = None
+_cpu_executor: ProcessPoolExecutor | None = None
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    """Threads for blocking file I/O and hashing.
+
+    Kept apart from the default executor so a burst of large uploads cannot
+    starve ``asyncio.to_thread`` callers (DNS, log handlers, profiling).
+    """
+    global _io_executor
+    if _io_executor is None:
+        _io_executor = ThreadPoolExecutor(
+            max_workers=max(1, settings.UPLOAD_IO_THREADS),
+            thread_name_prefix="file-io",
+        )
+    return _io_executor
+
+
+def get_cpu_executor() -> ProcessPoolExecutor:
+    """Worker processes for CPU-bound work such as image decoding.
+
+    Threads would hold the GIL for most of it; separate processes keep the
+    event loop and the I/O pool responsive. Workers are spawned rather than
+    forked from a process running an event loop and pool threads, and only
+    import the module of the function they are handed.
+    """
+    global _cpu_executor
+    if _cpu_executor is None:
+        _cpu_executor = ProcessPoolExecutor(
+            max_workers=max(1, settings.CPU_WORKERS),
+            mp_context=multiprocessing.get_context("spawn"),
+            # bounds the memory a worker keeps after decoding a huge image
+            max_tasks_per_child=settings.CPU_WORKER_MAX_TASKS or None,
+        )
+    return _cpu_executor
+
+
+def shutdown_executors() -> None:
+    global _io_executor, _cpu_executor
+    if _io_executor is not None:
+        _io_executor.shutdown(wait=True)
+        _io_executor = None
+    if _cpu_executor is not None:
+        _cpu_executor.shutdown(wait=True, cancel_futures=True)
+        _cpu_executor = None
+
+
+async def run_io(func: Callable[..., T], *args: Any) -> T:
+    """Run blocking file work on the I/O pool."""
+    return await asyncio.get_running_loop().run_in_executor(
+        get_io_executor(), func, *args
+    )
+
+
+async def run_cpu(func: Callable[..., T], *args: Any) -> T:
+    """Run CPU-bound work in the process pool; ``func`` and args must pickle."""
+    return await asyncio.get_running_loop().run_in_executor(
+        get_cpu_executor(), func, *args
+    )
+
+
+async def iter_io(items: Iterator[T], batch_size: int = 1000) -> AsyncIterator[list[T]]:
+    """Pull a blocking iterator (e.g. a directory walk) on the I/O pool in batches."""
+    while batch := await run_io(lambda: list(itertools.islice(items, batch_size))):
+        yield batch
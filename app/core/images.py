@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import io
+from collections.abc import Sequence
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+# Functions here run in the CPU process pool. The module has no app imports,
+# so a spawned worker only has to load Pillow.
+
+
+def render_avatar(
+    data: bytes, sizes: Sequence[int], quality: int, max_pixels: int
+) -> dict[int, bytes]:
+    """Center-crop ``data`` to a square and encode it as WebP at each size.
+
+    Raises ValueError for anything that is not a decodable image within
+    ``max_pixels``.
+    """
+    try:
+        img = Image.open(io.BytesIO(data))
+    except (UnidentifiedImageError, OSError) as exc:
+        raise ValueError("not an image") from exc
+    except Image.DecompressionBombError as exc:
+        # Pillow's own bound, hit by tiny files that declare huge dimensions
+        raise ValueError("image dimensions too large") from exc
+    if img.width * img.height > max_pixels:
+        raise ValueError("image dimensions too large")
+    largest = max(sizes)
+    # JPEG can decode straight at 1/2, 1/4 or 1/8 scale: far less work for
+    # a large photo that ends up a few hundred pixels wide
+    img.draft("RGB", (largest, largest))
+    try:
+        img = ImageOps.exif_transpose(img)
+        has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+        img = img.convert("RGBA" if has_alpha else "RGB")
+    except (OSError, SyntaxError, Image.DecompressionBombError) as exc:
+        raise ValueError("image could not be decoded") from exc
+
+    side = min(img.width, img.height)
+    square = img.crop(
+        (
+            (img.width - side) // 2,
+            (img.height - side) // 2,
+            (img.width - side) // 2 + side,
+            (img.height - side) // 2 + side,
+        )
+    )
+    out: dict[int, bytes] = {}
+    # largest first, each smaller size from the previous one: cheaper than
+    # resampling the full crop every time and indistinguishable at these sizes
+    src = square
+    for size in sorted(set(sizes), reverse=True):
+        src = src.resize((size, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        buf = io.BytesIO()
+        src.save(buf, format="WEBP", quality=quality, method=4)
+        out[size] = buf.getvalue()
+    return out
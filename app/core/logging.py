@@ -1,14 +1,24 @@
 from __future__ import annotations
 
+import atexit
 import json
 import logging
 import os
+import queue
+import random
 import sys
 from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
 from typing import Any, cast
 
 from app.core.config import settings
 from app.core.context import get_request_id
+from app.core.metrics import inc
+
+try:  # optional: ~5-10x faster than json.dumps for log records
+    import orjson as _orjson  # type: ignore[reportMissingImports]
+except ImportError:  # pragma: no cover - depends on installed extras
+    _orjson = None
 
 
 ANSI_RESET = "\x1b[0m"
@@ -23,28 +33,50 @@ ANSI_COLORS = {
 }
 
 
+def _record_request_id(record: logging.LogRecord) -> str | None:
+    # records formatted on the listener thread carry the id captured at emit time
+    return getattr(record, "request_id", None) or get_request_id()
+
+
+def _record_exc_text(formatter: logging.Formatter, record: logging.LogRecord) -> str | None:
+    if record.exc_info:
+        return formatter.formatException(record.exc_info)
+    return record.exc_text or None
+
+
+def _dumps(data: dict[str, Any], pretty: bool) -> str:
+    if _orjson is not None:
+        option = _orjson.OPT_INDENT_2 if pretty else 0
+        return _orjson.dumps(data, default=str, option=option).decode()
+    return json.dumps(
+        data,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        indent=2 if pretty else None,
+        default=str,
+    )
+
+
 class JSONFormatter(logging.Formatter):
     def format(self, record: logging.LogRecord) -> str:  # type: ignore[override]
         data: dict[str, Any] = {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
             "level": record.levelname,
             "logger": record.name,
             "message": record.getMessage(),
         }
-        rid = get_request_id()
+        rid = _record_request_id(record)
         if rid:
             data["request_id"] = rid
-        if record.exc_info:
-            data["exc_info"] = self.formatException(record.exc_info)
+        exc_text = _record_exc_text(self, record)
+        if exc_text:
+            data["exc_info"] = exc_text
         extras_obj = getattr(record, "ipdn_extra", None)
         if isinstance(extras_obj, dict):
             extras_any: dict[Any, Any] = cast(dict[Any, Any], extras_obj)
             extras_typed: dict[str, Any] = {str(k): v for k, v in extras_any.items()}
             data.update(extras_typed)
-        indent = 2 if settings.LOG_JSON_PRETTY else None
-        return json.dumps(
-            data, ensure_ascii=False, separators=(",", ":"), indent=indent
-        )
+        return _dumps(data, settings.LOG_JSON_PRETTY)
 
 
 class ColorConsoleFormatter(logging.Formatter):
@@ -55,14 +87,16 @@ class ColorConsoleFormatter(logging.Formatter):
         return sys.stdout.isatty()
 
     def format(self, record: logging.LogRecord) -> str:  # type: ignore[override]
-        rid = get_request_id()
+        rid = _record_request_id(record)
         level = record.levelname
         color = ANSI_COLORS.get(level, "") if self._supports_color() else ""
         reset = ANSI_RESET if color else ""
         dim = ANSI_DIM if color else ""
         bold = ANSI_BOLD if color else ""
 
-        ts = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        ts = datetime.fromtimestamp(record.created, timezone.utc).strftime(
+            "%Y-%m-%d %H:%M:%S"
+        )
         name = record.name
         msg = record.getMessage()
 
@@ -86,8 +120,9 @@ class ColorConsoleFormatter(logging.Formatter):
                 segments.append(f"{dim}{' '.join(extras_list)}{reset}")
 
         s = " ".join(segments)
-        if record.exc_info:
-            s += "\n" + self.formatException(record.exc_info)
+        exc_text = _record_exc_text(self, record)
+        if exc_text:
+            s += "\n" + exc_text
         return s
 
 
@@ -120,6 +155,76 @@ def get_logger(name: str | None = None) -> ContextLoggerAdapter:
     return ContextLoggerAdapter(base)
 
 
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of sub-WARNING records from selected loggers.
+
+    ``rates`` maps a logger name to a keep probability; the longest matching
+    dotted prefix wins, so ``{"app.ws": 0.1, "app.ws.fanout": 0.01}`` works.
+    """
+
+    def __init__(self, rates: dict[str, float]) -> None:
+        super().__init__()
+        self._rates = dict(rates)
+        self._cache: dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._cache.get(name)
+        if rate is None:
+            rate = 1.0
+            probe = name
+            while probe:
+                if probe in self._rates:
+                    rate = self._rates[probe]
+                    break
+                probe = probe.rpartition(".")[0]
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:  # type: ignore[override]
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        inc("log_records_sampled_out")
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the listener thread; never blocks the event loop.
+
+    When the bounded queue is full the record is dropped and counted in
+    ``log_records_dropped`` rather than stalling the caller.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:  # type: ignore[override]
+        # resolve everything that depends on the emitting context or on
+        # objects that may change before the listener formats the record
+        record = logging.makeLogRecord(record.__dict__)
+        record.request_id = get_request_id()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:  # type: ignore[override]
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            inc("log_records_dropped", labels={"level": record.levelname})
+
+
+class _DrainingQueueListener(QueueListener):
+    def enqueue_sentinel(self) -> None:  # type: ignore[override]
+        # block: the queue may be full and the sentinel must not be dropped
+        self.queue.put(self._sentinel)
+
+
+_listener: QueueListener | None = None
+
+
 def _create_handler() -> logging.Handler:
     handler = logging.StreamHandler(stream=sys.stdout)
     if settings.LOG_FORMAT == "json":
@@ -129,6 +234,25 @@ def _create_handler() -> logging.Handler:
     return handler
 
 
+def _create_queue_handler(target: logging.Handler) -> logging.Handler:
+    global _listener
+    stop_logging()
+    log_queue: queue.Queue[logging.LogRecord] = queue.Queue(
+        maxsize=max(1, settings.LOG_QUEUE_SIZE)
+    )
+    _listener = _DrainingQueueListener(log_queue, target, respect_handler_level=True)
+    _listener.start()
+    return NonBlockingQueueHandler(log_queue)
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread (idempotent)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
 def _hook_uvicorn(level: int) -> None:
     for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
         lg = logging.getLogger(name)
@@ -151,6 +275,10 @@ def configure_logging() -> None:
         root.removeHandler(h)
 
     handler = _create_handler()
+    if settings.LOG_ASYNC:
+        handler = _create_queue_handler(handler)
+    if settings.LOG_SAMPLE_RATES:
+        handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATES))
     root.addHandler(handler)
 
     level_name = settings.LOG_LEVEL.upper()
@@ -161,10 +289,15 @@ def configure_logging() -> None:
 
     for noisy in [
         "sqlalchemy.engine",
+        # checkout/checkin chatter of every pool, named via pool_logging_name
+        "sqlalchemy.pool",
         "asyncpg",
         "alembic",
     ]:
         logging.getLogger(noisy).setLevel(max(level, logging.WARNING))
 
 
-__all__ = ["configure_logging", "get_logger", "ContextLoggerAdapter"]
+atexit.register(stop_logging)
+
+
+__all__ = ["configure_logging", "stop_logging", "get_logger", "ContextLoggerAdapter"]
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+import sys
+import threading
+import time
+import traceback
+from types import FrameType
+
+from app.core.config import settings
+from app.core.context import request_id_for_task
+from app.core.logging import get_logger
+from app.core.metrics import inc, registry
+
+
+LOOP_LAG = registry.histogram(
+    "event_loop_lag_seconds",
+    "Delay between a scheduled loop wakeup and when it actually ran",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+_APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _blocking_site(frame: FrameType) -> str:
+    """Innermost frame inside the app package, else the innermost frame."""
+    f: FrameType | None = frame
+    while f is not None:
+        if f.f_code.co_filename.startswith(_APP_ROOT):
+            break
+        f = f.f_back
+    site = f or frame
+    rel = os.path.relpath(site.f_code.co_filename, os.path.dirname(_APP_ROOT))
+    return f"{rel}:{site.f_lineno}:{site.f_code.co_name}"
+
+
+class LoopMonitor:
+    """Measures event-loop scheduling delay and reports what blocks the loop.
+
+    A heartbeat task sleeps ``LOOP_MONITOR_INTERVAL_SECONDS`` and records how
+    late it woke up into ``event_loop_lag_seconds``. A watchdog thread checks
+    the heartbeat; when it has been overdue for ``LOOP_BLOCK_THRESHOLD_SECONDS``
+    the loop thread's current stack is captured via ``sys._current_frames()``
+    and logged once per stall with the request id of the running task.
+    """
+
+    def __init__(self) -> None:
+        self._interval = settings.LOOP_MONITOR_INTERVAL_SECONDS
+        self._threshold = settings.LOOP_BLOCK_THRESHOLD_SECONDS
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        self._task: asyncio.Task[None] | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._last_beat = time.monotonic()
+        self._beats = 0
+        self._reported_beat = -1
+        self._logger = get_logger("app.loop")
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self._interval
+            await asyncio.sleep(self._interval)
+            now = time.monotonic()
+            LOOP_LAG.observe(max(0.0, now - expected))
+            self._last_beat = now
+            self._beats += 1
+
+    def _watch(self) -> None:
+        poll = max(0.01, self._threshold / 2)
+        while not self._stop.wait(poll):
+            overdue = time.monotonic() - self._last_beat - self._interval
+            beat = self._beats
+            if overdue < self._threshold or beat == self._reported_beat:
+                continue
+            self._reported_beat = beat
+            self._report(overdue)
+
+    def _report(self, overdue: float) -> None:
+        assert self._loop_thread_id is not None
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        task = None
+        if self._loop is not None:
+            with contextlib.suppress(Exception):
+                task = asyncio.current_task(self._loop)
+        site = _blocking_site(frame)
+        stack = "".join(traceback.format_stack(frame, limit=25))
+        inc("event_loop_blocked", labels={"site": site})
+        self._logger.warning(
+            "event loop blocked",
+            extra={
+                "blocked_ms": int(overdue * 1000),
+                "site": site,
+                "request_id": request_id_for_task(task),
+                "stack": stack,
+            },
+        )
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+
+_monitor: LoopMonitor | None = None
+
+
+async def start_loop_monitor() -> None:
+    global _monitor
+    if _monitor is None:
+        _monitor = LoopMonitor()
+        await _monitor.start()
+
+
+async def stop_loop_monitor() -> None:
+    global _monitor
+    if _monitor is not None:
+        await _monitor.stop()
+        _monitor = None
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import os
+import sys
+import tracemalloc
+from collections import defaultdict
+from typing import Any
+
+
+_baseline: tracemalloc.Snapshot | None = None
+
+_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def _module_name(filename: str) -> str:
+    """Dotted module for a source path, using the longest matching sys.path entry."""
+    path = os.path.abspath(filename)
+    best = ""
+    for entry in sys.path:
+        root = os.path.abspath(entry or os.curdir)
+        if path.startswith(root + os.sep) and len(root) > len(best):
+            best = root
+    rel = os.path.relpath(path, best) if best else os.path.basename(path)
+    rel = rel[:-3] if rel.endswith(".py") else rel
+    module = rel.replace(os.sep, ".")
+    return module[: -len(".__init__")] if module.endswith(".__init__") else module
+
+
+def start(frames: int = 1) -> None:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(max(1, frames))
+
+
+def stop() -> None:
+    global _baseline
+    _baseline = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def status() -> dict[str, Any]:
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracing": tracemalloc.is_tracing(),
+        "traced_current_bytes": current,
+        "traced_peak_bytes": peak,
+        "overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+        "has_baseline": _baseline is not None,
+    }
+
+
+def _by_module(
+    stats: list[tracemalloc.StatisticDiff] | list[tracemalloc.Statistic],
+) -> list[dict[str, Any]]:
+    grouped: dict[str, dict[str, int]] = defaultdict(
+        lambda: {"size_bytes": 0, "count": 0, "size_diff_bytes": 0, "count_diff": 0}
+    )
+    for stat in stats:
+        module = _module_name(stat.traceback[0].filename)
+        row = grouped[module]
+        row["size_bytes"] += stat.size
+        row["count"] += stat.count
+        row["size_diff_bytes"] += getattr(stat, "size_diff", 0)
+        row["count_diff"] += getattr(stat, "count_diff", 0)
+    return [{"module": m, **row} for m, row in grouped.items()]
+
+
+def take_snapshot(limit: int) -> list[dict[str, Any]]:
+    """Snapshot current allocations, keep it as the diff baseline, return top modules."""
+    global _baseline
+    if not tracemalloc.is_tracing():
+        return []
+    snap = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+    _baseline = snap
+    rows = _by_module(snap.statistics("filename"))
+    rows.sort(key=lambda r: r["size_bytes"], reverse=True)
+    return rows[:limit]
+
+
+def diff_snapshot(limit: int) -> list[dict[str, Any]]:
+    """Growth per module since the baseline snapshot, largest increase first."""
+    if not tracemalloc.is_tracing() or _baseline is None:
+        return []
+    snap = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+    rows = _by_module(snap.compare_to(_baseline, "filename"))
+    rows.sort(key=lambda r: abs(r["size_diff_bytes"]), reverse=True)
+    return rows[:limit]
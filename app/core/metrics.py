@@ -1,23 +1,342 @@
 from __future__ import annotations
 
+import math
+import threading
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterable, Iterator, Sequence
 from typing import Any
 
 
-_counters: dict[str, int] = {}
-_gauges: dict[str, float] = {}
+LabelValues = tuple[str, ...]
 
+# Prometheus client defaults, in seconds
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0,
+)
 
-def inc(name: str, amount: int = 1) -> None:
-    _counters[name] = _counters.get(name, 0) + int(amount)
 
+class _Metric:
+    """One metric family: label tuples map to slots in a flat ``array``.
 
-def set_gauge(name: str, value: float) -> None:
-    _gauges[name] = float(value)
+    Looking a series up is a single dict hit and updating it is an in-place
+    array write, so the hot path allocates nothing once a series exists.
+    """
 
+    kind = "untyped"
 
-def add_gauge(name: str, delta: float) -> None:
-    _gauges[name] = _gauges.get(name, 0.0) + float(delta)
+    def __init__(
+        self, name: str, documentation: str = "", labelnames: Sequence[str] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames: LabelValues = tuple(labelnames)
+        self._index: dict[LabelValues, int] = {}
+        self._lock = threading.Lock()
 
+    def _key(self, labels: Sequence[str]) -> LabelValues:
+        key = tuple(str(v) for v in labels)
+        if len(key) != len(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, got {key}"
+            )
+        return key
 
-def snapshot() -> dict[str, Any]:
-    return {"counters": dict(_counters), "gauges": dict(_gauges)}
+    def _slot(self, labels: Sequence[str]) -> int:
+        key = labels if type(labels) is tuple else tuple(labels)
+        idx = self._index.get(key)
+        if idx is None:
+            key = self._key(labels)
+            with self._lock:
+                idx = self._index.get(key)
+                if idx is None:
+                    idx = self._grow()
+                    self._index[key] = idx
+        return idx
+
+    def _grow(self) -> int:
+        raise NotImplementedError
+
+    def series(self) -> Iterator[tuple[LabelValues, int]]:
+        return iter(list(self._index.items()))
+
+
+class _Scalar(_Metric):
+    def __init__(
+        self, name: str, documentation: str = "", labelnames: Sequence[str] = ()
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values = array("d")
+
+    def _grow(self) -> int:
+        self._values.append(0.0)
+        return len(self._values) - 1
+
+    def value(self, labels: Sequence[str] = ()) -> float:
+        idx = self._index.get(tuple(str(v) for v in labels))
+        return self._values[idx] if idx is not None else 0.0
+
+    def value_at(self, idx: int) -> float:
+        return self._values[idx]
+
+
+class Counter(_Scalar):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, labels: Sequence[str] = ()) -> None:
+        self._values[self._slot(labels)] += amount
+
+
+class Gauge(_Scalar):
+    kind = "gauge"
+
+    def set(self, value: float, labels: Sequence[str] = ()) -> None:
+        self._values[self._slot(labels)] = value
+
+    def add(self, delta: float, labels: Sequence[str] = ()) -> None:
+        self._values[self._slot(labels)] += delta
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram.
+
+    Per series, bucket counts (non-cumulative, the last slot is ``+Inf``) live
+    in one flat ``array("Q")``; sum and count live in parallel ``array("d")``
+    / ``array("Q")``. Cumulative ``le`` buckets are only built on exposition.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str = "",
+        labelnames: Sequence[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets: tuple[float, ...] = tuple(sorted(float(b) for b in buckets))
+        self._width = len(self.buckets) + 1
+        self._counts = array("Q")
+        self._sums = array("d")
+        self._totals = array("Q")
+
+    def _grow(self) -> int:
+        self._counts.extend([0] * self._width)
+        self._sums.append(0.0)
+        self._totals.append(0)
+        return len(self._sums) - 1
+
+    def observe(self, value: float, labels: Sequence[str] = ()) -> None:
+        idx = self._slot(labels)
+        self._counts[idx * self._width + bisect_left(self.buckets, value)] += 1
+        self._sums[idx] += value
+        self._totals[idx] += 1
+
+    def merge(
+        self,
+        counts: Sequence[float],
+        total_sum: float,
+        total_count: float,
+        labels: Sequence[str] = (),
+    ) -> None:
+        """Add another process's bucket counts (same bucket layout) to a series."""
+        idx = self._slot(labels)
+        base = idx * self._width
+        for i, c in enumerate(counts[: self._width]):
+            self._counts[base + i] += int(c)
+        self._sums[idx] += total_sum
+        self._totals[idx] += int(total_count)
+
+    def bucket_counts(self, idx: int) -> list[int]:
+        start = idx * self._width
+        return list(self._counts[start : start + self._width])
+
+    def sum(self, idx: int) -> float:
+        return self._sums[idx]
+
+    def count(self, idx: int) -> int:
+        return self._totals[idx]
+
+    def quantile(self, q: float, labels: Sequence[str] = ()) -> float | None:
+        """Estimate a quantile by linear interpolation inside the target bucket."""
+        idx = self._index.get(tuple(str(v) for v in labels))
+        if idx is None:
+            return None
+        return bucket_quantile(q, self.buckets, self.bucket_counts(idx))
+
+
+def bucket_quantile(
+    q: float, buckets: Sequence[float], counts: Sequence[float]
+) -> float | None:
+    total = sum(counts)
+    if total <= 0:
+        return None
+    rank = q * total
+    seen = 0.0
+    for i, c in enumerate(counts):
+        if c and seen + c >= rank:
+            if i >= len(buckets):
+                # +Inf bucket: the best we can say is "above the last bound"
+                return buckets[-1] if buckets else None
+            lower = buckets[i - 1] if i > 0 else 0.0
+            return lower + (buckets[i] - lower) * ((rank - seen) / c)
+        seen += c
+    return buckets[-1] if buckets else None
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls: type[Any], name: str, *args: Any, **kwargs: Any) -> Any:
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = cls(name, *args, **kwargs)
+                    self._metrics[name] = metric
+        if type(metric) is not cls:
+            raise ValueError(f"metric {name} already registered as {metric.kind}")
+        return metric
+
+    def counter(
+        self, name: str, documentation: str = "", labelnames: Sequence[str] = ()
+    ) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(
+        self, name: str, documentation: str = "", labelnames: Sequence[str] = ()
+    ) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str = "",
+        labelnames: Sequence[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_create(
+            Histogram, name, documentation, labelnames, buckets=buckets
+        )
+
+    def metrics(self) -> list[_Metric]:
+        return list(self._metrics.values())
+
+
+registry = Registry()
+
+
+# -------- module-level shortcuts (label-less and labeled) --------
+
+
+def inc(name: str, amount: float = 1, labels: dict[str, str] | None = None) -> None:
+    if labels:
+        registry.counter(name, labelnames=tuple(labels)).inc(
+            amount, tuple(labels.values())
+        )
+    else:
+        registry.counter(name).inc(amount)
+
+
+def set_gauge(name: str, value: float, labels: dict[str, str] | None = None) -> None:
+    if labels:
+        registry.gauge(name, labelnames=tuple(labels)).set(
+            float(value), tuple(labels.values())
+        )
+    else:
+        registry.gauge(name).set(float(value))
+
+
+def add_gauge(name: str, delta: float, labels: dict[str, str] | None = None) -> None:
+    if labels:
+        registry.gauge(name, labelnames=tuple(labels)).add(
+            float(delta), tuple(labels.values())
+        )
+    else:
+        registry.gauge(name).add(float(delta))
+
+
+def observe(name: str, value: float, labels: dict[str, str] | None = None) -> None:
+    if labels:
+        registry.histogram(name, labelnames=tuple(labels)).observe(
+            float(value), tuple(labels.values())
+        )
+    else:
+        registry.histogram(name).observe(float(value))
+
+
+# -------- exposition --------
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labelstr(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _num(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _number(value: float) -> int | float:
+    return int(value) if value == int(value) and abs(value) < 1e15 else value
+
+
+def snapshot(source: Registry | None = None) -> dict[str, Any]:
+    """JSON-friendly view; labeled series are keyed as ``name{k="v"}``."""
+    counters: dict[str, int | float] = {}
+    gauges: dict[str, float] = {}
+    histograms: dict[str, dict[str, Any]] = {}
+    for m in (source or registry).metrics():
+        for labels, idx in m.series():
+            key = m.name + _labelstr(m.labelnames, labels)
+            if isinstance(m, Histogram):
+                histograms[key] = {
+                    "buckets": dict(
+                        zip([_num(b) for b in m.buckets] + ["+Inf"], m.bucket_counts(idx))
+                    ),
+                    "sum": m.sum(idx),
+                    "count": m.count(idx),
+                }
+            elif isinstance(m, Gauge):
+                gauges[key] = m.value_at(idx)
+            elif isinstance(m, Counter):
+                counters[key] = _number(m.value_at(idx))
+    return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+
+def render_prometheus(source: Registry | None = None) -> str:
+    """Prometheus text exposition format 0.0.4."""
+    lines: list[str] = []
+    for m in sorted((source or registry).metrics(), key=lambda x: x.name):
+        if m.documentation:
+            lines.append(f"# HELP {m.name} {m.documentation}")
+        lines.append(f"# TYPE {m.name} {m.kind}")
+        for labels, idx in sorted(m.series()):
+            if isinstance(m, Histogram):
+                cumulative = 0
+                bounds = [_num(b) for b in m.buckets] + ["+Inf"]
+                for le, c in zip(bounds, m.bucket_counts(idx)):
+                    cumulative += c
+                    ls = _labelstr((*m.labelnames, "le"), (*labels, le))
+                    lines.append(f"{m.name}_bucket{ls} {cumulative}")
+                ls = _labelstr(m.labelnames, labels)
+                lines.append(f"{m.name}_sum{ls} {_num(m.sum(idx))}")
+                lines.append(f"{m.name}_count{ls} {m.count(idx)}")
+            elif isinstance(m, _Scalar):
+                ls = _labelstr(m.labelnames, labels)
+                lines.append(f"{m.name}{ls} {_num(m.value_at(idx))}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,350 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import time
+import uuid
+from typing import Any, NamedTuple
+
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+
+from app.core.config import settings
+from app.core.exceptions import RedisUnavailable
+from app.core.logging import get_logger
+from app.core.metrics import Counter, Gauge, Histogram, Registry, registry
+from app.core.redis import redis_call
+
+
+logger = get_logger(__name__)
+
+_WORKERS_KEY = "metrics:workers"
+_META_KEY = "metrics:meta"
+_RETIRED_COUNTERS_KEY = "metrics:retired:c"
+_RETIRED_HISTOGRAMS_KEY = "metrics:retired:h"
+
+
+def _counters_key(worker_id: str) -> str:
+    return f"metrics:w:{worker_id}:c"
+
+
+def _gauges_key(worker_id: str) -> str:
+    return f"metrics:w:{worker_id}:g"
+
+
+def _histograms_key(worker_id: str) -> str:
+    return f"metrics:w:{worker_id}:h"
+
+
+def _seq_key(worker_id: str) -> str:
+    return f"metrics:w:{worker_id}:seq"
+
+
+def _field(name: str, labels: tuple[str, ...], part: int | str | None = None) -> str:
+    item: list[Any] = [name, list(labels)]
+    if part is not None:
+        item.append(part)
+    return json.dumps(item, separators=(",", ":"), ensure_ascii=False)
+
+
+class _Batch(NamedTuple):
+    seq: int
+    deltas: list[tuple[str, str, float]]
+    meta: dict[str, str]
+
+
+class MetricsFlusher:
+    """Pushes this process's metrics to Redis so any worker can serve the total.
+
+    Counters and histogram buckets are sent as deltas (``HINCRBYFLOAT``) and
+    gauges as absolute values (``HSET``) under per-worker hashes. Every batch
+    of deltas carries a sequence number that Redis records with it; a batch
+    whose outcome is unknown (a timeout after ``EXEC``) is re-sent unchanged
+    and skipped if it had landed. Workers heartbeat in a ZSET; once a worker
+    misses ``METRICS_WORKER_STALE_SECONDS`` its counters and histograms are
+    folded into shared ``retired`` hashes (so totals never go backwards) and
+    its gauges are dropped.
+    """
+
+    def __init__(self, source: Registry = registry) -> None:
+        # unique per process start: a recycled pid must not inherit the
+        # sequence numbers of the process that had it before
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._source = source
+        self._flushed: dict[str, float] = {}
+        self._meta_sent: set[str] = set()
+        self._seq = 0
+        self._pending: _Batch | None = None
+        self._task: asyncio.Task[None] | None = None
+        self._lock = asyncio.Lock()
+
+    def _collect(
+        self,
+    ) -> tuple[dict[str, float], dict[str, float], dict[str, float], dict[str, str]]:
+        counters: dict[str, float] = {}
+        gauges: dict[str, float] = {}
+        histograms: dict[str, float] = {}
+        meta: dict[str, str] = {}
+        for m in self._source.metrics():
+            if m.name not in self._meta_sent:
+                info: dict[str, Any] = {
+                    "kind": m.kind,
+                    "doc": m.documentation,
+                    "labels": list(m.labelnames),
+                }
+                if isinstance(m, Histogram):
+                    info["buckets"] = list(m.buckets)
+                meta[m.name] = json.dumps(info)
+            for labels, idx in m.series():
+                if isinstance(m, Histogram):
+                    for i, c in enumerate(m.bucket_counts(idx)):
+                        histograms[_field(m.name, labels, i)] = float(c)
+                    histograms[_field(m.name, labels, "sum")] = m.sum(idx)
+                    histograms[_field(m.name, labels, "count")] = float(m.count(idx))
+                elif isinstance(m, Gauge):
+                    gauges[_field(m.name, labels)] = m.value_at(idx)
+                elif isinstance(m, Counter):
+                    counters[_field(m.name, labels)] = m.value_at(idx)
+        return counters, gauges, histograms, meta
+
+    def _next_batch(
+        self, counters: dict[str, float], histograms: dict[str, float], meta: dict[str, str]
+    ) -> _Batch:
+        deltas: list[tuple[str, str, float]] = []
+        for key, values in (
+            (_counters_key(self.worker_id), counters),
+            (_histograms_key(self.worker_id), histograms),
+        ):
+            for f, v in values.items():
+                prev_key = key + f
+                delta = v - self._flushed.get(prev_key, 0.0)
+                if delta:
+                    deltas.append((key, f, delta))
+                # from here on the delta belongs to the batch, sent or not
+                self._flushed[prev_key] = v
+        self._seq += 1
+        return _Batch(self._seq, deltas, meta)
+
+    async def _send(self, batch: _Batch, gauges: dict[str, float]) -> None:
+        ttl = int(settings.METRICS_WORKER_STALE_SECONDS * 4)
+        seq_key = _seq_key(self.worker_id)
+
+        async def _op(redis: Redis) -> Any:
+            async with redis.pipeline(transaction=True) as pipe:
+                await pipe.watch(seq_key)
+                applied = int(await pipe.get(seq_key) or 0)
+                # MULTI/EXEC: a batch lands entirely or not at all, and the
+                # recorded sequence number makes re-sending it harmless
+                pipe.multi()
+                if batch.seq > applied:
+                    for key, f, delta in batch.deltas:
+                        pipe.hincrbyfloat(key, f, delta)
+                    if batch.meta:
+                        pipe.hset(_META_KEY, mapping=batch.meta)
+                    pipe.set(seq_key, batch.seq)
+                if gauges:
+                    pipe.hset(_gauges_key(self.worker_id), mapping=gauges)
+                for key in (
+                    _counters_key(self.worker_id),
+                    _gauges_key(self.worker_id),
+                    _histograms_key(self.worker_id),
+                    seq_key,
+                ):
+                    pipe.expire(key, ttl)
+                pipe.zadd(_WORKERS_KEY, {self.worker_id: time.time()})
+                return await pipe.execute()
+
+        await redis_call(_op, timeout=settings.METRICS_FLUSH_SECONDS)
+
+    async def flush(self) -> None:
+        async with self._lock:
+            counters, gauges, histograms, meta = self._collect()
+            if self._pending is not None:
+                # its outcome is unknown: send the very same batch again
+                await self._send(self._pending, gauges)
+                self._meta_sent.update(self._pending.meta)
+            self._pending = self._next_batch(counters, histograms, meta)
+            await self._send(self._pending, gauges)
+            self._meta_sent.update(meta)
+            self._pending = None
+
+    async def _retire(self, worker_id: str, cutoff: float | None = None) -> bool:
+        """Fold a worker's monotonic series into the shared totals, drop the rest.
+
+        Skipped if the worker is gone already or has heartbeated after
+        ``cutoff``. The check, the fold and the delete run as one optimistic
+        transaction over the worker's keys: a concurrent flush by that worker
+        or another reaper makes it start over, so nothing is lost or counted
+        twice. The sequence key is left to expire, so a batch re-sent by the
+        worker after it was folded is still recognised.
+        """
+        keys = (_counters_key(worker_id), _gauges_key(worker_id), _histograms_key(worker_id))
+
+        async def _fold(pipe: Pipeline) -> bool:
+            score = await pipe.zscore(_WORKERS_KEY, worker_id)
+            if score is None or (cutoff is not None and float(score) > cutoff):
+                return False
+            counters = await pipe.hgetall(keys[0])
+            histograms = await pipe.hgetall(keys[2])
+            pipe.multi()
+            for f, v in counters.items():
+                pipe.hincrbyfloat(_RETIRED_COUNTERS_KEY, f, float(v))
+            for f, v in histograms.items():
+                pipe.hincrbyfloat(_RETIRED_HISTOGRAMS_KEY, f, float(v))
+            pipe.delete(*keys)
+            pipe.zrem(_WORKERS_KEY, worker_id)
+            return True
+
+        async def _op(redis: Redis) -> Any:
+            return await redis.transaction(
+                _fold, _seq_key(worker_id), *keys, value_from_callable=True
+            )
+
+        retired = bool(await redis_call(_op))
+        if retired:
+            logger.info("retired metrics of stale worker", extra={"worker": worker_id})
+        return retired
+
+    async def reap_stale(self) -> None:
+        cutoff = time.time() - settings.METRICS_WORKER_STALE_SECONDS
+
+        async def _op(redis: Redis) -> Any:
+            return await redis.zrangebyscore(_WORKERS_KEY, "-inf", cutoff)
+
+        for raw in await redis_call(_op):
+            worker_id = raw.decode() if isinstance(raw, bytes) else str(raw)
+            if worker_id != self.worker_id:
+                await self._retire(worker_id, cutoff)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.METRICS_FLUSH_SECONDS)
+            try:
+                await self.flush()
+                await self.reap_stale()
+            except RedisUnavailable:
+                # deltas stay pending and go out with the next successful flush
+                pass
+            except Exception:
+                logger.exception("metrics flush failed")
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        with contextlib.suppress(RedisUnavailable):
+            await self.flush()
+            await self._retire(self.worker_id)
+
+
+async def aggregated_registry() -> Registry:
+    """Merge every live worker plus the retired totals into a fresh registry.
+
+    Counters and histograms are summed. Gauges are not: a pool's in-use
+    connections add up across workers, a queue depth every worker reports
+    does not, so each live worker's value is kept under a ``worker`` label
+    for the query to aggregate.
+    """
+    if _flusher is not None:
+        await _flusher.flush()
+
+    async def _op(redis: Redis) -> Any:
+        workers = [
+            w.decode() if isinstance(w, bytes) else str(w)
+            for w in await redis.zrange(_WORKERS_KEY, 0, -1)
+        ]
+        pipe = redis.pipeline(transaction=False)
+        pipe.hgetall(_META_KEY)
+        pipe.hgetall(_RETIRED_COUNTERS_KEY)
+        pipe.hgetall(_RETIRED_HISTOGRAMS_KEY)
+        for wid in workers:
+            pipe.hgetall(_counters_key(wid))
+            pipe.hgetall(_gauges_key(wid))
+            pipe.hgetall(_histograms_key(wid))
+        return workers, await pipe.execute()
+
+    workers, results = await redis_call(_op)
+    meta_raw, retired_c, retired_h = results[0], results[1], results[2]
+    meta = {k.decode(): json.loads(v) for k, v in meta_raw.items()}
+    counters: dict[str, float] = {}
+    gauges: dict[tuple[str, str], float] = {}
+    histograms: dict[str, float] = {}
+    sources = [(counters, retired_c), (histograms, retired_h)]
+    for wid, i in zip(workers, range(3, len(results), 3)):
+        sources += [(counters, results[i]), (histograms, results[i + 2])]
+        for f, v in results[i + 1].items():
+            gauges[(f.decode() if isinstance(f, bytes) else f, wid)] = float(v)
+    for target, h in sources:
+        for f, v in h.items():
+            key = f.decode() if isinstance(f, bytes) else f
+            target[key] = target.get(key, 0.0) + float(v)
+
+    merged = Registry()
+
+    def _family(name: str) -> dict[str, Any]:
+        return meta.get(name) or {"kind": "untyped", "doc": "", "labels": []}
+
+    for f, v in counters.items():
+        name, labels = json.loads(f)
+        info = _family(name)
+        merged.counter(name, info["doc"], info["labels"]).inc(v, tuple(labels))
+    for (f, wid), v in gauges.items():
+        name, labels = json.loads(f)
+        info = _family(name)
+        merged.gauge(name, info["doc"], [*info["labels"], "worker"]).set(
+            v, (*labels, wid)
+        )
+
+    series: dict[tuple[str, tuple[str, ...]], dict[str, float]] = {}
+    for f, v in histograms.items():
+        name, labels, part = json.loads(f)
+        series.setdefault((name, tuple(labels)), {})[str(part)] = v
+    for (name, labels), parts in series.items():
+        info = _family(name)
+        hist = merged.histogram(
+            name, info["doc"], info["labels"], buckets=info.get("buckets", ())
+        )
+        counts = [parts.get(str(i), 0.0) for i in range(len(hist.buckets) + 1)]
+        hist.merge(counts, parts.get("sum", 0.0), parts.get("count", 0.0), labels)
+    return merged
+
+
+async def metrics_view() -> Registry:
+    """Registry the metrics endpoints should read: merged or this process only."""
+    if not metrics_multiprocess_enabled():
+        return registry
+    try:
+        return await aggregated_registry()
+    except RedisUnavailable:
+        # better a single worker's numbers than a failed scrape
+        return registry
+
+
+_flusher: MetricsFlusher | None = None
+
+
+def metrics_multiprocess_enabled() -> bool:
+    return settings.METRICS_MULTIPROCESS
+
+
+async def start_metrics_flusher() -> None:
+    global _flusher
+    if _flusher is None:
+        _flusher = MetricsFlusher()
+        await _flusher.start()
+
+
+async def stop_metrics_flusher() -> None:
+    global _flusher
+    if _flusher is not None:
+        await _flusher.stop()
+        _flusher = None
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+from typing import Literal
+
+from app.core.config import settings
+
+
+ProfileMode = Literal["wall", "cpu"]
+
+# innermost frames that mean "this thread is parked", dropped in cpu mode
+_IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("base_events.py", "_run_once"),
+}
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    path = code.co_filename
+    short = "/".join(path.replace("\\", "/").rsplit("/", 2)[-2:])
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{short}:{name}".replace(";", ":")
+
+
+def _collapse(frame: FrameType | None, root: str) -> str:
+    labels: list[str] = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(root)
+    labels.reverse()
+    return ";".join(labels)
+
+
+def _await_chain(task: asyncio.Task[object], limit: int = 64) -> list[str]:
+    """Frames of a suspended task, outermost first, following ``cr_await``.
+
+    ``Task.get_stack()`` stops at the task's own coroutine frame; the await
+    chain is what shows where in the service code the task is parked.
+    """
+    labels: list[str] = []
+    coro: object | None = task.get_coro()
+    while coro is not None and len(labels) < limit:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        labels.append(_frame_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return labels
+
+
+def _is_idle(frame: FrameType) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES
+
+
+class ProfileResult:
+    __slots__ = ("stacks", "samples", "duration", "interval", "overhead")
+
+    def __init__(
+        self,
+        stacks: Counter[str],
+        samples: int,
+        duration: float,
+        interval: float,
+        overhead: float,
+    ) -> None:
+        self.stacks = stacks
+        self.samples = samples
+        self.duration = duration
+        self.interval = interval
+        self.overhead = overhead
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's folded format: ``frame;frame;frame count`` per line."""
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+
+class SamplingProfiler:
+    """Samples every thread's stack and the loop's suspended task stacks.
+
+    The thread sampler wakes every ``interval`` and walks
+    ``sys._current_frames()``; a coroutine on the event loop samples
+    ``asyncio.all_tasks()`` on the same cadence (that is the only safe place to
+    read them). The time spent sampling is measured and the interval is
+    stretched whenever it would exceed ``max_overhead`` of wall time, so the
+    cost stays bounded however deep the stacks get.
+    """
+
+    def __init__(
+        self,
+        seconds: float,
+        interval: float,
+        mode: ProfileMode = "wall",
+        include_tasks: bool = True,
+        max_overhead: float | None = None,
+    ) -> None:
+        self.seconds = seconds
+        self.interval = max(0.001, interval)
+        self.mode = mode
+        self.include_tasks = include_tasks
+        self.max_overhead = (
+            settings.PROFILER_MAX_OVERHEAD if max_overhead is None else max_overhead
+        )
+        # the thread and task samplers each get their share of the budget
+        self._budget = self.max_overhead / (2 if include_tasks else 1)
+        self._stacks: Counter[str] = Counter()
+        self._samples = 0
+        self._busy = 0.0
+        self._lock = threading.Lock()
+
+    def _account(self, cost: float) -> float:
+        """Record ``cost`` and return the next sleep that honours the budget."""
+        with self._lock:
+            self._busy += cost
+        if self._budget <= 0:
+            return self.interval
+        return max(self.interval, cost / self._budget - cost)
+
+    def _sample_threads(self, deadline: float) -> None:
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        while True:
+            start = time.perf_counter()
+            if start >= deadline:
+                return
+            batch: list[str] = []
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                if self.mode == "cpu" and _is_idle(frame):
+                    continue
+                batch.append(_collapse(frame, f"thread:{names.get(tid, tid)}"))
+            with self._lock:
+                self._stacks.update(batch)
+                self._samples += 1
+            time.sleep(self._account(time.perf_counter() - start))
+
+    async def _sample_tasks(self, deadline: float) -> None:
+        current = asyncio.current_task()
+        while True:
+            start = time.perf_counter()
+            if start >= deadline:
+                return
+            batch: list[str] = []
+            for task in asyncio.all_tasks():
+                if task is current:
+                    continue
+                labels = _await_chain(task)
+                if labels:
+                    batch.append(";".join([f"task:{task.get_name()}", *labels]))
+            with self._lock:
+                self._stacks.update(batch)
+            await asyncio.sleep(self._account(time.perf_counter() - start))
+
+    async def run(self) -> ProfileResult:
+        started = time.perf_counter()
+        deadline = started + self.seconds
+        jobs = [asyncio.to_thread(self._sample_threads, deadline)]
+        if self.include_tasks:
+            jobs.append(self._sample_tasks(deadline))
+        await asyncio.gather(*jobs)
+        duration = time.perf_counter() - started
+        return ProfileResult(
+            stacks=self._stacks,
+            samples=self._samples,
+            duration=duration,
+            interval=self.interval,
+            overhead=self._busy / duration if duration else 0.0,
+        )
+
+
+_running = asyncio.Lock()
+
+
+def profiler_busy() -> bool:
+    return _running.locked()
+
+
+async def run_profile(
+    seconds: float, interval: float, mode: ProfileMode, include_tasks: bool
+) -> ProfileResult:
+    """Run one profile; callers check ``profiler_busy()`` first (one at a time)."""
+    async with _running:
+        profiler = SamplingProfiler(seconds, interval, mode, include_tasks)
+        return await profiler.run()
@@ -1,29 +1,174 @@
 from __future__ import annotations
 
+import asyncio
 import json
-from typing import Any, cast
+import time
+from typing import Any, TypeVar, cast
 from collections.abc import Callable, Awaitable
 
-from redis.asyncio import Redis
+from redis.asyncio import BlockingConnectionPool, Redis
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import TimeoutError as RedisTimeoutError
 
 from app.core.config import settings
+from app.core.context import get_request_cost
+from app.core.exceptions import RedisUnavailable
+from app.core.metrics import inc, set_gauge
 
 
+T = TypeVar("T")
+
 _redis: Redis | None = None
+_pubsub_redis: Redis | None = None
+
+
+class CircuitBreaker:
+    """Fail fast while Redis is unhealthy.
+
+    ``closed``: calls pass through; ``failure_threshold`` consecutive
+    connection/timeout failures open the breaker. ``open``: calls are rejected
+    immediately until ``reset_timeout`` has elapsed. ``half_open``: one probe
+    call is let through; its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == "open" and not self._reset_due()
+
+    def _reset_due(self) -> bool:
+        return time.monotonic() - self._opened_at >= self.reset_timeout
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and self._reset_due():
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release_probe(self) -> None:
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._probe_in_flight = False
+        if self.state != "closed":
+            self.state = "closed"
+            set_gauge("redis_breaker_open", 0)
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self._failures >= self.failure_threshold:
+            if self.state != "open":
+                inc("redis_breaker_opened")
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            set_gauge("redis_breaker_open", 1)
+
+
+breaker = CircuitBreaker(
+    settings.REDIS_BREAKER_FAILURE_THRESHOLD, settings.REDIS_BREAKER_RESET_SECONDS
+)
 
 
 async def get_redis() -> Redis:
     global _redis
     if _redis is None:
-        from_url = cast(Callable[..., Redis], Redis.from_url)
-        _redis = from_url(settings.REDIS_URL, decode_responses=False)
+        pool = BlockingConnectionPool.from_url(
+            settings.REDIS_URL,
+            decode_responses=False,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT_SECONDS,
+            socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT_SECONDS,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL_SECONDS,
+        )
+        _redis = Redis(connection_pool=pool)
     return _redis
 
 
-async def publish_json(channel: str, payload: Any) -> None:
+async def get_pubsub_redis() -> Redis:
+    """Dedicated client for pub/sub subscriptions.
+
+    A subscriber holds its connection for the life of the process and blocks in
+    reads, so it gets its own pool without a socket read timeout instead of
+    competing with request traffic for command connections.
+    """
+    global _pubsub_redis
+    if _pubsub_redis is None:
+        from_url = cast(Callable[..., Redis], Redis.from_url)
+        _pubsub_redis = from_url(
+            settings.REDIS_URL,
+            decode_responses=False,
+            max_connections=2,
+            socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT_SECONDS,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL_SECONDS,
+        )
+    return _pubsub_redis
+
+
+async def redis_call(
+    op: Callable[[Redis], Awaitable[T]], *, timeout: float | None = None
+) -> T:
+    """Run one Redis operation behind the circuit breaker with a hard deadline.
+
+    Raises ``RedisUnavailable`` when the breaker is open or the call fails with a
+    connection error or timeout. Callers whose feature can degrade (unread
+    counters, presence, fanout) catch it; the rest let it surface as a 503.
+    """
+    if not breaker.allow():
+        inc("redis_breaker_rejected")
+        raise RedisUnavailable()
     redis = await get_redis()
-    publish = cast(Callable[[str, bytes], Awaitable[Any] | Any], redis.publish)
-    await publish(channel, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+    cost = get_request_cost()
+    start = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(
+            op(redis), timeout=timeout or settings.REDIS_OP_TIMEOUT_SECONDS
+        )
+    except (asyncio.TimeoutError, RedisTimeoutError) as e:
+        inc("redis_timeouts")
+        breaker.record_failure()
+        raise RedisUnavailable() from e
+    except (RedisConnectionError, OSError) as e:
+        inc("redis_errors")
+        breaker.record_failure()
+        raise RedisUnavailable() from e
+    except asyncio.CancelledError:
+        breaker.release_probe()
+        raise
+    except Exception:
+        # command-level errors (WRONGTYPE, ...) say nothing about Redis health
+        breaker.record_success()
+        raise
+    finally:
+        if cost is not None:
+            cost.add_redis((time.perf_counter() - start) * 1000)
+    breaker.record_success()
+    return result
+
+
+async def _publish(channel: str, data: bytes) -> None:
+    async def _op(redis: Redis) -> Any:
+        publish = cast(Callable[[str, bytes], Awaitable[Any]], redis.publish)
+        return await publish(channel, data)
+
+    await redis_call(_op)
+
+
+async def publish_json(channel: str, payload: Any) -> None:
+    await _publish(channel, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
 
 
 async def publish_model(channel: str, payload: Any) -> None:
@@ -32,6 +177,4 @@ async def publish_model(channel: str, payload: Any) -> None:
         raw = data()
     else:
         raw = json.dumps(payload, ensure_ascii=False)
-    redis = await get_redis()
-    publish = cast(Callable[[str, bytes], Awaitable[Any] | Any], redis.publish)
-    await publish(channel, raw.encode("utf-8"))
+    await _publish(channel, raw.encode("utf-8"))
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+
+# Functions here run in the CPU process pool. The module has no app imports,
+# so a spawned worker loads nothing but the standard library.
+
+# The EICAR anti-virus test file, split so this source file itself is not
+# flagged by scanners on the machines it is checked out on.
+_EICAR = (
+    b"X5O!P%@AP[4\\PZX54(P^)7CC)7}$"
+    + b"EICAR-STANDARD-ANTIVIRUS-TEST-FILE!$H+H*"
+)
+
+SIGNATURES: dict[str, bytes] = {"EICAR-Test-File": _EICAR}
+
+
+def scan_file(path: str, chunk_size: int = 1024 * 1024) -> str | None:
+    """Name of the first known signature found in the file, or None if clean.
+
+    The file is read in chunks; the tail of each chunk is kept so a signature
+    that straddles a chunk boundary is still found.
+    """
+    overlap = max(len(s) for s in SIGNATURES.values()) - 1
+    tail = b""
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            window = tail + chunk
+            for name, signature in SIGNATURES.items():
+                if signature in window:
+                    return name
+            tail = window[-overlap:]
+    return None
@@ -1,3 +1,8 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Any
 from uuid import uuid4
@@ -99,3 +104,117 @@ def verify_token(token: str, *, expected_type: str | None = None) -> JWTClaims:
     if expected_type and data.type != expected_type:
         raise ValueError("Invalid token type")
     return data
+
+
+# -------- signed download / upload links --------
+
+
+def _signing_key(purpose: bytes) -> bytes:
+    # derived per purpose, so a leaked link signature says nothing about the
+    # JWT key and a download link cannot be replayed as an upload link
+    return hashlib.sha256(purpose + b":" + settings.SECRET_KEY.encode()).digest()
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _seal(purpose: bytes, fields: list[Any]) -> str:
+    payload = _b64(
+        json.dumps(fields, separators=(",", ":"), ensure_ascii=False).encode()
+    )
+    sig = _b64(hmac.new(_signing_key(purpose), payload.encode(), hashlib.sha256).digest())
+    return f"{payload}.{sig}"
+
+
+def _unseal(purpose: bytes, token: str) -> list[Any]:
+    payload, _, sig = token.partition(".")
+    expected = _b64(
+        hmac.new(_signing_key(purpose), payload.encode(), hashlib.sha256).digest()
+    )
+    if not sig or not hmac.compare_digest(sig, expected):
+        raise ValueError("bad signature")
+    return json.loads(_unb64(payload))
+
+
+def _expiry(ttl_seconds: int) -> int:
+    # rounded up to a whole minute, so links minted for the same object
+    # within that minute are identical and browser caches can reuse them
+    return -(-(int(time.time()) + max(1, ttl_seconds)) // 60) * 60
+
+
+class DownloadGrant(BaseModel):
+    attachment_id: int
+    key: str
+    filename: str
+    content_type: str
+    checksum: str | None = None
+    # epoch seconds the attachment was stored, for Last-Modified
+    modified: int | None = None
+
+
+def sign_download(grant: DownloadGrant, ttl_seconds: int) -> tuple[str, int]:
+    """Token granting a download of one stored file until the returned expiry."""
+    exp = _expiry(ttl_seconds)
+    token = _seal(
+        b"attachment-download",
+        [
+            grant.attachment_id,
+            exp,
+            grant.key,
+            grant.filename,
+            grant.content_type,
+            grant.checksum,
+            grant.modified,
+        ],
+    )
+    return token, exp
+
+
+def verify_download(token: str, attachment_id: int) -> DownloadGrant:
+    """The grant of a valid, unexpired token for ``attachment_id``; else ValueError."""
+    att_id, exp, key, filename, content_type, checksum, modified = _unseal(
+        b"attachment-download", token
+    )
+    if int(att_id) != attachment_id:
+        raise ValueError("token is for another attachment")
+    if int(exp) < time.time():
+        raise ValueError("link expired")
+    return DownloadGrant(
+        attachment_id=att_id,
+        key=key,
+        filename=filename,
+        content_type=content_type,
+        checksum=checksum,
+        modified=modified,
+    )
+
+
+class UploadGrant(BaseModel):
+    """Permission to write exactly these bytes to one storage key."""
+
+    key: str
+    size: int
+    sha256: str
+    content_type: str
+
+
+def sign_upload(grant: UploadGrant, ttl_seconds: int) -> tuple[str, int]:
+    exp = _expiry(ttl_seconds)
+    token = _seal(
+        b"storage-upload",
+        [exp, grant.key, grant.size, grant.sha256, grant.content_type],
+    )
+    return token, exp
+
+
+def verify_upload(token: str) -> UploadGrant:
+    """The grant of a valid, unexpired upload token; else ValueError."""
+    exp, key, size, sha256, content_type = _unseal(b"storage-upload", token)
+    if int(exp) < time.time():
+        raise ValueError("link expired")
+    return UploadGrant(key=key, size=size, sha256=sha256, content_type=content_type)
@@ -0,0 +1,357 @@
+from __future__ import annotations
+
+import base64
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator, Iterator, Sequence
+from pathlib import Path
+from typing import Any, NamedTuple
+from urllib.parse import quote
+
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.core.executors import iter_io, run_io
+from app.core.security import UploadGrant, sign_upload
+
+
+class PresignedUpload(BaseModel):
+    """A request the client sends itself to put an object's bytes in storage."""
+
+    url: str
+    method: str = "PUT"
+    # must be sent exactly as given; they are part of the signature
+    headers: dict[str, str] = {}
+    expires_at: int
+
+
+class StoredObject(NamedTuple):
+    key: str
+    size: int
+    # seconds since the epoch
+    modified: float
+
+
+class Storage(ABC):
+    """Where stored files live, addressed by relative ``/``-separated keys."""
+
+    @abstractmethod
+    async def put_file(self, key: str, src: Path) -> None:
+        """Store the finished local file ``src`` under ``key``, consuming ``src``."""
+
+    @abstractmethod
+    async def put_bytes(self, key: str, data: bytes, content_type: str) -> None: ...
+
+    @abstractmethod
+    async def read_bytes(self, key: str) -> bytes:
+        """The whole object; FileNotFoundError if there is none."""
+
+    async def get_file(self, key: str, dest: Path) -> None:
+        """Copy the object to the local file ``dest``; FileNotFoundError if none."""
+        data = await self.read_bytes(key)
+        await run_io(_write_atomic, dest, data)
+
+    @abstractmethod
+    async def size(self, key: str) -> int | None:
+        """Byte size of the object at ``key``, or None if there is none."""
+
+    @abstractmethod
+    async def delete(self, keys: Sequence[str]) -> None:
+        """Remove objects; keys that do not exist are ignored."""
+
+    @abstractmethod
+    def list_objects(self, prefix: str) -> AsyncIterator[list[StoredObject]]:
+        """Every object whose key starts with ``prefix``, streamed in batches."""
+
+    @abstractmethod
+    def presign_put(
+        self, key: str, *, content_type: str, size: int, sha256: str, ttl_seconds: int
+    ) -> PresignedUpload:
+        """A direct upload that storage accepts only for exactly these bytes."""
+
+    def local_path(self, key: str) -> Path | None:
+        """Filesystem path the object can be read from, if it has one."""
+        return None
+
+    def presign_get(
+        self,
+        key: str,
+        *,
+        filename: str,
+        content_type: str,
+        ttl_seconds: int,
+        disposition: str = "attachment",
+    ) -> str | None:
+        """A URL that downloads the object straight from storage, if supported."""
+        return None
+
+
+def _replace(src: Path, dest: Path) -> None:
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    # atomic: concurrent writers of the same key just replace equal bytes
+    os.replace(src, dest)
+
+
+def _write_atomic(dest: Path, data: bytes) -> None:
+    tmp = dest.parent / f".{dest.name}.{uuid.uuid4().hex}"
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, dest)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def _unlink_all(paths: list[Path]) -> None:
+    for p in paths:
+        p.unlink(missing_ok=True)
+
+
+def _walk(root: Path, top: Path) -> Iterator[StoredObject]:
+    # depth first with one open directory per level, so the tree is never
+    # listed as a whole; dot entries are temp files, not objects
+    try:
+        stack = [os.scandir(top)]
+    except FileNotFoundError:
+        return
+    try:
+        while stack:
+            entry = next(stack[-1], None)
+            if entry is None:
+                stack.pop().close()
+                continue
+            if entry.name.startswith("."):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(os.scandir(entry.path))
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    key = Path(os.path.relpath(entry.path, root)).as_posix()
+                    yield StoredObject(key, st.st_size, st.st_mtime)
+            except FileNotFoundError:
+                continue
+    finally:
+        for it in stack:
+            it.close()
+
+
+class LocalStorage(Storage):
+    """Files under one directory; the app itself stands in for presigned PUTs."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def local_path(self, key: str) -> Path:
+        return self.root / key
+
+    async def put_file(self, key: str, src: Path) -> None:
+        await run_io(_replace, src, self.root / key)
+
+    async def put_bytes(self, key: str, data: bytes, content_type: str) -> None:
+        await run_io(_write_atomic, self.root / key, data)
+
+    async def read_bytes(self, key: str) -> bytes:
+        return await run_io((self.root / key).read_bytes)
+
+    async def size(self, key: str) -> int | None:
+        try:
+            return (await run_io((self.root / key).stat)).st_size
+        except FileNotFoundError:
+            return None
+
+    async def delete(self, keys: Sequence[str]) -> None:
+        await run_io(_unlink_all, [self.root / k for k in keys])
+
+    async def list_objects(self, prefix: str) -> AsyncIterator[list[StoredObject]]:
+        async for batch in iter_io(_walk(self.root, self.root / prefix)):
+            yield batch
+
+    def presign_put(
+        self, key: str, *, content_type: str, size: int, sha256: str, ttl_seconds: int
+    ) -> PresignedUpload:
+        token, exp = sign_upload(
+            UploadGrant(key=key, size=size, sha256=sha256, content_type=content_type),
+            ttl_seconds,
+        )
+        base = settings.BACKEND_PUBLIC_BASE_URL or ""
+        return PresignedUpload(
+            url=f"{base}/api/storage/objects?token={token}",
+            headers={"Content-Type": content_type},
+            expires_at=exp,
+        )
+
+
+class S3Storage(Storage):
+    """An S3-compatible bucket; clients move the bytes via presigned URLs.
+
+    boto3 is blocking, so every network call runs on the I/O pool. Presigned
+    URLs are signed offline against ``S3_PUBLIC_ENDPOINT_URL`` when the API
+    reaches storage under a different name than browsers do.
+    """
+
+    def __init__(self) -> None:
+        try:
+            import boto3  # type: ignore[reportMissingImports]
+            from botocore.config import Config  # type: ignore[reportMissingImports]
+        except ImportError as exc:  # pragma: no cover - depends on extras
+            raise RuntimeError(
+                'STORAGE_BACKEND="s3" needs the "s3" extra (boto3)'
+            ) from exc
+        if not settings.S3_BUCKET:
+            raise RuntimeError('STORAGE_BACKEND="s3" needs S3_BUCKET')
+
+        def client(endpoint_url: str | None) -> Any:
+            return boto3.client(
+                "s3",
+                endpoint_url=endpoint_url,
+                region_name=settings.S3_REGION,
+                aws_access_key_id=settings.S3_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+                config=Config(
+                    signature_version="s3v4",
+                    s3={"addressing_style": settings.S3_ADDRESSING_STYLE},
+                    # one connection per I/O thread that may be using it
+                    max_pool_connections=max(10, settings.UPLOAD_IO_THREADS),
+                ),
+            )
+
+        self.bucket = settings.S3_BUCKET
+        self._client = client(settings.S3_ENDPOINT_URL)
+        public = settings.S3_PUBLIC_ENDPOINT_URL
+        self._presigner = client(public) if public else self._client
+
+    async def put_file(self, key: str, src: Path) -> None:
+        try:
+            await run_io(self._client.upload_file, str(src), self.bucket, key)
+        finally:
+            await run_io(src.unlink, True)
+
+    async def put_bytes(self, key: str, data: bytes, content_type: str) -> None:
+        await run_io(
+            lambda: self._client.put_object(
+                Bucket=self.bucket, Key=key, Body=data, ContentType=content_type
+            )
+        )
+
+    async def read_bytes(self, key: str) -> bytes:
+        def _get() -> bytes:
+            try:
+                obj = self._client.get_object(Bucket=self.bucket, Key=key)
+            except self._client.exceptions.NoSuchKey:
+                raise FileNotFoundError(key) from None
+            return obj["Body"].read()
+
+        return await run_io(_get)
+
+    async def get_file(self, key: str, dest: Path) -> None:
+        from botocore.exceptions import ClientError  # type: ignore[reportMissingImports]
+
+        def _download() -> None:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            # ranged, concurrent GETs straight to disk; never held in memory
+            self._client.download_file(self.bucket, key, str(dest))
+
+        try:
+            await run_io(_download)
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                raise FileNotFoundError(key) from None
+            raise
+
+    async def size(self, key: str) -> int | None:
+        from botocore.exceptions import ClientError  # type: ignore[reportMissingImports]
+
+        try:
+            head = await run_io(
+                lambda: self._client.head_object(Bucket=self.bucket, Key=key)
+            )
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return int(head["ContentLength"])
+
+    async def delete(self, keys: Sequence[str]) -> None:
+        keys = list(keys)
+        # DeleteObjects takes at most 1000 keys per call
+        for i in range(0, len(keys), 1000):
+            batch = [{"Key": k} for k in keys[i : i + 1000]]
+            result = await run_io(
+                lambda: self._client.delete_objects(
+                    Bucket=self.bucket, Delete={"Objects": batch, "Quiet": True}
+                )
+            )
+            if result.get("Errors"):
+                raise OSError(f"could not delete {len(result['Errors'])} objects")
+
+    async def list_objects(self, prefix: str) -> AsyncIterator[list[StoredObject]]:
+        paginator = self._client.get_paginator("list_objects_v2")
+        pages = iter(paginator.paginate(Bucket=self.bucket, Prefix=prefix))
+        while (page := await run_io(next, pages, None)) is not None:
+            batch = [
+                StoredObject(o["Key"], int(o["Size"]), o["LastModified"].timestamp())
+                for o in page.get("Contents", [])
+            ]
+            if batch:
+                yield batch
+
+    def presign_put(
+        self, key: str, *, content_type: str, size: int, sha256: str, ttl_seconds: int
+    ) -> PresignedUpload:
+        # storage itself rejects a body whose length or SHA-256 differ
+        checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+        url = self._presigner.generate_presigned_url(
+            "put_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": key,
+                "ContentType": content_type,
+                "ContentLength": size,
+                "ChecksumSHA256": checksum,
+            },
+            ExpiresIn=ttl_seconds,
+        )
+        return PresignedUpload(
+            url=url,
+            headers={"Content-Type": content_type, "x-amz-checksum-sha256": checksum},
+            expires_at=int(time.time()) + ttl_seconds,
+        )
+
+    def presign_get(
+        self,
+        key: str,
+        *,
+        filename: str,
+        content_type: str,
+        ttl_seconds: int,
+        disposition: str = "attachment",
+    ) -> str:
+        return self._presigner.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": key,
+                "ResponseContentType": content_type,
+                "ResponseContentDisposition": (
+                    f"{disposition}; filename*=utf-8''{quote(filename)}"
+                ),
+            },
+            ExpiresIn=ttl_seconds,
+        )
+
+
+_storage: Storage | None = None
+
+
+def get_storage() -> Storage:
+    global _storage
+    if _storage is None:
+        if settings.STORAGE_BACKEND == "s3":
+            _storage = S3Storage()
+        else:
+            _storage = LocalStorage(Path(settings.UPLOAD_DIR))
+    return _storage
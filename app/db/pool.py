@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import time
+from typing import Any
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry, PoolProxiedConnection
+
+from app.core.config import settings
+from app.core.metrics import add_gauge, inc, registry, set_gauge
+
+
+CHECKOUT_WAIT = registry.histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled DB connection",
+    ("pool",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0),
+)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that reports how long callers wait for a connection.
+
+    The pool's ``logging_name`` (``pool_logging_name`` on the engine) is the
+    ``pool`` label of its metrics, so the primary and each replica are
+    reported separately under the same metric names.
+    """
+
+    @property
+    def metrics_name(self) -> str:
+        return getattr(self, "_orig_logging_name", None) or "primary"
+
+    def _do_get(self) -> Any:
+        name = self.metrics_name
+        start = time.perf_counter()
+        try:
+            rec = super()._do_get()
+        except exc.TimeoutError:
+            inc("db_pool_checkout_timeout", labels={"pool": name})
+            raise
+        CHECKOUT_WAIT.observe(time.perf_counter() - start, (name,))
+        return rec
+
+
+def _pool_gauges(pool: InstrumentedPool) -> None:
+    labels = {"pool": pool.metrics_name}
+    set_gauge("db_pool_in_use", pool.checkedout(), labels=labels)
+    # QueuePool.overflow() is negative while below pool_size
+    set_gauge("db_pool_overflow", max(0, pool.overflow()), labels=labels)
+
+
+def pool_options(url: str, name: str) -> dict[str, Any]:
+    """``create_async_engine`` keyword arguments derived from ``Settings``."""
+    opts: dict[str, Any] = {
+        "poolclass": InstrumentedPool,
+        "pool_logging_name": name,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING == "always",
+    }
+    if make_url(url).get_driver_name() == "asyncpg":
+        size = max(0, settings.DB_STATEMENT_CACHE_SIZE)
+        connect_args: dict[str, Any] = {"prepared_statement_cache_size": size}
+        if size == 0:
+            connect_args["statement_cache_size"] = 0
+        opts["connect_args"] = connect_args
+    return opts
+
+
+def instrument_pool(sync_engine: Engine) -> None:
+    """Attach checkout/checkin listeners: gauges and the ``idle`` pre-ping strategy."""
+
+    @event.listens_for(sync_engine, "checkout")
+    def _on_checkout(
+        dbapi_connection: Any,
+        record: ConnectionPoolEntry,
+        proxy: PoolProxiedConnection,
+    ) -> None:
+        pool = sync_engine.pool
+        if settings.DB_POOL_PRE_PING == "idle":
+            checked_in_at = record.info.get("checked_in_at")
+            idle = time.monotonic() - checked_in_at if checked_in_at else 0.0
+            if idle > settings.DB_POOL_PRE_PING_IDLE_SECONDS:
+                try:
+                    sync_engine.dialect.do_ping(dbapi_connection)
+                except Exception as e:
+                    if isinstance(pool, InstrumentedPool):
+                        inc("db_pool_stale_connection", labels={"pool": pool.metrics_name})
+                    # the pool discards this connection and retries with a fresh one
+                    raise exc.DisconnectionError() from e
+        if isinstance(pool, InstrumentedPool):
+            _pool_gauges(pool)
+
+    @event.listens_for(sync_engine, "checkin")
+    def _on_checkin(dbapi_connection: Any, record: ConnectionPoolEntry) -> None:
+        record.info["checked_in_at"] = time.monotonic()
+        pool = sync_engine.pool
+        if isinstance(pool, InstrumentedPool):
+            _pool_gauges(pool)
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection: Any, record: ConnectionPoolEntry) -> None:
+        pool = sync_engine.pool
+        if isinstance(pool, InstrumentedPool):
+            add_gauge("db_pool_connections", 1, labels={"pool": pool.metrics_name})
+
+    @event.listens_for(sync_engine, "close")
+    def _on_close(dbapi_connection: Any, record: ConnectionPoolEntry) -> None:
+        pool = sync_engine.pool
+        if isinstance(pool, InstrumentedPool):
+            add_gauge("db_pool_connections", -1, labels={"pool": pool.metrics_name})
@@ -1,28 +1,269 @@
-from collections.abc import AsyncIterator
+import asyncio
+import contextlib
+import hashlib
+import itertools
+import time
+from typing import Any
 
+from sqlalchemy import event, text
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
+from sqlalchemy.orm import ORMExecuteState, Session
 
 from app.core.config import settings
+from app.core.context import get_request_cost
+from app.core.exceptions import RedisUnavailable
+from app.core.logging import get_logger
+from app.core.metrics import set_gauge
+from app.db.pool import instrument_pool, pool_options
+from app.db.slow_query import slow_queries
 
 
-engine: AsyncEngine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=False,
-    pool_pre_ping=True,
-)
+logger = get_logger(__name__)
+
+
+def _track_statements(eng: AsyncEngine) -> None:
+    """Per-statement hooks: request cost accounting and the slow-query log."""
+    sync_engine = eng.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(
+        conn: Any,
+        cursor: Any,
+        statement: str,
+        params: Any,
+        context: Any,
+        executemany: bool,
+    ) -> None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(
+        conn: Any,
+        cursor: Any,
+        statement: str,
+        params: Any,
+        context: Any,
+        executemany: bool,
+    ) -> None:
+        starts = conn.info.get("query_start")
+        if not starts:
+            return
+        elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+        cost = get_request_cost()
+        if cost is not None:
+            cost.add_sql(elapsed_ms)
+        if elapsed_ms >= settings.DB_SLOW_QUERY_MS > 0 and not statement.startswith(
+            "EXPLAIN"
+        ):
+            slow_queries.record(eng, statement, params, executemany, elapsed_ms)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _on_error(exception_context: Any) -> None:
+        conn = exception_context.connection
+        starts = conn.info.get("query_start") if conn is not None else None
+        if starts:
+            starts.pop()
+
+
+def _create_engine(url: str, name: str) -> AsyncEngine:
+    eng = create_async_engine(url, echo=False, **pool_options(url, name))
+    instrument_pool(eng.sync_engine)
+    _track_statements(eng)
+    return eng
+
+
+engine: AsyncEngine = _create_engine(settings.DATABASE_URL, "primary")
+
+
+class PrimarySession(Session):
+    """Session bound to the primary; remembers whether it wrote anything."""
+
+
+@event.listens_for(PrimarySession, "after_flush")
+def _flag_flush_write(session: Session, _flush_context: Any) -> None:
+    session.info["wrote"] = True
+
+
+@event.listens_for(PrimarySession, "do_orm_execute")
+def _flag_statement_write(state: ORMExecuteState) -> None:
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info["wrote"] = True
+
 
 AsyncSessionLocal = async_sessionmaker(
     bind=engine,
     expire_on_commit=False,
     class_=AsyncSession,
+    sync_session_class=PrimarySession,
+)
+
+ReplicaSessionLocal = async_sessionmaker(
+    expire_on_commit=False,
+    class_=AsyncSession,
 )
 
 
-async def get_db() -> AsyncIterator[AsyncSession]:
-    async with AsyncSessionLocal() as session:
-        yield session
+async def release_connection(db: AsyncSession) -> None:
+    """End the current transaction so the pooled connection is returned now.
+
+    Sessions only check a connection out on their first statement, and with
+    ``expire_on_commit=False`` loaded objects stay usable afterwards. Calling
+    this once the DB phase of a request is over keeps Redis, pub/sub, SMTP and
+    file I/O from pinning a pool slot; a later query simply checks out again.
+    """
+    if db.in_transaction():
+        await db.commit()
+
+
+# -------- Read replicas --------
+
+# 0 on a primary or on a replica that has replayed everything it received;
+# otherwise the age of the last replayed transaction.
+_REPLICA_LAG_SQL = text(
+    "SELECT CASE"
+    " WHEN NOT pg_is_in_recovery() THEN 0"
+    " WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+    " ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+    " END"
+)
+
+
+class _Replica:
+    __slots__ = ("index", "engine", "healthy", "lag_seconds")
+
+    def __init__(self, index: int, engine: AsyncEngine) -> None:
+        self.index = index
+        self.engine = engine
+        self.healthy = True
+        self.lag_seconds = 0.0
+
+
+class ReplicaRouter:
+    """Round-robins read-only sessions over replicas that keep up with the primary.
+
+    A background task polls each replica's replay lag; replicas that lag more
+    than ``DB_REPLICA_MAX_LAG_SECONDS`` or fail the probe are taken out of
+    rotation until they recover. With no healthy replica, reads go to the primary.
+    """
+
+    def __init__(self, urls: list[str]) -> None:
+        self._replicas = [
+            _Replica(i, _create_engine(u, f"replica_{i}")) for i, u in enumerate(urls)
+        ]
+        self._rr = itertools.count()
+        self._task: asyncio.Task[None] | None = None
+
+    def pick(self) -> AsyncEngine | None:
+        healthy = [r for r in self._replicas if r.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._rr) % len(healthy)].engine
+
+    @staticmethod
+    async def _lag(replica: _Replica) -> float:
+        async with replica.engine.connect() as conn:
+            return float((await conn.execute(_REPLICA_LAG_SQL)).scalar_one())
+
+    async def _probe(self, replica: _Replica) -> None:
+        try:
+            # an unreachable host must not stall startup or the polling loop
+            lag = await asyncio.wait_for(
+                self._lag(replica), timeout=settings.DB_REPLICA_PROBE_TIMEOUT_SECONDS
+            )
+        except Exception as e:  # noqa: BLE001
+            lag = float("inf")
+            if replica.healthy:
+                logger.warning(
+                    "replica probe failed: %s",
+                    str(e) or type(e).__name__,
+                    extra={"replica": replica.index},
+                )
+        healthy = lag <= settings.DB_REPLICA_MAX_LAG_SECONDS
+        if healthy != replica.healthy:
+            logger.warning(
+                "replica %s" % ("restored" if healthy else "ejected"),
+                extra={"replica": replica.index, "lag_seconds": lag},
+            )
+        replica.healthy = healthy
+        replica.lag_seconds = lag
+        set_gauge(
+            "db_replica_lag_seconds",
+            min(lag, 1e9),
+            labels={"pool": f"replica_{replica.index}"},
+        )
+
+    async def check(self) -> None:
+        await asyncio.gather(*(self._probe(r) for r in self._replicas))
+        set_gauge("db_replicas_healthy", sum(1 for r in self._replicas if r.healthy))
+
+    async def _run(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(settings.DB_REPLICA_CHECK_INTERVAL_SECONDS)
+
+    async def start(self) -> None:
+        if self._task is None:
+            await self.check()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        for r in self._replicas:
+            await r.engine.dispose()
+
+
+replica_router: ReplicaRouter | None = (
+    ReplicaRouter(settings.DATABASE_REPLICA_URLS)
+    if settings.DATABASE_REPLICA_URLS
+    else None
+)
+
+
+def _ryw_key(sticky_key: str) -> str:
+    digest = hashlib.sha1(sticky_key.encode()).hexdigest()
+    return f"db:ryw:{digest}"
+
+
+async def mark_read_your_writes(sticky_key: str) -> None:
+    """Pin this caller's reads to the primary for a short window after a write."""
+    if replica_router is None:
+        return
+    from app.core.redis import redis_call
+
+    key = _ryw_key(sticky_key)
+    ttl_ms = int(settings.DB_READ_YOUR_WRITES_SECONDS * 1000)
+    try:
+        await redis_call(lambda r: r.set(key, b"1", px=ttl_ms))
+    except RedisUnavailable:
+        logger.warning("failed to mark read-your-writes window")
+
+
+async def _is_primary_sticky(sticky_key: str) -> bool:
+    from app.core.redis import redis_call
+
+    key = _ryw_key(sticky_key)
+    try:
+        return bool(await redis_call(lambda r: r.exists(key)))
+    except RedisUnavailable:
+        # cannot tell whether the caller just wrote: stay on the safe side
+        return True
+
+
+async def open_read_session(sticky_key: str | None) -> AsyncSession:
+    if replica_router is None:
+        return AsyncSessionLocal()
+    target = replica_router.pick()
+    if target is None:
+        return AsyncSessionLocal()
+    if sticky_key and await _is_primary_sticky(sticky_key):
+        return AsyncSessionLocal()
+    return ReplicaSessionLocal(bind=target)
@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import random
+import re
+import time
+from collections.abc import Mapping, Sequence
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+from app.core.context import get_request_id
+from app.core.logging import get_logger
+from app.core.metrics import inc
+
+
+logger = get_logger("app.db.slow_query")
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"\$\d+|%\([^)]+\)s|%s|(?<!:):\w+|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+# a fingerprint gets at most one EXPLAIN per this many seconds
+_EXPLAIN_INTERVAL_SECONDS = 300.0
+
+
+def normalize_statement(statement: str) -> str:
+    """Collapse literals, bind markers and IN-lists so equal queries group together."""
+    s = _STRING.sub("?", statement)
+    s = _PLACEHOLDER.sub("?", s)
+    s = _NUMBER.sub("?", s)
+    s = _IN_LIST.sub("(?...)", s)
+    return _WHITESPACE.sub(" ", s).strip()
+
+
+def params_shape(params: Any, executemany: bool) -> str:
+    """Types of the bound parameters, never their values."""
+    if executemany and isinstance(params, Sequence) and not isinstance(params, (str, bytes)):
+        rows = list(params)
+        first = params_shape(rows[0], False) if rows else "()"
+        return f"{len(rows)} x {first}"
+    if isinstance(params, Mapping):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in params.items()) + "}"
+    if isinstance(params, Sequence) and not isinstance(params, (str, bytes)):
+        return "(" + ", ".join(type(v).__name__ for v in params) + ")"
+    return "()" if params is None else type(params).__name__
+
+
+class _Fingerprint:
+    __slots__ = (
+        "fingerprint",
+        "statement",
+        "params_shape",
+        "count",
+        "total_ms",
+        "max_ms",
+        "last_seen",
+        "last_request_id",
+        "plan",
+        "plan_at",
+        "explain_pending",
+    )
+
+    def __init__(self, fingerprint: str, statement: str, shape: str) -> None:
+        self.fingerprint = fingerprint
+        self.statement = statement
+        self.params_shape = shape
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_seen: datetime | None = None
+        self.last_request_id: str | None = None
+        self.plan: Any = None
+        self.plan_at = 0.0
+        self.explain_pending = False
+
+
+class SlowQueryLog:
+    """Aggregates statements slower than ``DB_SLOW_QUERY_MS`` by fingerprint.
+
+    Each slow execution is logged. For a sampled subset of SELECTs an
+    ``EXPLAIN (FORMAT JSON)`` is run on a separate pooled connection, at most
+    ``DB_SLOW_QUERY_EXPLAIN_CONCURRENCY`` at a time, and kept with the entry.
+    Only the ``DB_SLOW_QUERY_TOP_N`` fingerprints with the most total time are
+    retained.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[str, _Fingerprint] = {}
+        self._explain_slots = asyncio.Semaphore(
+            max(1, settings.DB_SLOW_QUERY_EXPLAIN_CONCURRENCY)
+        )
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    def record(
+        self,
+        engine: AsyncEngine,
+        statement: str,
+        params: Any,
+        executemany: bool,
+        duration_ms: float,
+    ) -> None:
+        normalized = normalize_statement(statement)
+        fingerprint = hashlib.sha1(normalized.encode()).hexdigest()[:16]
+        shape = params_shape(params, executemany)
+        request_id = get_request_id()
+        inc("db_slow_queries")
+        logger.warning(
+            "slow query",
+            extra={
+                "fingerprint": fingerprint,
+                "duration_ms": round(duration_ms, 1),
+                "statement": normalized[:2000],
+                "params_shape": shape[:500],
+                "request_id": request_id,
+            },
+        )
+
+        entry = self._entries.get(fingerprint)
+        if entry is None:
+            entry = _Fingerprint(fingerprint, normalized[:2000], shape[:500])
+            self._entries[fingerprint] = entry
+        entry.count += 1
+        entry.total_ms += duration_ms
+        entry.max_ms = max(entry.max_ms, duration_ms)
+        entry.last_seen = datetime.now(timezone.utc)
+        entry.last_request_id = request_id
+        # evict only once the new entry carries its own time, so it competes
+        # with the others instead of always being the coldest
+        self._evict()
+        if fingerprint not in self._entries:
+            return
+
+        if self._should_explain(entry, statement, executemany):
+            self._schedule_explain(engine, entry, statement, params)
+
+    def _evict(self) -> None:
+        limit = max(1, settings.DB_SLOW_QUERY_TOP_N)
+        while len(self._entries) > limit:
+            coldest = min(self._entries.values(), key=lambda e: e.total_ms)
+            self._entries.pop(coldest.fingerprint, None)
+
+    def _should_explain(self, entry: _Fingerprint, statement: str, executemany: bool) -> bool:
+        if executemany or entry.explain_pending:
+            return False
+        head = statement.lstrip()[:6].upper()
+        # plain EXPLAIN never executes, but keep to reads so a planner bug or a
+        # volatile function in DML can never have side effects
+        if head not in ("SELECT", "WITH") or "FOR UPDATE" in statement.upper():
+            return False
+        if time.monotonic() - entry.plan_at < _EXPLAIN_INTERVAL_SECONDS and entry.plan:
+            return False
+        return random.random() < settings.DB_SLOW_QUERY_EXPLAIN_SAMPLE_RATE
+
+    def _schedule_explain(
+        self, engine: AsyncEngine, entry: _Fingerprint, statement: str, params: Any
+    ) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        entry.explain_pending = True
+        task = loop.create_task(self._explain(engine, entry, statement, params))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _explain(
+        self, engine: AsyncEngine, entry: _Fingerprint, statement: str, params: Any
+    ) -> None:
+        try:
+            async with self._explain_slots:
+                async with engine.connect() as conn:
+                    result = await asyncio.wait_for(
+                        conn.exec_driver_sql(
+                            "EXPLAIN (FORMAT JSON) " + statement,
+                            params if params is not None else (),
+                        ),
+                        timeout=5.0,
+                    )
+                    plan = result.scalar()
+            entry.plan = plan
+            entry.plan_at = time.monotonic()
+            inc("db_slow_query_explains")
+        except Exception as e:  # noqa: BLE001
+            inc("db_slow_query_explain_failed")
+            logger.info(
+                "explain failed: %s", type(e).__name__, extra={"fingerprint": entry.fingerprint}
+            )
+        finally:
+            entry.explain_pending = False
+
+    def top(self, limit: int) -> list[dict[str, Any]]:
+        entries = sorted(self._entries.values(), key=lambda e: e.total_ms, reverse=True)
+        return [
+            {
+                "fingerprint": e.fingerprint,
+                "statement": e.statement,
+                "params_shape": e.params_shape,
+                "count": e.count,
+                "total_ms": round(e.total_ms, 2),
+                "mean_ms": round(e.total_ms / e.count, 2) if e.count else 0.0,
+                "max_ms": round(e.max_ms, 2),
+                "last_seen": e.last_seen,
+                "last_request_id": e.last_request_id,
+                "plan": e.plan,
+            }
+            for e in entries[: max(0, limit)]
+        ]
+
+    def reset(self) -> None:
+        self._entries.clear()
+
+
+slow_queries = SlowQueryLog()
@@ -1,3 +1,6 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from typing import cast
@@ -9,6 +12,8 @@ from app.api.routers.auth import router as auth_router
 from app.api.routers.health import router as health_router
 from app.api.routers.chat import router as chat_router
 from app.api.routers.profile import router as profile_router
+from app.api.routers.debug import router as debug_router
+from app.api.routers.storage import router as storage_router
 from app.api.exception_handlers import (
     http_exception_handler,
     app_exception_handler,
@@ -20,9 +25,64 @@ from app.api.exception_handlers import (
 from app.core.exceptions import AppException
 from app.api.middlewares import RequestContextMiddleware
 from app.core.logging import configure_logging
+from app.services.mail_worker import (
+    get_mail_worker,
+    mail_worker_enabled,
+    stop_mail_worker,
+)
+from app.db.session import replica_router
+from app.services.upload_sessions import start_upload_reaper, stop_upload_reaper
+from app.services.resume_indexer import start_resume_indexer, stop_resume_indexer
+from app.services.attachment_scanner import (
+    start_attachment_scanner,
+    stop_attachment_scanner,
+)
+from app.services.file_gc import start_file_gc, stop_file_gc
+from app.core.executors import shutdown_executors
+from app.core.storage import get_storage
+from app.core.loop_monitor import start_loop_monitor, stop_loop_monitor
+from app.core.metrics_sync import (
+    metrics_multiprocess_enabled,
+    start_metrics_flusher,
+    stop_metrics_flusher,
+)
 from sqlalchemy.exc import SQLAlchemyError
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # a misconfigured storage backend fails startup, not the first upload
+    get_storage()
+    if settings.LOOP_MONITOR_ENABLED:
+        await start_loop_monitor()
+    if replica_router is not None:
+        await replica_router.start()
+    if mail_worker_enabled():
+        await get_mail_worker()
+    if metrics_multiprocess_enabled():
+        await start_metrics_flusher()
+    await start_upload_reaper()
+    if settings.RESUME_INDEX_ENABLED:
+        await start_resume_indexer()
+    # runs even with ATTACHMENT_SCANNER="none", to release anything still queued
+    await start_attachment_scanner()
+    if settings.FILE_GC_ENABLED:
+        await start_file_gc()
+    try:
+        yield
+    finally:
+        await stop_file_gc()
+        await stop_attachment_scanner()
+        await stop_resume_indexer()
+        await stop_upload_reaper()
+        await stop_metrics_flusher()
+        await stop_mail_worker()
+        if replica_router is not None:
+            await replica_router.stop()
+        shutdown_executors()
+        await stop_loop_monitor()
+
+
 def create_app() -> FastAPI:
     configure_logging()
     app = FastAPI(
@@ -32,6 +92,7 @@ def create_app() -> FastAPI:
             "defaultModelsExpandDepth": -1,
         },
         middleware=[Middleware(RequestContextMiddleware)],
+        lifespan=lifespan,
     )
 
     # CORS
@@ -58,6 +119,9 @@ def create_app() -> FastAPI:
     app.include_router(health_router, prefix="/api", tags=["health"])
     app.include_router(chat_router, prefix="/api/chat", tags=["chat"])
     app.include_router(profile_router, prefix="/api/profile", tags=["profile"])
+    app.include_router(debug_router, prefix="/api/debug", tags=["debug"])
+    if settings.STORAGE_BACKEND == "local":
+        app.include_router(storage_router, prefix="/api/storage", tags=["storage"])
 
     # Exception handlers
     from fastapi.exceptions import RequestValidationError
@@ -1,8 +1,9 @@
 from .user import User
 from .refresh_token import RefreshToken
 from .chat import ChatRoom, ChatParticipant, Message
-from .attachment import Attachment
+from .attachment import Attachment, AttachmentBlob
 from .user_resume import UserResume
+from .mail_outbox import MailOutbox
 
 __all__ = [
     "User",
@@ -11,5 +12,7 @@ __all__ = [
     "ChatParticipant",
     "Message",
     "Attachment",
+    "AttachmentBlob",
     "UserResume",
+    "MailOutbox",
 ]
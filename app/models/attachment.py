@@ -1,13 +1,63 @@
 from datetime import datetime
 
-from sqlalchemy import ForeignKey, String, Text, BigInteger, func
+from sqlalchemy import ForeignKey, Index, Integer, String, Text, BigInteger, func, text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.db.base import Base
 
 
+class AttachmentBlob(Base):
+    """One stored file per distinct content, shared by every attachment with it.
+
+    ``ref_count`` is maintained by a trigger on ``attachments`` (see migration
+    20251101_000006), never by the application; a blob at zero references is
+    removed by garbage collection once ``unreferenced_at`` is old enough.
+    """
+
+    __tablename__ = "attachment_blobs"
+    __table_args__ = (
+        Index(
+            "ix_attachment_blobs_unreferenced",
+            "unreferenced_at",
+            postgresql_where=text("ref_count = 0"),
+        ),
+    )
+
+    checksum: Mapped[str] = mapped_column(String(64), primary_key=True)
+    storage_key: Mapped[str] = mapped_column(Text)
+    size_bytes: Mapped[int] = mapped_column(BigInteger)
+    ref_count: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(default=func.now())
+    unreferenced_at: Mapped[datetime | None] = mapped_column()
+
+
 class Attachment(Base):
+    """An uploaded file.
+
+    ``status`` runs ``uploading`` (resumable or direct upload in progress) ->
+    ``pending`` (stored, waiting for the scanner) -> ``scanning`` -> ``ready``,
+    or ends in ``infected`` / ``failed``. Only ``ready`` files are served.
+    """
+
     __tablename__ = "attachments"
+    __table_args__ = (
+        Index(
+            "ix_attachments_uploading_expires_at",
+            "expires_at",
+            postgresql_where=text("status = 'uploading'"),
+        ),
+        Index(
+            "ix_attachments_scan_due",
+            "scan_next_attempt_at",
+            postgresql_where=text("status IN ('pending', 'scanning')"),
+        ),
+        # orphan GC: uploads never linked to a message, oldest first
+        Index(
+            "ix_attachments_unlinked_created_at",
+            "created_at",
+            postgresql_where=text("message_id IS NULL"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     message_id: Mapped[int | None] = mapped_column(
@@ -16,11 +66,23 @@ class Attachment(Base):
     uploader_id: Mapped[int] = mapped_column(
         ForeignKey("users.id", ondelete="CASCADE"), index=True
     )
+    # for blob-backed rows this is the blob's storage_key
     s3_key: Mapped[str] = mapped_column(Text)
     filename: Mapped[str] = mapped_column(String(255))
     content_type: Mapped[str] = mapped_column(String(127))
     size_bytes: Mapped[int] = mapped_column(BigInteger)
     status: Mapped[str] = mapped_column(String(16), default="pending", index=True)
-    checksum: Mapped[str | None] = mapped_column(String(128))
+    checksum: Mapped[str | None] = mapped_column(
+        String(128),
+        ForeignKey("attachment_blobs.checksum", ondelete="RESTRICT"),
+        index=True,
+    )
     created_at: Mapped[datetime] = mapped_column(default=func.now(), index=True)
     scanned_at: Mapped[datetime | None] = mapped_column()
+    # scanner lease and retries, as in mail_outbox
+    scan_attempts: Mapped[int] = mapped_column(Integer, default=0)
+    scan_next_attempt_at: Mapped[datetime] = mapped_column(default=func.now())
+    # resumable uploads: parts are part_size bytes (the last may be shorter);
+    # a session still uploading at expires_at is discarded
+    part_size: Mapped[int | None] = mapped_column(Integer)
+    expires_at: Mapped[datetime | None] = mapped_column()
@@ -2,7 +2,19 @@ from __future__ import annotations
 
 from datetime import datetime
 
-from sqlalchemy import ForeignKey, Boolean, func
+from sqlalchemy import (
+    Boolean,
+    Computed,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.db.base import Base
@@ -10,6 +22,16 @@ from app.db.base import Base
 
 class UserResume(Base):
     __tablename__ = "user_resumes"
+    __table_args__ = (
+        Index("ix_user_resumes_search_vector", "search_vector", postgresql_using="gin"),
+        # attachment deletes cascade here; orphan GC checks for a resume
+        Index("ix_user_resumes_attachment_id", "attachment_id"),
+        Index(
+            "ix_user_resumes_text_due",
+            "text_next_attempt_at",
+            postgresql_where=text("text_status IN ('pending', 'extracting')"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(
@@ -20,3 +42,17 @@ class UserResume(Base):
     )
     is_current: Mapped[bool] = mapped_column(Boolean, default=True, index=True)
     created_at: Mapped[datetime] = mapped_column(default=func.now(), index=True)
+    # Text extraction, done by the resume indexer and never in a request:
+    # pending -> extracting -> indexed | unsupported | failed. A stale
+    # "extracting" row is re-claimed once its lease (text_next_attempt_at)
+    # has passed.
+    text_status: Mapped[str] = mapped_column(String(16), default="pending")
+    text_attempts: Mapped[int] = mapped_column(Integer, default=0)
+    text_next_attempt_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=func.now()
+    )
+    content_text: Mapped[str | None] = mapped_column(Text)
+    search_vector: Mapped[str | None] = mapped_column(
+        TSVECTOR,
+        Computed("to_tsvector('simple', coalesce(content_text, ''))", persisted=True),
+    )
@@ -23,6 +23,27 @@ class WSChatMessage(WSMessage):
     attachments: list["AttachmentOut"] = []
 
 
+class WSAttachmentStatus(WSMessage):
+    # sent when an attachment of a message leaves scanning (ready or not)
+    room_id: int
+    message_id: int
+    attachment: "AttachmentOut"
+
+
+class WSTicketIn(BaseModel):
+    room_ids: list[int] | None = None
+
+
+class WSTicketOut(BaseModel):
+    ticket: str
+    expires_in: int
+
+
+class WSTicket(BaseModel):
+    user_id: int
+    room_ids: list[int]
+
+
 class MessageCreate(BaseModel):
     room_id: int
     content: str | None = Field(default=None, max_length=5000)
@@ -72,6 +93,47 @@ class AttachmentInitIn(BaseModel):
 class AttachmentInitOut(BaseModel):
     attachment_id: int
     upload_url: str
+    part_size: int
+    part_count: int
+    expires_at: datetime
+
+
+class UploadPartOut(BaseModel):
+    part_number: int
+    size: int
+    sha256: str
+
+
+class UploadSessionOut(BaseModel):
+    attachment_id: int
+    status: str
+    part_size: int
+    part_count: int
+    received_parts: list[int]
+    expires_at: datetime | None = None
+
+
+class DirectUploadIn(BaseModel):
+    filename: str
+    content_type: str
+    size: int
+    # hex SHA-256 of the whole file; storage accepts only these bytes
+    sha256: str
+
+
+class PresignedUploadOut(BaseModel):
+    url: str
+    method: str
+    headers: dict[str, str]
+    expires_at: int
+
+
+class DirectUploadOut(BaseModel):
+    attachment_id: int
+    status: str
+    # None when the content is already stored and there is nothing to upload
+    upload: PresignedUploadOut | None = None
+    expires_at: datetime | None = None
 
 
 class AttachmentOut(BaseModel):
@@ -100,6 +162,8 @@ class PeerOut(BaseModel):
     email: str
     name: str | None = None
     avatar_url: str | None = None
+    # size in px -> URL
+    avatar_urls: dict[str, str] | None = None
 
 
 class RoomSummaryOut(BaseModel):
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Mapping
+from typing import Any, Mapping
 
 from pydantic import BaseModel
 
@@ -10,5 +10,6 @@ class AckOut(BaseModel):
 
 
 class MetricsOut(BaseModel):
-    counters: Mapping[str, int]
+    counters: Mapping[str, int | float]
     gauges: Mapping[str, float]
+    histograms: Mapping[str, Mapping[str, Any]] = {}
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any
+
+from pydantic import BaseModel
+
+
+class TimingOut(BaseModel):
+    function: str
+    count: int
+    total_ms: float
+    mean_ms: float
+    p50_ms: float | None = None
+    p95_ms: float | None = None
+    p99_ms: float | None = None
+
+
+class SlowQueryOut(BaseModel):
+    fingerprint: str
+    statement: str
+    params_shape: str
+    count: int
+    total_ms: float
+    mean_ms: float
+    max_ms: float
+    last_seen: datetime | None = None
+    last_request_id: str | None = None
+    plan: Any = None
+
+
+class WSConnectionMemoryOut(BaseModel):
+    room_id: int | None = None
+    queued_messages: int
+    queued_bytes: int
+    peak_queued_bytes: int
+    dropped: int
+    estimate_bytes: int
+
+
+class WSMemoryOut(BaseModel):
+    connections: int
+    rooms: int
+    queued_messages: int
+    queued_bytes: int
+    estimate_bytes_total: int
+    estimate_bytes_avg: int
+    top: list[WSConnectionMemoryOut]
+
+
+class ModuleAllocationOut(BaseModel):
+    module: str
+    size_bytes: int
+    count: int
+    size_diff_bytes: int = 0
+    count_diff: int = 0
+
+
+class TracemallocOut(BaseModel):
+    tracing: bool
+    traced_current_bytes: int
+    traced_peak_bytes: int
+    overhead_bytes: int
+    has_baseline: bool
+    modules: list[ModuleAllocationOut] = []
+
+
+class BlobGCOut(BaseModel):
+    deleted: int
+    reclaimed_bytes: int
+
+
+class FileGCOut(BaseModel):
+    orphan_attachments: int = 0
+    superseded_resumes: int = 0
+    blobs: int = 0
+    # files under blobs/ without a row, registered as unreferenced blobs
+    stray_blobs: int = 0
+    avatar_files: int = 0
+    # pre-blob-store attachment files no row references
+    unowned_files: int = 0
+    temp_files: int = 0
+    part_dirs: int = 0
+    reconciled: bool = False
+    reclaimed_bytes: int = 0
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import re
 from datetime import datetime
 from pydantic import (
     BaseModel,
@@ -11,6 +12,44 @@ from pydantic import (
     SecretStr,
 )
 
+from app.core.config import settings
+
+
+# avatar_path of a processed avatar: "avatars/<user id>/<content version>"
+_AVATAR_PATH = re.compile(r"^avatars/\d+/[0-9a-f]{16}$")
+# an original stored before thumbnails, as a storage key ("avatars/<name>")
+# or, older still, a path under UPLOAD_DIR ("uploads/avatars/<name>")
+_LEGACY_AVATAR_PATH = re.compile(r"(?:^|/)avatars/(\d+_\d{14}\.(?:jpg|png))$")
+
+
+def avatar_urls(avatar_path: str | None) -> dict[str, str] | None:
+    """Size (px, as a string) -> URL of that rendition; None without an avatar.
+
+    The path changes with the image, so the URLs can be cached forever. An
+    avatar uploaded before thumbnails has only its original, served at
+    every size until the user uploads a new one.
+    """
+    if not avatar_path:
+        return None
+    base = settings.BACKEND_PUBLIC_BASE_URL or ""
+    if not _AVATAR_PATH.match(avatar_path):
+        legacy = _LEGACY_AVATAR_PATH.search(avatar_path)
+        if legacy is None:
+            return None
+        url = f"{base}/api/profile/avatars/{legacy.group(1)}"
+        return {str(size): url for size in settings.AVATAR_SIZES}
+    return {
+        str(size): f"{base}/api/profile/{avatar_path}/{size}.webp"
+        for size in settings.AVATAR_SIZES
+    }
+
+
+def avatar_url(avatar_path: str | None) -> str | None:
+    urls = avatar_urls(avatar_path)
+    if urls is None:
+        return None
+    return urls.get(str(settings.AVATAR_DEFAULT_SIZE)) or next(iter(urls.values()))
+
 
 class UserCreate(BaseModel):
     email: EmailStr
@@ -38,7 +77,12 @@ class UserOut(BaseModel):
     @computed_field  # type: ignore[misc]
     @property
     def avatar_url(self) -> str | None:
-        return self.avatar_path
+        return avatar_url(self.avatar_path)
+
+    @computed_field  # type: ignore[misc]
+    @property
+    def avatar_urls(self) -> dict[str, str] | None:
+        return avatar_urls(self.avatar_path)
 
 
 class UserUpdate(BaseModel):
@@ -65,5 +109,19 @@ class ResumeVersionOut(BaseModel):
     size_bytes: int
     created_at: datetime
     path: str
+    # pending | extracting | indexed | unsupported | failed
+    text_status: str | None = None
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class ResumeSearchHitOut(BaseModel):
+    user_id: int
+    name: str | None = None
+    email: EmailStr
+    resume_id: int
+    attachment_id: int
+    filename: str
+    rank: float
+    # matching fragments as HTML-escaped text, terms wrapped in <b></b>
+    snippet: str
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+from datetime import timezone
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, RedirectResponse
+
+from app.core.config import settings
+from app.core.exceptions import NotFound
+from app.core.executors import run_io
+from app.core.security import DownloadGrant, sign_download
+from app.core.storage import get_storage
+from app.models.attachment import Attachment
+
+
+# a ready attachment's bytes never change, so any copy may be kept for good
+CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+def download_grant(att: Attachment) -> DownloadGrant:
+    created = att.created_at
+    if created is not None and created.tzinfo is None:
+        # naive columns hold the DB server's now(), which runs in UTC
+        created = created.replace(tzinfo=timezone.utc)
+    return DownloadGrant(
+        attachment_id=int(att.id),
+        key=att.s3_key,
+        filename=att.filename,
+        content_type=att.content_type,
+        checksum=att.checksum,
+        modified=int(created.timestamp()) if created is not None else None,
+    )
+
+
+def attachment_url(att: Attachment) -> str:
+    """URL a client fetches the attachment from.
+
+    With ``ATTACHMENT_SIGNED_URLS`` this is a short-lived signed link (straight
+    to storage when the backend presigns downloads); callers must only mint
+    one after checking that the user may read the attachment.
+    """
+    base = settings.BACKEND_PUBLIC_BASE_URL or ""
+    if not settings.ATTACHMENT_SIGNED_URLS or att.status != "ready":
+        return f"{base}/api/chat/attachments/{att.id}/download"
+    ttl = settings.ATTACHMENT_URL_TTL_SECONDS
+    direct = get_storage().presign_get(
+        att.s3_key, filename=att.filename, content_type=att.content_type, ttl_seconds=ttl
+    )
+    if direct is not None:
+        return direct
+    token, _ = sign_download(download_grant(att), ttl)
+    return f"{base}/api/chat/attachments/{att.id}/file?token={token}"
+
+
+def _content_disposition(filename: str, disposition: str = "attachment") -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition}; filename*=utf-8''{quoted}"
+    return f'{disposition}; filename="{filename}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # weak comparison (RFC 9110 13.1.2): W/ prefixes are ignored
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def _not_modified(request: Request, etag: str | None, modified: int | None) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-Modified-Since is ignored whenever If-None-Match is present
+        return etag is not None and _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return modified <= int(since.timestamp())
+
+
+async def serve_file(request: Request, grant: DownloadGrant) -> Response:
+    """Send a stored attachment, honouring conditional and Range requests.
+
+    Validators come from the stored checksum and creation time, so a
+    revalidation is answered with 304 before the file is even looked at.
+    """
+    return await serve_stored(
+        request,
+        grant.key,
+        filename=grant.filename,
+        content_type=grant.content_type,
+        etag=f'"{grant.checksum}"' if grant.checksum else None,
+        modified=grant.modified,
+    )
+
+
+async def serve_stored(
+    request: Request,
+    key: str,
+    *,
+    filename: str,
+    content_type: str,
+    etag: str | None,
+    modified: int | None,
+    cache_control: str = CACHE_CONTROL,
+    disposition: str = "attachment",
+) -> Response:
+    """Send the object at ``key`` with the given validators.
+
+    Range, multi-range and If-Range are handled by ``FileResponse`` (or by
+    nginx in ``accel`` mode) against the same ETag. Backends without local
+    files answer with a redirect to a presigned storage URL instead.
+    """
+    headers = {"Cache-Control": cache_control}
+    if etag is not None:
+        headers["ETag"] = etag
+    if modified is not None:
+        headers["Last-Modified"] = formatdate(modified, usegmt=True)
+
+    if _not_modified(request, etag, modified):
+        return Response(status_code=304, headers=headers)
+
+    storage = get_storage()
+    path = storage.local_path(key)
+    if path is None:
+        ttl = settings.ATTACHMENT_URL_TTL_SECONDS
+        url = storage.presign_get(
+            key,
+            filename=filename,
+            content_type=content_type,
+            ttl_seconds=ttl,
+            disposition=disposition,
+        )
+        if url is None:
+            raise NotFound("file missing")
+        # a cached redirect must not outlive the presigned URL it points to
+        return RedirectResponse(
+            url, status_code=307, headers={"Cache-Control": f"private, max-age={ttl // 2}"}
+        )
+
+    if settings.ATTACHMENT_DELIVERY == "accel":
+        headers["X-Accel-Redirect"] = settings.ATTACHMENT_ACCEL_PREFIX + quote(key)
+        headers["Content-Disposition"] = _content_disposition(filename, disposition)
+        return Response(status_code=200, media_type=content_type, headers=headers)
+
+    try:
+        stat_result = await run_io(path.stat)
+    except FileNotFoundError:
+        raise NotFound("file missing") from None
+    return FileResponse(
+        path,
+        media_type=content_type,
+        filename=filename,
+        headers=headers,
+        stat_result=stat_result,
+        content_disposition_type=disposition,
+    )
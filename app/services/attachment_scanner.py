@@ -0,0 +1,357 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.exceptions import RedisUnavailable
+from app.core.executors import run_cpu, run_io
+from app.core.logging import get_logger
+from app.core.metrics import inc, observe, set_gauge
+from app.core.redis import publish_model
+from app.core.scanning import scan_file
+from app.core.storage import get_storage
+from app.db.session import AsyncSessionLocal
+from app.models.attachment import Attachment
+from app.models.chat import Message
+from app.schemas.chat import AttachmentOut, WSAttachmentStatus
+from app.services.attachment_delivery import attachment_url
+
+
+_ACTIVE_STATUSES = ("pending", "scanning")
+# verdicts that are a property of the content, shared by every attachment of a blob
+_FINAL_STATUSES = ("ready", "infected")
+
+
+class Scanner(ABC):
+    """Decides whether a stored object may be served."""
+
+    @abstractmethod
+    async def scan(self, key: str) -> str | None:
+        """Name of the threat found in the object at ``key``, or None if clean.
+
+        Raises if the object could not be scanned; the scan is retried.
+        """
+
+
+class SignatureScanner(Scanner):
+    """Local stand-in for a real engine: byte signatures, in the CPU pool.
+
+    Local objects are read in place; remote ones are downloaded to a temp
+    file under ``UPLOAD_DIR`` first, so no file is ever held in memory.
+    """
+
+    async def scan(self, key: str) -> str | None:
+        storage = get_storage()
+        path = storage.local_path(key)
+        if path is not None:
+            return await run_cpu(scan_file, str(path))
+        tmp = Path(settings.UPLOAD_DIR) / ".tmp" / uuid.uuid4().hex
+        try:
+            await storage.get_file(key, tmp)
+            return await run_cpu(scan_file, str(tmp))
+        finally:
+            await run_io(tmp.unlink, True)
+
+
+_scanner: Scanner | None = None
+
+
+def get_scanner() -> Scanner | None:
+    """The configured scanner, or None when scanning is turned off."""
+    global _scanner
+    if settings.ATTACHMENT_SCANNER == "none":
+        return None
+    if _scanner is None:
+        _scanner = SignatureScanner()
+    return _scanner
+
+
+def status_after_upload() -> str:
+    """Status of an attachment whose bytes were just stored."""
+    return "ready" if settings.ATTACHMENT_SCANNER == "none" else "pending"
+
+
+def _utcnow() -> datetime:
+    # attachments uses naive columns holding UTC, like the DB's now()
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _result(
+    attachment_id: int, status: str, next_attempt_at: datetime, scanned_at: datetime | None
+) -> dict[str, object]:
+    return {
+        "id": attachment_id,
+        "status": status,
+        "scan_next_attempt_at": next_attempt_at,
+        "scanned_at": scanned_at,
+    }
+
+
+class AttachmentScanWorker:
+    """Moves stored attachments from ``pending`` to ``ready`` (or ``infected``).
+
+    Rows are claimed with ``FOR UPDATE SKIP LOCKED`` and leased by pushing
+    ``scan_next_attempt_at`` forward, as the mail outbox worker does, so every
+    app process can run one. Each distinct blob in a batch is scanned once,
+    at most ``ATTACHMENT_SCAN_CONCURRENCY`` at a time, and a blob that already
+    has a verdict is not scanned again. When an attachment of a sent message
+    settles, its room gets a ``WSAttachmentStatus`` event: sending a message
+    never waits for the scan.
+    """
+
+    def __init__(
+        self, db_factory: async_sessionmaker[AsyncSession] = AsyncSessionLocal
+    ) -> None:
+        self._db_factory = db_factory
+        self._wake = asyncio.Event()
+        self._slots = asyncio.Semaphore(max(1, settings.ATTACHMENT_SCAN_CONCURRENCY))
+        self._task: asyncio.Task[None] | None = None
+        self._logger = get_logger("app.attachment_scanner")
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def notify(self) -> None:
+        """Wake the worker early, e.g. right after an upload was committed."""
+        self._wake.set()
+
+    async def _run(self) -> None:
+        batch_size = settings.ATTACHMENT_SCAN_BATCH_SIZE
+        while True:
+            self._wake.clear()
+            try:
+                processed = await self.process_batch()
+            except Exception:
+                self._logger.exception("attachment scan batch failed")
+                processed = 0
+            if processed >= batch_size:
+                continue
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    self._wake.wait(), timeout=settings.ATTACHMENT_SCAN_POLL_SECONDS
+                )
+
+    async def _claim(self, db: AsyncSession) -> list[tuple[int, str, str | None, int]]:
+        due = (
+            select(Attachment.id)
+            .where(
+                Attachment.status.in_(_ACTIVE_STATUSES),
+                Attachment.scan_next_attempt_at <= func.now(),
+            )
+            .order_by(Attachment.scan_next_attempt_at)
+            .limit(settings.ATTACHMENT_SCAN_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+        lease = timedelta(seconds=settings.ATTACHMENT_SCAN_LEASE_SECONDS)
+        claimed = (
+            update(Attachment)
+            .where(Attachment.id.in_(due.scalar_subquery()))
+            .values(
+                status="scanning",
+                scan_attempts=Attachment.scan_attempts + 1,
+                scan_next_attempt_at=func.now() + lease,
+            )
+            .returning(
+                Attachment.id, Attachment.s3_key, Attachment.checksum, Attachment.scan_attempts
+            )
+            .execution_options(synchronize_session=False)
+        )
+        rows = [
+            (int(aid), key, checksum, int(attempts))
+            for aid, key, checksum, attempts in (await db.execute(claimed)).all()
+        ]
+        await db.commit()
+        return rows
+
+    async def _known_verdicts(
+        self, db: AsyncSession, checksums: list[str]
+    ) -> dict[str, str]:
+        if not checksums:
+            return {}
+        rows = await db.execute(
+            select(Attachment.checksum, Attachment.status)
+            .where(
+                Attachment.checksum.in_(checksums),
+                Attachment.status.in_(_FINAL_STATUSES),
+                Attachment.scanned_at.is_not(None),
+            )
+            .distinct()
+        )
+        verdicts: dict[str, str] = {}
+        for checksum, status in rows.all():
+            # one infected verdict outweighs any clean one
+            if verdicts.get(checksum) != "infected":
+                verdicts[checksum] = status
+        return verdicts
+
+    async def _scan(self, scanner: Scanner | None, key: str) -> str | None:
+        if scanner is None:
+            return None
+        async with self._slots:
+            start = time.perf_counter()
+            threat = await scanner.scan(key)
+            observe("attachment_scan_duration_seconds", time.perf_counter() - start)
+            return threat
+
+    def _settle(
+        self,
+        rows: list[tuple[int, str, str | None, int]],
+        outcome: str | None | BaseException,
+        scanned: bool,
+    ) -> list[dict[str, object]]:
+        now = _utcnow()
+        scanned_at = now if scanned else None
+        if isinstance(outcome, BaseException):
+            results = []
+            for aid, key, _, attempts in rows:
+                if attempts >= settings.ATTACHMENT_SCAN_MAX_ATTEMPTS:
+                    inc("attachment_scan_failed")
+                    self._logger.warning(
+                        "attachment scan gave up",
+                        extra={"attachment_id": aid, "key": key, "error": repr(outcome)[:200]},
+                    )
+                    results.append(_result(aid, "failed", now, None))
+                else:
+                    inc("attachment_scan_retry")
+                    delay = settings.ATTACHMENT_SCAN_POLL_SECONDS * (2**attempts)
+                    results.append(
+                        _result(aid, "pending", now + timedelta(seconds=delay), None)
+                    )
+            return results
+        if outcome is not None:
+            inc("attachment_scan_infected", len(rows))
+            self._logger.warning(
+                "infected attachment",
+                extra={"attachment_ids": [aid for aid, *_ in rows], "threat": outcome},
+            )
+            return [_result(aid, "infected", now, scanned_at) for aid, *_ in rows]
+        inc("attachment_scan_clean", len(rows))
+        return [_result(aid, "ready", now, scanned_at) for aid, *_ in rows]
+
+    async def _record_depth(self, db: AsyncSession) -> None:
+        depth = (
+            await db.execute(
+                select(func.count())
+                .select_from(Attachment)
+                .where(Attachment.status.in_(_ACTIVE_STATUSES))
+            )
+        ).scalar_one()
+        set_gauge("attachment_scan_depth", int(depth))
+
+    async def process_batch(self) -> int:
+        """Claim, scan and settle one batch. Returns the number of rows claimed."""
+        async with self._db_factory() as db:
+            rows = await self._claim(db)
+            if not rows:
+                await self._record_depth(db)
+                await db.commit()
+                return 0
+            verdicts = await self._known_verdicts(
+                db, sorted({c for _, _, c, _ in rows if c is not None})
+            )
+            await db.commit()
+
+        results: list[dict[str, object]] = []
+        by_key: dict[str, list[tuple[int, str, str | None, int]]] = {}
+        for row in rows:
+            aid, key, checksum, _ = row
+            known = verdicts.get(checksum) if checksum is not None else None
+            if known is None:
+                by_key.setdefault(key, []).append(row)
+                continue
+            inc("attachment_scan_reused")
+            now = _utcnow()
+            results.append(_result(aid, known, now, now))
+
+        # no DB connection is held while files are fetched and scanned
+        scanner = get_scanner()
+        outcomes = await asyncio.gather(
+            *(self._scan(scanner, key) for key in by_key), return_exceptions=True
+        )
+        for group, outcome in zip(by_key.values(), outcomes):
+            results.extend(self._settle(group, outcome, scanner is not None))
+
+        async with self._db_factory() as db:
+            await db.execute(update(Attachment), results)
+            settled = [r["id"] for r in results if r["status"] in _FINAL_STATUSES]
+            linked: list[tuple[Attachment, int]] = []
+            if settled:
+                # read back while our updates hold the row locks: a message
+                # linked before them is seen here, one linked after them reads
+                # the final status when it links
+                linked = [
+                    (att, int(room_id))
+                    for att, room_id in (
+                        await db.execute(
+                            select(Attachment, Message.room_id)
+                            .join(Message, Message.id == Attachment.message_id)
+                            .where(Attachment.id.in_(settled))
+                        )
+                    ).all()
+                ]
+            await self._record_depth(db)
+            await db.commit()
+
+        for att, room_id in linked:
+            await self._announce(att, room_id)
+        return len(rows)
+
+    async def _announce(self, att: Attachment, room_id: int) -> None:
+        event = WSAttachmentStatus(
+            type="attachment",
+            room_id=room_id,
+            message_id=int(att.message_id),
+            attachment=AttachmentOut(
+                id=int(att.id),
+                message_id=att.message_id,
+                filename=att.filename,
+                content_type=att.content_type,
+                size_bytes=att.size_bytes,
+                status=att.status,
+                created_at=att.created_at,
+                url=attachment_url(att),
+            ),
+        )
+        try:
+            await publish_model(f"chat:room:{room_id}", event)
+        except RedisUnavailable:
+            inc("chat_publish_dropped")
+
+
+_worker: AttachmentScanWorker | None = None
+
+
+async def start_attachment_scanner() -> None:
+    global _worker
+    if _worker is None:
+        _worker = AttachmentScanWorker()
+        await _worker.start()
+
+
+def notify_attachment_scanner() -> None:
+    if _worker is not None:
+        _worker.notify()
+
+
+async def stop_attachment_scanner() -> None:
+    global _worker
+    if _worker is not None:
+        await _worker.stop()
+        _worker = None
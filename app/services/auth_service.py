@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import contextlib
 from datetime import datetime, timezone
 
 from jose import jwt
@@ -8,6 +9,7 @@ from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
+from app.core.decorators import record_timing
 from app.core.exceptions import (
     RegistrationError,
     CredentialsInvalid,
@@ -17,6 +19,7 @@ from app.core.exceptions import (
     TokenMalformed,
     VerificationInvalid,
     VerificationExpired,
+    RedisUnavailable,
 )
 from app.core.security import (
     create_access_token,
@@ -38,11 +41,14 @@ from app.schemas.auth import (
     VerificationErrorData,
 )
 from app.schemas.user import UserCreate
-from app.services.mailer import send_mail
+from app.services.mailer import enqueue_mail, send_mail
+from app.services.mail_worker import mail_worker_enabled, notify_mail_worker
 from app.schemas.common import AckOut
-from app.core.redis import get_redis
+from app.core.redis import redis_call
+from app.db.session import release_connection
 
 
+@record_timing("auth_service.register_user")
 async def register_user(db: AsyncSession, user_in: UserCreate) -> AckOut:
     pwd = user_in.password.get_secret_value()
     if (
@@ -62,7 +68,9 @@ async def register_user(db: AsyncSession, user_in: UserCreate) -> AckOut:
         )
 
     exists = await db.execute(select(User).where(User.email == user_in.email))
-    if exists.scalar_one_or_none() is not None:
+    taken = exists.scalar_one_or_none() is not None
+    await release_connection(db)
+    if taken:
         raise RegistrationError(
             "Email already registered",
             code=20002,
@@ -80,7 +88,6 @@ async def register_user(db: AsyncSession, user_in: UserCreate) -> AckOut:
             status_code=400,
         )
 
-    redis = await get_redis()
     key = f"reg:{claims.jti}"
     data = (
         PendingRegistration(email=user_in.email, hashed_password=hashed)
@@ -88,7 +95,7 @@ async def register_user(db: AsyncSession, user_in: UserCreate) -> AckOut:
         .encode()
     )
     ttl = settings.VERIFY_TOKEN_EXPIRE_MINUTES * 60
-    await redis.set(key, data, ex=ttl)
+    await redis_call(lambda r: r.set(key, data, ex=ttl))
 
     verify_url = f"{settings.BACKEND_PUBLIC_BASE_URL}/api/auth/verify?token={token}"
     html = (
@@ -96,14 +103,24 @@ async def register_user(db: AsyncSession, user_in: UserCreate) -> AckOut:
         f"<p>Click the button below to complete the email verification:</p>"
         f"<p><a href='{verify_url}' style='padding:10px 16px;background:#4f46e5;color:#fff;text-decoration:none;border-radius:6px'>Verify Email</a></p>"
     )
-    await send_mail(user_in.email, "Email Verification", html)
+    if mail_worker_enabled():
+        await enqueue_mail(db, user_in.email, "Email Verification", html)
+        await db.commit()
+        notify_mail_worker()
+    else:
+        # nothing would ever drain the outbox: send inline, no connection held
+        await release_connection(db)
+        await send_mail(user_in.email, "Email Verification", html)
 
     return AckOut(ok=True)
 
 
+@record_timing("auth_service.login_user")
 async def login_user(db: AsyncSession, payload: LoginIn) -> TokenPair:
     result = await db.execute(select(User).where(User.email == payload.email))
     user = result.scalar_one_or_none()
+    # bcrypt is slow by design; do not hold a pooled connection across it
+    await release_connection(db)
     if user is None or not verify_password(
         payload.password.get_secret_value(), user.hashed_password
     ):
@@ -125,6 +142,7 @@ async def login_user(db: AsyncSession, payload: LoginIn) -> TokenPair:
     return TokenPair(access_token=access_token, refresh_token=refresh.token)
 
 
+@record_timing("auth_service.rotate_refresh_token")
 async def rotate_refresh_token(db: AsyncSession, token_pair: TokenPair) -> TokenPair:
     try:
         payload = jwt.decode(
@@ -169,6 +187,7 @@ async def rotate_refresh_token(db: AsyncSession, token_pair: TokenPair) -> Token
     return TokenPair(access_token=access_token, refresh_token=new_refresh.token)
 
 
+@record_timing("auth_service.revoke_refresh_token")
 async def revoke_refresh_token(db: AsyncSession, token_pair: TokenPair) -> AckOut:
     try:
         payload = jwt.decode(
@@ -192,6 +211,7 @@ async def revoke_refresh_token(db: AsyncSession, token_pair: TokenPair) -> AckOu
     return AckOut(ok=True)
 
 
+@record_timing("auth_service.verify_email_and_issue_tokens")
 async def verify_email_and_issue_tokens(db: AsyncSession, token: str) -> TokenPair:
     try:
         claims = verify_token(token, expected_type="verify")
@@ -207,9 +227,9 @@ async def verify_email_and_issue_tokens(db: AsyncSession, token: str) -> TokenPa
         # lazy create from pending registration
         if not claims.jti:
             raise VerificationInvalid(data=VerificationErrorData(reason="missing_jti"))
-        redis = await get_redis()
+        await release_connection(db)
         key = f"reg:{claims.jti}"
-        raw = await redis.get(key)
+        raw = await redis_call(lambda r: r.get(key))
         if not raw:
             raise VerificationExpired(
                 data=VerificationErrorData(reason="pending_not_found")
@@ -224,10 +244,8 @@ async def verify_email_and_issue_tokens(db: AsyncSession, token: str) -> TokenPa
         db.add(user)
         await db.commit()
         await db.refresh(user)
-        try:
-            await redis.delete(key)
-        except Exception:
-            pass
+        with contextlib.suppress(RedisUnavailable):
+            await redis_call(lambda r: r.delete(key))
 
     if not user.email_verified:
         user.email_verified = True
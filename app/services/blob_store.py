@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+from datetime import timedelta
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.metrics import inc
+from app.core.storage import get_storage
+from app.db.session import release_connection
+from app.models.attachment import AttachmentBlob
+
+
+logger = get_logger(__name__)
+
+
+def blob_key(checksum: str) -> str:
+    """Storage key of a blob."""
+    return f"blobs/{checksum[:2]}/{checksum[2:4]}/{checksum}"
+
+
+async def blob_keys(db: AsyncSession, checksums: Iterable[str]) -> dict[str, str]:
+    """checksum -> storage_key for the blobs that already exist."""
+    wanted = list(set(checksums))
+    if not wanted:
+        return {}
+    rows = await db.execute(
+        select(AttachmentBlob.checksum, AttachmentBlob.storage_key).where(
+            AttachmentBlob.checksum.in_(wanted)
+        )
+    )
+    return {c: k for c, k in rows.all()}
+
+
+async def lock_blobs(db: AsyncSession, checksums: Iterable[str]) -> dict[str, str]:
+    """Like ``blob_keys`` but ``FOR SHARE``: until commit, GC cannot take them."""
+    wanted = list(set(checksums))
+    if not wanted:
+        return {}
+    rows = await db.execute(
+        select(AttachmentBlob.checksum, AttachmentBlob.storage_key)
+        .where(AttachmentBlob.checksum.in_(wanted))
+        .with_for_update(read=True)
+    )
+    return {c: k for c, k in rows.all()}
+
+
+async def add_blobs(db: AsyncSession, blobs: dict[str, int]) -> None:
+    """Register freshly written blobs (checksum -> size); existing rows win."""
+    if not blobs:
+        return
+    stmt = pg_insert(AttachmentBlob).values(
+        [
+            {"checksum": c, "storage_key": blob_key(c), "size_bytes": size}
+            for c, size in blobs.items()
+        ]
+    )
+    await db.execute(stmt.on_conflict_do_nothing(index_elements=["checksum"]))
+
+
+async def collect_blobs(
+    db: AsyncSession, grace_seconds: int | None = None, limit: int | None = None
+) -> tuple[int, int]:
+    """Delete blobs that have had no references for ``grace_seconds``.
+
+    Rows are claimed ``FOR UPDATE SKIP LOCKED`` and their files removed before
+    the row deletion commits: an upload that finds such a row blocks on its
+    ``FOR SHARE`` lock until then, sees it gone and writes the blob again.
+    Returns ``(blobs, bytes)`` reclaimed.
+    """
+    grace = settings.BLOB_GC_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    batch = settings.BLOB_GC_BATCH_SIZE if limit is None else limit
+    cutoff = func.now() - timedelta(seconds=max(0, grace))
+    rows = (
+        await db.execute(
+            select(
+                AttachmentBlob.checksum,
+                AttachmentBlob.storage_key,
+                AttachmentBlob.size_bytes,
+            )
+            .where(
+                AttachmentBlob.ref_count == 0,
+                func.coalesce(AttachmentBlob.unreferenced_at, AttachmentBlob.created_at)
+                < cutoff,
+            )
+            .limit(batch)
+            .with_for_update(skip_locked=True)
+        )
+    ).all()
+    if not rows:
+        await release_connection(db)
+        return 0, 0
+
+    try:
+        await get_storage().delete([key for _, key, _ in rows])
+    except Exception:
+        await db.rollback()
+        logger.exception("blob gc could not remove files")
+        raise
+    await db.execute(
+        delete(AttachmentBlob).where(
+            AttachmentBlob.checksum.in_([c for c, _, _ in rows]),
+            AttachmentBlob.ref_count == 0,
+        )
+    )
+    await db.commit()
+    reclaimed = sum(int(size) for _, _, size in rows)
+    inc("blob_gc_deleted", len(rows))
+    inc("blob_gc_reclaimed_bytes", reclaimed)
+    logger.info("blob gc", extra={"deleted": len(rows), "reclaimed_bytes": reclaimed})
+    return len(rows), reclaimed
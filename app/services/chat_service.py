@@ -1,20 +1,31 @@
 from __future__ import annotations
 
-from typing import Any, Awaitable, cast
+from typing import Any
 import asyncio
 import contextlib
+import secrets
 
 from fastapi import WebSocket, WebSocketDisconnect
 from sqlalchemy import and_, desc, select, update, or_, func
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm import aliased
+from pydantic import ValidationError
 from app.services.ws_broker import get_broker, WebSocketConnection
+from app.services.attachment_delivery import attachment_url
 from app.core.metrics import inc
 from app.core.logging import get_logger
-
-from app.core.exceptions import BadRequest, Forbidden, UserNotFound, NotFound
-from app.core.redis import get_redis, publish_model
-from app.db.session import AsyncSessionLocal
+from app.core.config import settings
+from app.core.decorators import record_timing
+
+from app.core.exceptions import (
+    BadRequest,
+    Forbidden,
+    UserNotFound,
+    NotFound,
+    RedisUnavailable,
+)
+from app.core.redis import publish_model, redis_call
+from app.db.session import AsyncSessionLocal, release_connection
 from app.models.chat import ChatParticipant, ChatRoom, Message
 from app.models.attachment import Attachment
 from app.models.user import User
@@ -31,17 +42,36 @@ from app.schemas.chat import (
     UnreadCountOut,
     WSPresence,
     WSChatMessage,
+    WSTicket,
+    WSTicketIn,
+    WSTicketOut,
 )
 from app.schemas.common import AckOut
+from app.schemas.user import avatar_url, avatar_urls
 
 
 UNREAD_TTL_SECONDS = 7 * 24 * 3600
+# attachment statuses a message may be sent with
+_SENDABLE_STATUSES = ("pending", "scanning", "ready")
 
 
 def _unread_key(room_id: int, user_id: int) -> str:
     return f"chat:unread:{room_id}:{user_id}"
 
 
+def _ws_ticket_key(ticket: str) -> str:
+    return f"chat:ws_ticket:{ticket}"
+
+
+async def _publish_best_effort(channel: str, payload: Any) -> None:
+    """Realtime fanout degrades while Redis is down; the data is already committed."""
+    try:
+        await publish_model(channel, payload)
+    except RedisUnavailable:
+        inc("chat_publish_dropped")
+
+
+@record_timing("chat_service.create_direct_room_service")
 async def create_direct_room_service(
     db: AsyncSession, payload: RoomCreateDirect, current_user_id: int
 ) -> RoomOut:
@@ -97,10 +127,7 @@ async def create_direct_room_service(
     return RoomOut.model_validate(room, from_attributes=True)
 
 
-def _att_url(att_id: int) -> str:
-    return f"/api/chat/attachments/{att_id}/download"
-
-
+@record_timing("chat_service.list_messages_service")
 async def list_messages_service(
     db: AsyncSession, room_id: int, current_user_id: int, limit: int, cursor: int | None
 ) -> list[MessageOut]:
@@ -139,7 +166,7 @@ async def list_messages_service(
                 "size_bytes": a.size_bytes,
                 "status": a.status,
                 "created_at": a.created_at,
-                "url": _att_url(int(a.id)),
+                "url": attachment_url(a),
             }
             for a in amap.get(int(m.id), [])
         ]
@@ -156,6 +183,7 @@ async def list_messages_service(
     return out
 
 
+@record_timing("chat_service.list_rooms_service")
 async def list_rooms_service(
     db: AsyncSession, current_user_id: int
 ) -> list[RoomSummaryOut]:
@@ -190,14 +218,15 @@ async def list_rooms_service(
             await db.execute(peer_stmt)
         ).all():
             peers_map[int(room_id)] = (int(uid), name, email, avatar_path)
+    await release_connection(db)
 
-    redis = await get_redis()
     unread: dict[int, int] = {}
     if room_ids:
-        pipe = redis.pipeline(transaction=False)
-        for room_id in room_ids:
-            pipe.get(_unread_key(room_id, current_user_id))
-        vals = await pipe.execute()  # type: ignore
+        keys = [_unread_key(room_id, current_user_id) for room_id in room_ids]
+        try:
+            vals: list[Any] = await redis_call(lambda r: r.mget(keys))
+        except RedisUnavailable:
+            vals = []
         for room_id, v in zip(room_ids, vals):
             try:
                 unread[room_id] = int(v or 0)
@@ -210,7 +239,7 @@ async def list_rooms_service(
         peer_out = (
             None
             if peer is None
-            else PeerOut(id=peer[0], name=peer[1], email=peer[2], avatar_url=peer[3])
+            else _peer_out(*peer)
         )
         last_out = (
             None
@@ -231,33 +260,48 @@ async def list_rooms_service(
     return items
 
 
+@record_timing("chat_service.send_message_service")
 async def send_message_service(
     db: AsyncSession, payload: MessageCreate, current_user_id: int
 ) -> MessageOut:
-    exists = await db.execute(
-        select(ChatParticipant).where(
-            and_(
-                ChatParticipant.room_id == payload.room_id,
-                ChatParticipant.user_id == current_user_id,
+    member_ids = {
+        int(x)
+        for x in (
+            await db.execute(
+                select(ChatParticipant.user_id).where(
+                    ChatParticipant.room_id == payload.room_id
+                )
             )
         )
-    )
-    if exists.scalar_one_or_none() is None:
+        .scalars()
+        .all()
+    }
+    if current_user_id not in member_ids:
         raise Forbidden("forbidden")
+    participants = sorted(member_ids - {current_user_id})
 
     att_ids = [int(x) for x in (payload.attachment_ids or [])]
+    arows: list[Attachment] = []
+    statuses: dict[int, str] = {}
     if att_ids:
-        arows = (
-            await db.execute(
-                select(Attachment).where(
-                    and_(Attachment.id.in_(att_ids), Attachment.uploader_id == current_user_id)
+        arows = list(
+            (
+                await db.execute(
+                    select(Attachment).where(
+                        and_(Attachment.id.in_(att_ids), Attachment.uploader_id == current_user_id)
+                    )
                 )
-            )
-        ).scalars().all()
+            ).scalars().all()
+        )
         if len(arows) != len(att_ids):
             raise Forbidden("invalid attachment owner or missing")
         if any(a.message_id is not None for a in arows):
             raise BadRequest("attachment already linked")
+        if any(a.status == "uploading" for a in arows):
+            raise BadRequest("attachment upload not completed")
+        # still being scanned is fine: the room hears when each one is ready
+        if any(a.status not in _SENDABLE_STATUSES for a in arows):
+            raise BadRequest("attachment rejected")
 
     msg = Message(
         room_id=payload.room_id,
@@ -266,23 +310,31 @@ async def send_message_service(
         kind="file" if att_ids else "text",
     )
     db.add(msg)
-    await db.commit()
+    await db.flush()
     await db.refresh(msg)
 
     if att_ids:
-        await db.execute(
-            update(Attachment)
-            .where(Attachment.id.in_(att_ids))
-            .values(message_id=msg.id)
-        )
-        await db.commit()
-        arows = (
-            await db.execute(select(Attachment).where(Attachment.message_id == msg.id))
-        ).scalars().all()
-    else:
-        arows = []
+        # RETURNING gives each status as of the link: a scan that settled
+        # since the read above has its row lock released by now
+        linked = (
+            await db.execute(
+                update(Attachment)
+                .where(Attachment.id.in_(att_ids), Attachment.message_id.is_(None))
+                .values(message_id=msg.id)
+                .returning(Attachment.id, Attachment.status)
+                .execution_options(synchronize_session=False)
+            )
+        ).all()
+        if len(linked) != len(arows):
+            # linked by a concurrent message or removed by orphan GC meanwhile
+            await db.rollback()
+            raise BadRequest("attachment already linked or removed")
+        for aid, status in linked:
+            statuses[int(aid)] = status
+    # single commit ends the DB phase; pub/sub and Redis below run without a connection
+    await db.commit()
 
-    await publish_model(
+    await _publish_best_effort(
         f"chat:room:{payload.room_id}",
         WSChatMessage(
             type="message",
@@ -298,40 +350,27 @@ async def send_message_service(
                     "filename": a.filename,
                     "content_type": a.content_type,
                     "size_bytes": a.size_bytes,
-                    "status": a.status,
+                    "status": statuses.get(int(a.id), a.status),
                     "created_at": a.created_at,
-                    "url": _att_url(int(a.id)),
+                    "url": attachment_url(a),
                 }
                 for a in arows
             ],
         ),
     )
 
-    redis = await get_redis()
-    participants = (
-        (
-            await db.execute(
-                select(ChatParticipant.user_id).where(
-                    and_(
-                        ChatParticipant.room_id == payload.room_id,
-                        ChatParticipant.user_id != current_user_id,
-                    )
-                )
-            )
-        )
-        .scalars()
-        .all()
-    )
     if participants:
-        pipe = redis.pipeline(transaction=False)
-        for uid in participants:
-            key = _unread_key(payload.room_id, int(uid))
-            pipe.set(key, b"0", ex=UNREAD_TTL_SECONDS, nx=True)
-            pipe.incr(key)
-        try:
-            await cast(Awaitable[Any], pipe.execute())
-        except Exception:
-            pass
+
+        async def _bump_unread(redis: Any) -> Any:
+            pipe = redis.pipeline(transaction=False)
+            for uid in participants:
+                key = _unread_key(payload.room_id, int(uid))
+                pipe.set(key, b"0", ex=UNREAD_TTL_SECONDS, nx=True)
+                pipe.incr(key)
+            return await pipe.execute()
+
+        with contextlib.suppress(RedisUnavailable):
+            await redis_call(_bump_unread)
     return MessageOut(
         id=int(msg.id),
         room_id=int(msg.room_id),
@@ -346,15 +385,16 @@ async def send_message_service(
                 "filename": a.filename,
                 "content_type": a.content_type,
                 "size_bytes": a.size_bytes,
-                "status": a.status,
+                "status": statuses.get(int(a.id), a.status),
                 "created_at": a.created_at,
-                "url": _att_url(int(a.id)),
+                "url": attachment_url(a),
             }
             for a in arows
         ],
     )
 
 
+@record_timing("chat_service.create_group_room_service")
 async def create_group_room_service(
     db: AsyncSession, payload: RoomCreateGroup, current_user_id: int
 ) -> RoomOut:
@@ -387,6 +427,7 @@ async def create_group_room_service(
     return RoomOut.model_validate(room, from_attributes=True)
 
 
+@record_timing("chat_service.add_participants_service")
 async def add_participants_service(
     db: AsyncSession, room_id: int, payload: ParticipantsChangeIn, current_user_id: int
 ) -> AckOut:
@@ -417,6 +458,7 @@ async def add_participants_service(
     return AckOut(ok=True)
 
 
+@record_timing("chat_service.remove_participants_service")
 async def remove_participants_service(
     db: AsyncSession, room_id: int, payload: ParticipantsChangeIn, current_user_id: int
 ) -> AckOut:
@@ -448,6 +490,7 @@ async def remove_participants_service(
     return AckOut(ok=True)
 
 
+@record_timing("chat_service.mark_read_service")
 async def mark_read_service(
     db: AsyncSession, room_id: int, body: MarkReadIn, current_user_id: int
 ) -> AckOut:
@@ -479,7 +522,7 @@ async def mark_read_service(
     )
     await db.commit()
 
-    await publish_model(
+    await _publish_best_effort(
         f"chat:room:{room_id}",
         WSPresence(
             type="message_read",
@@ -488,33 +531,25 @@ async def mark_read_service(
             status=str(body.last_read_message_id),
         ),
     )
-    try:
-        redis = await get_redis()
-        await cast(
-            Awaitable[Any],
-            redis.set(
-                _unread_key(room_id, current_user_id), b"0", ex=UNREAD_TTL_SECONDS
-            ),
-        )
-    except Exception:
-        pass
+    unread_key = _unread_key(room_id, current_user_id)
+    with contextlib.suppress(RedisUnavailable):
+        await redis_call(lambda r: r.set(unread_key, b"0", ex=UNREAD_TTL_SECONDS))
     return AckOut(ok=True)
 
 
+@record_timing("chat_service.unread_count_service")
 async def unread_count_service(
     db: AsyncSession, room_id: int, current_user_id: int
 ) -> UnreadCountOut:
+    unread_key = _unread_key(room_id, current_user_id)
     try:
-        redis = await get_redis()
-        val = await cast(
-            Awaitable[Any], redis.get(_unread_key(room_id, current_user_id))
-        )
+        val = await redis_call(lambda r: r.get(unread_key))
         if val is not None:
             try:
                 return UnreadCountOut(count=int(val))
             except Exception:
                 pass
-    except Exception:
+    except RedisUnavailable:
         pass
 
     result = await db.execute(
@@ -544,22 +579,28 @@ async def unread_count_service(
             )
         )
     ).scalar_one()
+    await release_connection(db)
 
-    try:
-        redis = await get_redis()
-        await cast(
-            Awaitable[Any],
-            redis.set(
-                _unread_key(room_id, current_user_id),
-                str(int(cnt)).encode(),
-                ex=UNREAD_TTL_SECONDS,
-            ),
+    with contextlib.suppress(RedisUnavailable):
+        await redis_call(
+            lambda r: r.set(unread_key, str(int(cnt)).encode(), ex=UNREAD_TTL_SECONDS)
         )
-    except Exception:
-        pass
     return UnreadCountOut(count=int(cnt))
 
 
+def _peer_out(
+    user_id: int, name: str | None, email: str, avatar_path: str | None
+) -> PeerOut:
+    return PeerOut(
+        id=user_id,
+        name=name,
+        email=email,
+        avatar_url=avatar_url(avatar_path),
+        avatar_urls=avatar_urls(avatar_path),
+    )
+
+
+@record_timing("chat_service.list_all_users_service")
 async def list_all_users_service(
     db: AsyncSession, current_user_id: int, query: str | None, limit: int
 ) -> list[PeerOut]:
@@ -569,9 +610,57 @@ async def list_all_users_service(
         q = q.where(or_(User.name.ilike(like), User.email.ilike(like)))
     q = q.order_by(User.name.nullslast(), User.email).limit(limit)
     rows = (await db.execute(q)).scalars().all()
-    return [PeerOut(id=int(u.id), email=u.email, name=u.name, avatar_url=u.avatar_path) for u in rows]
+    return [_peer_out(int(u.id), u.name, u.email, u.avatar_path) for u in rows]
+
+
+@record_timing("chat_service.issue_ws_ticket_service")
+async def issue_ws_ticket_service(
+    db: AsyncSession, payload: WSTicketIn, current_user_id: int
+) -> WSTicketOut:
+    """Resolve the caller's rooms once and park them behind a single-use ticket.
+
+    The WebSocket handshake redeems the ticket with one ``GETDEL`` instead of
+    decoding the JWT and querying users/participants on every (re)connect.
+    """
+    stmt = select(ChatParticipant.room_id).where(
+        ChatParticipant.user_id == current_user_id
+    )
+    if payload.room_ids:
+        stmt = stmt.where(ChatParticipant.room_id.in_(payload.room_ids))
+    room_ids = sorted(int(x) for x in (await db.execute(stmt)).scalars().all())
+    await release_connection(db)
+    if not room_ids:
+        raise Forbidden("forbidden")
+
+    ticket = secrets.token_urlsafe(32)
+    ttl = settings.WS_TICKET_TTL_SECONDS
+    grant = (
+        WSTicket(user_id=current_user_id, room_ids=room_ids).model_dump_json().encode()
+    )
+    await redis_call(lambda r: r.set(_ws_ticket_key(ticket), grant, ex=ttl))
+    inc("ws_ticket_issued")
+    return WSTicketOut(ticket=ticket, expires_in=ttl)
+
+
+@record_timing("chat_service.redeem_ws_ticket")
+async def redeem_ws_ticket(ticket: str) -> WSTicket | None:
+    try:
+        raw = await redis_call(lambda r: r.getdel(_ws_ticket_key(ticket)))
+    except RedisUnavailable:
+        raw = None
+    if not raw:
+        inc("ws_ticket_rejected")
+        return None
+    try:
+        grant = WSTicket.model_validate_json(raw)
+    except ValidationError:
+        inc("ws_ticket_rejected")
+        return None
+    inc("ws_ticket_redeemed")
+    return grant
 
 
+@record_timing("chat_service.ws_authorize_and_room_check")
 async def ws_authorize_and_room_check(
     token: str | None,
     room_id: int,
@@ -616,8 +705,9 @@ async def ws_authorize_and_room_check(
 async def ws_handler(ws: WebSocket) -> None:
     """WebSocket 处理：鉴权、presence、订阅转发。路由层仅转发请求。"""
     params = dict(ws.query_params)
+    ticket = params.get("ticket")
     token = params.get("token")
-    if not token:
+    if not ticket and not token:
         auth_header = ws.headers.get("authorization") or ws.headers.get("Authorization")
         if auth_header and auth_header.lower().startswith("bearer "):
             token = auth_header.split(" ", 1)[1]
@@ -632,26 +722,34 @@ async def ws_handler(ws: WebSocket) -> None:
         await ws.close(code=1008)
         return
 
-    user: User | None = await ws_authorize_and_room_check(
-        token, room_id, AsyncSessionLocal
-    )
-    if user is None:
+    user_id: int | None = None
+    if ticket:
+        grant = await redeem_ws_ticket(ticket)
+        if grant is not None and room_id in grant.room_ids:
+            user_id = grant.user_id
+    else:
+        # legacy path: JWT in the query string/header, checked against the DB
+        user = await ws_authorize_and_room_check(token, room_id, AsyncSessionLocal)
+        if user is not None:
+            user_id = int(user.id)
+    if user_id is None:
         await ws.close(code=1008)
         return
 
     await ws.accept()
     logger = get_logger("app.ws")
-    logger.info("ws connected", extra={"room_id": room_id, "user_id": user.id})
+    logger.info("ws connected", extra={"room_id": room_id, "user_id": user_id})
 
-    redis = await get_redis()
     broker = await get_broker()
     channel = f"chat:room:{room_id}"
-    presence_key = f"chat:room:{room_id}:presence:{user.id}"
+    presence_key = f"chat:room:{room_id}:presence:{user_id}"
 
     async def _heartbeat_task() -> None:
         try:
             while True:
-                await cast(Awaitable[Any], redis.set(presence_key, b"1", ex=30))
+                # a missed beat only lets presence expire early; keep beating
+                with contextlib.suppress(RedisUnavailable):
+                    await redis_call(lambda r: r.set(presence_key, b"1", ex=30))
                 await asyncio.sleep(10)
         except asyncio.CancelledError:
             return
@@ -659,13 +757,14 @@ async def ws_handler(ws: WebSocket) -> None:
             pass
 
     hb_task = asyncio.create_task(_heartbeat_task())
-    await publish_model(
+    await _publish_best_effort(
         channel,
-        WSPresence(type="presence", room_id=room_id, user_id=user.id, status="online"),
+        WSPresence(type="presence", room_id=room_id, user_id=user_id, status="online"),
     )
     inc("ws_presence_online")
 
     conn = WebSocketConnection(ws)
+    conn.attach_task(hb_task)
     await broker.subscribe(room_id, conn)
     try:
         last = 0.0
@@ -693,16 +792,17 @@ async def ws_handler(ws: WebSocket) -> None:
             with contextlib.suppress(asyncio.CancelledError):
                 await hb_task
             await broker.unsubscribe(room_id, conn)
-            await cast(Awaitable[Any], redis.delete(presence_key))
-            await publish_model(
+            with contextlib.suppress(RedisUnavailable):
+                await redis_call(lambda r: r.delete(presence_key))
+            await _publish_best_effort(
                 channel,
                 WSPresence(
-                    type="presence", room_id=room_id, user_id=user.id, status="offline"
+                    type="presence", room_id=room_id, user_id=user_id, status="offline"
                 ),
             )
             inc("ws_presence_offline")
             logger.info(
-                "ws disconnected", extra={"room_id": room_id, "user_id": user.id}
+                "ws disconnected", extra={"room_id": room_id, "user_id": user_id}
             )
         except Exception:
             pass
@@ -0,0 +1,504 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+import re
+import shutil
+import time
+from collections.abc import Iterator
+from datetime import timedelta
+from pathlib import Path
+
+from sqlalchemy import delete, exists, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.exceptions import RedisUnavailable
+from app.core.executors import iter_io, run_io
+from app.core.logging import get_logger
+from app.core.metrics import inc
+from app.core.redis import redis_call
+from app.core.storage import StoredObject, get_storage
+from app.db.session import AsyncSessionLocal, release_connection
+from app.models.attachment import Attachment, AttachmentBlob
+from app.models.user import User
+from app.models.user_resume import UserResume
+from app.schemas.debug import FileGCOut
+from app.services.blob_store import add_blobs, collect_blobs
+
+
+logger = get_logger(__name__)
+
+_BLOB_KEY = re.compile(r"^blobs/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})$")
+# avatars/<user id>/<version>/<size>.webp; the version prefix is users.avatar_path
+_AVATAR_KEY = re.compile(r"^(avatars/(\d+)/[0-9a-f]{16})/[^/]+$")
+# <YYYYMM>/<DD>/<uuid hex>_<filename>: attachments stored before the blob store
+_LEGACY_KEY = re.compile(r"^\d{6}/\d{2}/[0-9a-f]{32}_[^/]+$")
+_RECONCILE_LEASE_KEY = "file_gc:reconcile"
+
+
+def _count(kind: str, deleted: int, reclaimed: int) -> None:
+    if deleted:
+        inc("file_gc_deleted", deleted, labels={"kind": kind})
+    if reclaimed:
+        inc("file_gc_reclaimed_bytes", reclaimed, labels={"kind": kind})
+
+
+async def _delete_attachments(db: AsyncSession, ids: list[int]) -> list[tuple[str, int]]:
+    """Delete attachment rows the caller holds locked; returns the files they owned.
+
+    A blob-backed row only drops its reference and the blob goes later, with
+    ``collect_blobs``. Rows from before the blob store own their file; its
+    key and size are returned for ``_remove_owned_files`` to delete once the
+    row deletion has committed.
+    """
+    if not ids:
+        return []
+    rows = (
+        await db.execute(
+            delete(Attachment)
+            .where(Attachment.id.in_(ids))
+            .returning(Attachment.s3_key, Attachment.size_bytes, Attachment.checksum)
+        )
+    ).all()
+    return [
+        (key, int(size))
+        for key, size, checksum in rows
+        if checksum is None and key and not key.startswith("blobs/")
+    ]
+
+
+async def _remove_owned_files(files: list[tuple[str, int]]) -> int:
+    """Delete the files of rows already deleted; returns the bytes freed.
+
+    Runs after the commit so no row lock is held across storage I/O. Files a
+    failure leaves behind have no row any more and are removed by
+    ``reconcile_files``.
+    """
+    if not files:
+        return 0
+    try:
+        await get_storage().delete([key for key, _ in files])
+    except Exception:
+        inc("file_gc_delete_failed", len(files))
+        logger.exception("file gc could not remove files", extra={"count": len(files)})
+        return 0
+    return sum(size for _, size in files)
+
+
+async def collect_orphan_attachments(
+    db: AsyncSession, grace_seconds: int | None = None, limit: int | None = None
+) -> tuple[int, int]:
+    """Delete one batch of attachments never linked to a message.
+
+    Only rows older than ``FILE_GC_ORPHAN_GRACE_SECONDS`` that no resume uses
+    are taken, oldest first through the partial ``created_at`` index. They are
+    locked ``SKIP LOCKED``, so a message linking one right now either wins
+    (and the row is no longer an orphan) or finds it gone.
+    Returns ``(attachments, bytes)`` deleted.
+    """
+    grace = settings.FILE_GC_ORPHAN_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    batch = settings.FILE_GC_BATCH_SIZE if limit is None else limit
+    ids = list(
+        (
+            await db.execute(
+                select(Attachment.id)
+                .where(
+                    Attachment.message_id.is_(None),
+                    Attachment.created_at < func.now() - timedelta(seconds=max(0, grace)),
+                    # upload sessions are expired by the upload reaper
+                    Attachment.status != "uploading",
+                    ~exists().where(UserResume.attachment_id == Attachment.id),
+                )
+                .order_by(Attachment.created_at)
+                .limit(batch)
+                .with_for_update(skip_locked=True, of=Attachment)
+            )
+        )
+        .scalars()
+        .all()
+    )
+    if not ids:
+        await release_connection(db)
+        return 0, 0
+    try:
+        files = await _delete_attachments(db, ids)
+    except Exception:
+        await db.rollback()
+        raise
+    await db.commit()
+    reclaimed = await _remove_owned_files(files)
+    _count("orphan_attachment", len(ids), reclaimed)
+    return len(ids), reclaimed
+
+
+async def collect_superseded_resumes(
+    db: AsyncSession, keep: int | None = None, limit: int | None = None
+) -> tuple[int, int]:
+    """Delete one batch of resume versions beyond the newest ``keep`` earlier ones.
+
+    The resume's attachment goes with it unless it was also sent in a chat.
+    Returns ``(resume versions, bytes)`` deleted.
+    """
+    keep = settings.RESUME_KEEP_VERSIONS if keep is None else keep
+    batch = settings.FILE_GC_BATCH_SIZE if limit is None else limit
+    ranked = (
+        select(
+            UserResume.id,
+            func.row_number()
+            .over(
+                partition_by=UserResume.user_id,
+                order_by=(UserResume.created_at.desc(), UserResume.id.desc()),
+            )
+            .label("rank"),
+        )
+        .where(UserResume.is_current == False)  # noqa: E712
+        .subquery()
+    )
+    rows = (
+        await db.execute(
+            select(UserResume.id, UserResume.attachment_id)
+            .join(ranked, ranked.c.id == UserResume.id)
+            .where(ranked.c.rank > max(0, keep), UserResume.is_current == False)  # noqa: E712
+            .limit(batch)
+            .with_for_update(skip_locked=True, of=UserResume)
+        )
+    ).all()
+    if not rows:
+        await release_connection(db)
+        return 0, 0
+    attachments = (
+        await db.execute(
+            select(Attachment.id, Attachment.message_id)
+            .where(Attachment.id.in_([aid for _, aid in rows]))
+            .with_for_update(skip_locked=True)
+        )
+    ).all()
+    locked = {int(aid) for aid, _ in attachments}
+    resume_ids = [int(rid) for rid, aid in rows if int(aid) in locked]
+    try:
+        if resume_ids:
+            await db.execute(delete(UserResume).where(UserResume.id.in_(resume_ids)))
+        files = await _delete_attachments(
+            db, [int(aid) for aid, message_id in attachments if message_id is None]
+        )
+    except Exception:
+        await db.rollback()
+        raise
+    await db.commit()
+    reclaimed = await _remove_owned_files(files)
+    _count("superseded_resume", len(resume_ids), reclaimed)
+    return len(resume_ids), reclaimed
+
+
+async def _adopt_stray_blobs(
+    db: AsyncSession, batch: list[StoredObject], cutoff: float
+) -> int:
+    # A blob file without a row becomes an unreferenced blob row rather than
+    # being deleted here: collect_blobs then removes it under the same locks
+    # every upload respects, and an upload of that content reuses it instead.
+    found = {
+        m.group(1): obj
+        for obj in batch
+        if obj.modified < cutoff and (m := _BLOB_KEY.match(obj.key))
+    }
+    if not found:
+        return 0
+    known = set(
+        (
+            await db.execute(
+                select(AttachmentBlob.checksum).where(AttachmentBlob.checksum.in_(list(found)))
+            )
+        )
+        .scalars()
+        .all()
+    )
+    strays = {c: obj.size for c, obj in found.items() if c not in known}
+    await add_blobs(db, strays)
+    await db.commit()
+    return len(strays)
+
+
+async def _remove_old_avatars(
+    db: AsyncSession, batch: list[StoredObject], cutoff: float
+) -> tuple[int, int]:
+    versions: dict[str, list[StoredObject]] = {}
+    owners: set[int] = set()
+    for obj in batch:
+        m = _AVATAR_KEY.match(obj.key)
+        # older files of other layouts are left alone
+        if m is None or obj.modified >= cutoff:
+            continue
+        versions.setdefault(m.group(1), []).append(obj)
+        owners.add(int(m.group(2)))
+    if not versions:
+        return 0, 0
+    current = set(
+        (
+            await db.execute(
+                select(User.avatar_path).where(
+                    User.id.in_(owners), User.avatar_path.is_not(None)
+                )
+            )
+        )
+        .scalars()
+        .all()
+    )
+    await release_connection(db)
+    stale = [obj for prefix, objs in versions.items() if prefix not in current for obj in objs]
+    if stale:
+        await get_storage().delete([obj.key for obj in stale])
+    return len(stale), sum(obj.size for obj in stale)
+
+
+async def _remove_unowned_files(
+    db: AsyncSession, batch: list[StoredObject], cutoff: float
+) -> tuple[int, int]:
+    # files in the layout attachments had before the blob store; nothing
+    # writes new ones, so one with no row referencing it is garbage for good
+    found = {
+        obj.key: obj for obj in batch if obj.modified < cutoff and _LEGACY_KEY.match(obj.key)
+    }
+    if not found:
+        return 0, 0
+    keys = list(found)
+    referenced = set(
+        (await db.execute(select(Attachment.s3_key).where(Attachment.s3_key.in_(keys))))
+        .scalars()
+        .all()
+    )
+    # the blob store migration kept checksummed legacy files where they were
+    referenced.update(
+        (
+            await db.execute(
+                select(AttachmentBlob.storage_key).where(AttachmentBlob.storage_key.in_(keys))
+            )
+        )
+        .scalars()
+        .all()
+    )
+    await release_connection(db)
+    unowned = [obj for key, obj in found.items() if key not in referenced]
+    if unowned:
+        await get_storage().delete([obj.key for obj in unowned])
+    return len(unowned), sum(obj.size for obj in unowned)
+
+
+def _entries(top: Path) -> Iterator[tuple[str, bool, float]]:
+    # one directory level, streamed: (name, is_dir, mtime)
+    try:
+        it = os.scandir(top)
+    except FileNotFoundError:
+        return
+    with it:
+        for entry in it:
+            try:
+                yield (
+                    entry.name,
+                    entry.is_dir(follow_symlinks=False),
+                    entry.stat(follow_symlinks=False).st_mtime,
+                )
+            except FileNotFoundError:
+                continue
+
+
+def _remove(paths: list[Path]) -> int:
+    """Delete files and directory trees; returns the bytes they held."""
+    return sum(_remove_one(p) for p in paths)
+
+
+def _remove_one(path: Path) -> int:
+    try:
+        if not path.is_dir():
+            size = path.stat().st_size
+            path.unlink()
+            return size
+    except FileNotFoundError:
+        return 0
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            with contextlib.suppress(FileNotFoundError):
+                size += os.stat(os.path.join(dirpath, name)).st_size
+    shutil.rmtree(path, ignore_errors=True)
+    return size
+
+
+async def _remove_stale_temp_files(root: Path, cutoff: float) -> tuple[int, int]:
+    # staging files of uploads that died midway; live ones are written to
+    # continuously, so their mtime stays fresh
+    count = reclaimed = 0
+    async for batch in iter_io(_entries(root / ".tmp")):
+        stale = [
+            root / ".tmp" / name for name, is_dir, mtime in batch if not is_dir and mtime < cutoff
+        ]
+        if stale:
+            reclaimed += await run_io(_remove, stale)
+            count += len(stale)
+    return count, reclaimed
+
+
+async def _remove_abandoned_parts(
+    db: AsyncSession, root: Path, cutoff: float
+) -> tuple[int, int]:
+    # parts of sessions whose row is gone (the reaper removes them together,
+    # but a crash in between leaves the directory behind)
+    count = reclaimed = 0
+    async for batch in iter_io(_entries(root / ".parts")):
+        old = {
+            int(name)
+            for name, is_dir, mtime in batch
+            if is_dir and name.isdigit() and mtime < cutoff
+        }
+        if not old:
+            continue
+        live = set(
+            (
+                await db.execute(
+                    select(Attachment.id).where(
+                        Attachment.id.in_(old), Attachment.status == "uploading"
+                    )
+                )
+            )
+            .scalars()
+            .all()
+        )
+        await release_connection(db)
+        abandoned = [root / ".parts" / str(aid) for aid in sorted(old - live)]
+        if abandoned:
+            reclaimed += await run_io(_remove, abandoned)
+            count += len(abandoned)
+    return count, reclaimed
+
+
+async def reconcile_files(db: AsyncSession, out: FileGCOut) -> None:
+    """Walk storage and the upload staging area for files no row accounts for.
+
+    Listings are streamed in batches with one short query each, and only
+    files untouched for the grace period are considered, so nothing that an
+    upload in flight is still writing or about to register is touched.
+    """
+    now = time.time()
+    # a direct upload may complete until its presigned URL expires
+    blob_cutoff = now - max(
+        settings.BLOB_GC_GRACE_SECONDS, settings.STORAGE_UPLOAD_URL_TTL_SECONDS
+    )
+    cutoff = now - settings.BLOB_GC_GRACE_SECONDS
+    storage = get_storage()
+
+    # one listing of the whole store; each step picks out its own key layout
+    async for batch in storage.list_objects(""):
+        count = await _adopt_stray_blobs(db, batch, blob_cutoff)
+        out.stray_blobs += count
+        if count:
+            inc("file_gc_stray_blobs", count)
+
+        count, size = await _remove_old_avatars(db, batch, cutoff)
+        out.avatar_files += count
+        out.reclaimed_bytes += size
+        _count("avatar", count, size)
+
+        count, size = await _remove_unowned_files(db, batch, cutoff)
+        out.unowned_files += count
+        out.reclaimed_bytes += size
+        _count("unowned_file", count, size)
+
+    root = Path(settings.UPLOAD_DIR)
+    count, size = await _remove_stale_temp_files(root, cutoff)
+    out.temp_files += count
+    out.reclaimed_bytes += size
+    _count("temp_file", count, size)
+
+    count, size = await _remove_abandoned_parts(db, root, cutoff)
+    out.part_dirs += count
+    out.reclaimed_bytes += size
+    _count("upload_parts", count, size)
+    out.reconciled = True
+
+
+async def run_file_gc(db: AsyncSession, *, reconcile: bool = False) -> FileGCOut:
+    """One incremental pass: bounded batches per kind, each its own transaction."""
+    out = FileGCOut()
+    batch = settings.FILE_GC_BATCH_SIZE
+    for _ in range(max(1, settings.FILE_GC_MAX_BATCHES)):
+        count, size = await collect_orphan_attachments(db)
+        out.orphan_attachments += count
+        out.reclaimed_bytes += size
+        if count < batch:
+            break
+    for _ in range(max(1, settings.FILE_GC_MAX_BATCHES)):
+        count, size = await collect_superseded_resumes(db)
+        out.superseded_resumes += count
+        out.reclaimed_bytes += size
+        if count < batch:
+            break
+    # blobs released above are collected on a later pass, after their grace
+    for _ in range(max(1, settings.FILE_GC_MAX_BATCHES)):
+        count, size = await collect_blobs(db)
+        out.blobs += count
+        out.reclaimed_bytes += size
+        if count < settings.BLOB_GC_BATCH_SIZE:
+            break
+    if reconcile:
+        await reconcile_files(db, out)
+    logger.info("file gc", extra=out.model_dump())
+    return out
+
+
+async def _take_reconcile_lease() -> bool:
+    # one worker walks storage per interval; without Redis nobody does
+    ttl = max(1, settings.FILE_GC_RECONCILE_INTERVAL_SECONDS)
+    try:
+        return bool(
+            await redis_call(
+                lambda r: r.set(_RECONCILE_LEASE_KEY, b"1", ex=ttl, nx=True)
+            )
+        )
+    except RedisUnavailable:
+        return False
+
+
+class FileGarbageCollector:
+    """Runs ``run_file_gc`` periodically (safe on every worker)."""
+
+    def __init__(self) -> None:
+        self._task: asyncio.Task[None] | None = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.FILE_GC_INTERVAL_SECONDS)
+            try:
+                reconcile = await _take_reconcile_lease()
+                async with AsyncSessionLocal() as db:
+                    await run_file_gc(db, reconcile=reconcile)
+            except Exception:
+                logger.exception("file gc failed")
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+
+_collector: FileGarbageCollector | None = None
+
+
+async def start_file_gc() -> None:
+    global _collector
+    if _collector is None:
+        _collector = FileGarbageCollector()
+        await _collector.start()
+
+
+async def stop_file_gc() -> None:
+    global _collector
+    if _collector is not None:
+        await _collector.stop()
+        _collector = None
@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.metrics import inc, observe, set_gauge
+from app.db.session import AsyncSessionLocal
+from app.models.mail_outbox import MailOutbox
+from app.services.mailer import SMTPConnectionPool, build_message, is_permanent_failure
+
+
+_ACTIVE_STATUSES = ("pending", "sending")
+
+
+def _backoff_seconds(attempts: int) -> float:
+    base = settings.MAIL_OUTBOX_BACKOFF_BASE_SECONDS * (2 ** max(0, attempts - 1))
+    delay = min(settings.MAIL_OUTBOX_BACKOFF_MAX_SECONDS, base)
+    # full jitter keeps retries from a relay outage from arriving in lockstep
+    return random.uniform(delay / 2, delay)
+
+
+class MailOutboxWorker:
+    """Delivers rows from ``mail_outbox`` through a pool of persistent SMTP sessions.
+
+    Rows are claimed with ``FOR UPDATE SKIP LOCKED`` and leased by pushing
+    ``next_attempt_at`` forward, so several app processes can run a worker
+    against the same table and a crashed worker's batch is picked up again once
+    the lease runs out.
+    """
+
+    def __init__(
+        self,
+        db_factory: async_sessionmaker[AsyncSession] = AsyncSessionLocal,
+        pool: SMTPConnectionPool | None = None,
+    ) -> None:
+        self._db_factory = db_factory
+        self._pool = pool or SMTPConnectionPool()
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        self._stopping = False
+        self._logger = get_logger("app.mail")
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._stopping = True
+        self._wake.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, timeout=settings.SMTP_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                self._task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await self._task
+            self._task = None
+        await self._pool.close()
+
+    def notify(self) -> None:
+        """Wake the worker early, e.g. right after a request committed an outbox row."""
+        self._wake.set()
+
+    async def _run(self) -> None:
+        batch_size = settings.MAIL_OUTBOX_BATCH_SIZE
+        while not self._stopping:
+            self._wake.clear()
+            try:
+                processed = await self.process_batch()
+            except Exception:
+                self._logger.exception("mail outbox batch failed")
+                processed = 0
+            if processed >= batch_size:
+                continue
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    self._wake.wait(), timeout=settings.MAIL_OUTBOX_POLL_SECONDS
+                )
+
+    async def _claim(self, db: AsyncSession) -> list[MailOutbox]:
+        due = (
+            select(MailOutbox.id)
+            .where(
+                MailOutbox.status.in_(_ACTIVE_STATUSES),
+                MailOutbox.next_attempt_at <= func.now(),
+            )
+            .order_by(MailOutbox.next_attempt_at)
+            .limit(settings.MAIL_OUTBOX_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+        lease = timedelta(seconds=settings.MAIL_OUTBOX_LEASE_SECONDS)
+        stmt = (
+            update(MailOutbox)
+            .where(MailOutbox.id.in_(due.scalar_subquery()))
+            .values(
+                status="sending",
+                attempts=MailOutbox.attempts + 1,
+                next_attempt_at=func.now() + lease,
+            )
+            .returning(MailOutbox)
+            .execution_options(synchronize_session=False)
+        )
+        rows = list((await db.execute(stmt)).scalars().all())
+        await db.commit()
+        return rows
+
+    async def _deliver(self, row: MailOutbox) -> dict[str, object]:
+        start = time.perf_counter()
+        try:
+            await self._pool.send(
+                build_message(row.recipient, row.subject, row.html), row.recipient
+            )
+        except Exception as e:  # noqa: BLE001
+            error = f"{type(e).__name__}: {e}"[:1000]
+            if is_permanent_failure(e) or row.attempts >= settings.MAIL_OUTBOX_MAX_ATTEMPTS:
+                inc("mail_failed")
+                self._logger.warning(
+                    "mail delivery failed permanently",
+                    extra={"outbox_id": row.id, "attempts": row.attempts, "error": error},
+                )
+                return {"id": row.id, "status": "failed", "last_error": error}
+            inc("mail_retry")
+            delay = _backoff_seconds(row.attempts)
+            self._logger.info(
+                "mail delivery deferred",
+                extra={"outbox_id": row.id, "attempts": row.attempts, "retry_in_s": int(delay)},
+            )
+            return {
+                "id": row.id,
+                "status": "pending",
+                "last_error": error,
+                "next_attempt_at": datetime.now(timezone.utc) + timedelta(seconds=delay),
+            }
+        inc("mail_sent")
+        observe("mail_send_duration_seconds", time.perf_counter() - start)
+        return {
+            "id": row.id,
+            "status": "sent",
+            "last_error": None,
+            "sent_at": datetime.now(timezone.utc),
+        }
+
+    async def _record_depth(self, db: AsyncSession) -> None:
+        depth = (
+            await db.execute(
+                select(func.count())
+                .select_from(MailOutbox)
+                .where(MailOutbox.status.in_(_ACTIVE_STATUSES))
+            )
+        ).scalar_one()
+        set_gauge("mail_outbox_depth", int(depth))
+
+    async def process_batch(self) -> int:
+        """Claim, send and settle one batch. Returns the number of rows claimed."""
+        async with self._db_factory() as db:
+            rows = await self._claim(db)
+            if not rows:
+                await self._record_depth(db)
+                await db.commit()
+                return 0
+
+        # the DB connection is released while SMTP I/O is in flight
+        results = await asyncio.gather(*(self._deliver(r) for r in rows))
+
+        async with self._db_factory() as db:
+            await db.execute(update(MailOutbox), results)
+            await self._record_depth(db)
+            await db.commit()
+        return len(rows)
+
+
+_worker: MailOutboxWorker | None = None
+
+
+def mail_worker_enabled() -> bool:
+    return bool(
+        settings.MAIL_OUTBOX_ENABLED
+        and settings.SMTP_HOST
+        and settings.SMTP_PORT
+        and settings.MAIL_FROM
+    )
+
+
+async def get_mail_worker() -> MailOutboxWorker:
+    global _worker
+    if _worker is None:
+        _worker = MailOutboxWorker()
+        await _worker.start()
+    return _worker
+
+
+def notify_mail_worker() -> None:
+    if _worker is not None:
+        _worker.notify()
+
+
+async def stop_mail_worker() -> None:
+    global _worker
+    if _worker is not None:
+        await _worker.stop()
+        _worker = None
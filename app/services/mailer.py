@@ -1,48 +1,194 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
+import time
+from collections.abc import AsyncIterator
 from email.message import EmailMessage
 from email.utils import parseaddr, formataddr
+from typing import Any
+
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.core.exceptions import BadRequest, ServiceUnavailable
 from app.core.logging import get_logger
+from app.models.mail_outbox import MailOutbox
 from pydantic import BaseModel, Field
 
 
-async def send_mail(to: str, subject: str, html: str) -> None:
+logger = get_logger(__name__)
+
+
+class MailMeta(BaseModel):
+    host: str
+    port: int
+    start_tls: bool
+    use_tls: bool
+    to: str
+    from_: str = Field(serialization_alias="from")
+
+
+def _ensure_configured() -> tuple[str, int]:
     host, port = settings.SMTP_HOST, settings.SMTP_PORT
-    username, password = settings.SMTP_USERNAME, settings.SMTP_PASSWORD
     if not host or not port or not settings.MAIL_FROM:
         raise BadRequest("Mail service not configured")
+    return host, int(port)
 
-    msg = EmailMessage()
+
+def _sender() -> tuple[str, str]:
     display = settings.MAIL_FROM or ""
     name, addr = parseaddr(display)
     sender_addr = (settings.SMTP_USERNAME or addr) or ""
-    header_from = formataddr((name or sender_addr, sender_addr))
+    return sender_addr, formataddr((name or sender_addr, sender_addr))
+
+
+def _use_tls(port: int) -> bool:
+    return (not settings.SMTP_STARTTLS) and port == 465
+
+
+def build_message(to: str, subject: str, html: str) -> EmailMessage:
+    _, header_from = _sender()
+    msg = EmailMessage()
     msg["From"] = header_from
     msg["To"] = to
     msg["Subject"] = subject
     msg.set_content(html, subtype="html")
+    return msg
+
+
+def is_permanent_failure(exc: BaseException) -> bool:
+    """5xx replies (bad recipient, rejected content) will not succeed on retry."""
+    import aiosmtplib
+
+    if isinstance(exc, aiosmtplib.SMTPRecipientsRefused):
+        # a 450 "mailbox busy" or greylisting refusal arrives here too
+        return bool(exc.recipients) and all(
+            500 <= int(r.code) < 600 for r in exc.recipients
+        )
+    if isinstance(exc, aiosmtplib.SMTPResponseException):
+        return 500 <= int(exc.code) < 600
+    return False
+
+
+class _PooledSMTP:
+    __slots__ = ("client", "last_used")
+
+    def __init__(self, client: Any) -> None:
+        self.client = client
+        self.last_used = time.monotonic()
+
 
-    class MailMeta(BaseModel):
-        host: str
-        port: int
-        start_tls: bool
-        use_tls: bool
-        to: str
-        from_: str = Field(serialization_alias="from")
+class SMTPConnectionPool:
+    """A small pool of persistent SMTP sessions.
 
-    logger = get_logger(__name__)
+    Connections are opened lazily, reused across messages and dropped when they
+    have been idle for longer than ``SMTP_POOL_IDLE_SECONDS`` (most relays close
+    idle sessions on their side anyway).
+    """
+
+    def __init__(self, size: int | None = None) -> None:
+        self._size = max(1, int(size or settings.SMTP_POOL_SIZE))
+        self._idle: asyncio.Queue[_PooledSMTP | None] = asyncio.Queue()
+        for _ in range(self._size):
+            self._idle.put_nowait(None)
+
+    async def _connect(self) -> _PooledSMTP:
+        import aiosmtplib
+
+        host, port = _ensure_configured()
+        use_tls = _use_tls(port)
+        client = aiosmtplib.SMTP(
+            hostname=host,
+            port=port,
+            username=settings.SMTP_USERNAME,
+            password=settings.SMTP_PASSWORD,
+            use_tls=use_tls,
+            start_tls=(settings.SMTP_STARTTLS and not use_tls),
+            timeout=settings.SMTP_TIMEOUT_SECONDS,
+        )
+        await client.connect()
+        return _PooledSMTP(client)
+
+    @staticmethod
+    async def _discard(conn: _PooledSMTP | None) -> None:
+        if conn is None:
+            return
+        with contextlib.suppress(Exception):
+            if conn.client.is_connected:
+                await asyncio.wait_for(conn.client.quit(), timeout=2)
+        with contextlib.suppress(Exception):
+            conn.client.close()
+
+    @contextlib.asynccontextmanager
+    async def acquire(self) -> AsyncIterator[Any]:
+        conn = await self._idle.get()
+        try:
+            if conn is not None and (
+                not conn.client.is_connected
+                or time.monotonic() - conn.last_used > settings.SMTP_POOL_IDLE_SECONDS
+            ):
+                await self._discard(conn)
+                conn = None
+            if conn is None:
+                conn = await self._connect()
+            yield conn.client
+            conn.last_used = time.monotonic()
+        except BaseException:
+            # never hand a connection in an unknown protocol state to the next sender
+            await self._discard(conn)
+            conn = None
+            raise
+        finally:
+            self._idle.put_nowait(conn)
+
+    async def send(self, msg: EmailMessage, to: str) -> None:
+        import aiosmtplib
+
+        sender_addr, _ = _sender()
+        for attempt in range(2):
+            try:
+                async with self.acquire() as client:
+                    await asyncio.wait_for(
+                        client.send_message(msg, sender=sender_addr, recipients=[to]),
+                        timeout=settings.SMTP_TIMEOUT_SECONDS,
+                    )
+                return
+            except aiosmtplib.SMTPServerDisconnected:
+                # the relay closed a pooled session before we noticed (restart,
+                # its own idle timeout); one retry goes out on a fresh connection
+                if attempt:
+                    raise
+
+    async def close(self) -> None:
+        for _ in range(self._size):
+            conn = await self._idle.get()
+            await self._discard(conn)
+        for _ in range(self._size):
+            self._idle.put_nowait(None)
+
+
+async def enqueue_mail(db: AsyncSession, to: str, subject: str, html: str) -> MailOutbox:
+    """Stage a mail in the outbox; it is delivered once the caller commits."""
+    _ensure_configured()
+    row = MailOutbox(recipient=to, subject=subject, html=html)
+    db.add(row)
+    return row
+
+
+async def send_mail(to: str, subject: str, html: str) -> None:
+    host, port = _ensure_configured()
+    username, password = settings.SMTP_USERNAME, settings.SMTP_PASSWORD
+    sender_addr, header_from = _sender()
+    msg = build_message(to, subject, html)
 
     async def _send() -> None:
         import aiosmtplib
 
-        use_tls = (not settings.SMTP_STARTTLS) and int(port) == 465
+        use_tls = _use_tls(port)
         meta = MailMeta(
             host=host,
-            port=int(port),
+            port=port,
             start_tls=bool(settings.SMTP_STARTTLS),
             use_tls=use_tls,
             to=to,
@@ -63,7 +209,7 @@ async def send_mail(to: str, subject: str, html: str) -> None:
         logger.info("mail_sent", extra={"meta": meta.model_dump()})
 
     try:
-        await asyncio.wait_for(_send(), timeout=10)
+        await asyncio.wait_for(_send(), timeout=settings.SMTP_TIMEOUT_SECONDS)
     except Exception as e:
         logger.exception("mail_failed: %s", str(e))
         raise ServiceUnavailable("Failed to send email") from e
@@ -1,31 +1,34 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
+import asyncio
+import hashlib
+import html
+from datetime import datetime
 from pathlib import Path
 from typing import Iterable
 
 from fastapi import UploadFile
-from sqlalchemy import select, update, String, or_
+from sqlalchemy import func, select, update, String, or_
 from sqlalchemy.dialects.postgresql import array as pg_array, ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
+from app.core.decorators import record_timing
 from app.core.exceptions import BadRequest, Conflict, NotFound
+from app.core.executors import run_cpu
+from app.core.images import render_avatar
+from app.core.metrics import inc
+from app.core.storage import get_storage
 from app.models.attachment import Attachment
 from app.models.user import User
 from app.models.user_resume import UserResume
-from app.schemas.user import ResumeVersionOut, UserOut, UserUpdate
-
-
-def _uploads_dir() -> Path:
-    base = getattr(settings, "UPLOAD_DIR", "uploads")
-    p = Path(base)
-    p.mkdir(parents=True, exist_ok=True)
-    (p / "avatars").mkdir(parents=True, exist_ok=True)
-    (p / "resumes").mkdir(parents=True, exist_ok=True)
-    return p
+from app.schemas.user import ResumeSearchHitOut, ResumeVersionOut, UserOut, UserUpdate
+from app.services.attachment_scanner import notify_attachment_scanner, status_after_upload
+from app.services.resume_indexer import notify_resume_indexer
+from app.services.uploads import store_uploads
 
 
+@record_timing("profile_service.get_me_service")
 async def get_me_service(db: AsyncSession, user_id: int) -> UserOut:
     row = await db.get(User, user_id)
     if row is None:
@@ -40,6 +43,7 @@ async def get_me_service(db: AsyncSession, user_id: int) -> UserOut:
                 Attachment.filename,
                 Attachment.size_bytes,
                 Attachment.s3_key,
+                UserResume.text_status,
             )
             .join(Attachment, Attachment.id == UserResume.attachment_id)
             .where(
@@ -51,7 +55,7 @@ async def get_me_service(db: AsyncSession, user_id: int) -> UserOut:
 
     base = UserOut.model_validate(row, from_attributes=True)
     if resume_row:
-        rid, created_at, aid, fname, size, path = resume_row
+        rid, created_at, aid, fname, size, path, text_status = resume_row
         resume = ResumeVersionOut(
             id=rid,
             attachment_id=aid,
@@ -59,11 +63,13 @@ async def get_me_service(db: AsyncSession, user_id: int) -> UserOut:
             size_bytes=int(size),
             created_at=created_at,
             path=str(path),
+            text_status=text_status,
         )
         return base.model_copy(update={"resume": resume})
     return base
 
 
+@record_timing("profile_service.update_me_service")
 async def update_me_service(
     db: AsyncSession,
     user_id: int,
@@ -99,50 +105,81 @@ async def update_me_service(
 
 
 def _validate_avatar(file: UploadFile) -> None:
-    if file.content_type not in {"image/jpeg", "image/png"}:
-        raise BadRequest("Avatar must be JPEG or PNG")
+    if file.content_type not in {"image/jpeg", "image/png", "image/webp"}:
+        raise BadRequest("Avatar must be JPEG, PNG or WebP")
 
 
+@record_timing("profile_service.upload_avatar_service")
 async def upload_avatar_service(
     db: AsyncSession, user_id: int, file: UploadFile
 ) -> UserOut:
+    """Store the avatar as WebP renditions at every ``AVATAR_SIZES`` size.
+
+    Decoding and resizing run in the CPU process pool; the original upload
+    is not kept. The renditions live under a content-derived version, so
+    their URLs never change meaning and are served as immutable.
+    """
     _validate_avatar(file)
-    data = await file.read()
-    if len(data) > 2 * 1024 * 1024:
-        raise BadRequest("Avatar size must be <= 2MB")
+    limit = settings.AVATAR_MAX_BYTES
+    data = await file.read(limit + 1)
+    if len(data) > limit:
+        raise BadRequest(f"Avatar size must be <= {limit // (1024 * 1024)}MB")
 
-    suffix = ".jpg" if file.content_type == "image/jpeg" else ".png"
-    ts = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
-    dest = _uploads_dir() / "avatars" / f"{user_id}_{ts}{suffix}"
-    dest.write_bytes(data)
+    try:
+        renditions = await run_cpu(
+            render_avatar,
+            data,
+            settings.AVATAR_SIZES,
+            settings.AVATAR_WEBP_QUALITY,
+            settings.AVATAR_MAX_PIXELS,
+        )
+    except ValueError:
+        raise BadRequest("Avatar is not a valid image") from None
+    prefix = f"avatars/{user_id}/{hashlib.sha256(data).hexdigest()[:16]}"
+    storage = get_storage()
+    await asyncio.gather(
+        *(
+            storage.put_bytes(f"{prefix}/{size}.webp", body, "image/webp")
+            for size, body in renditions.items()
+        )
+    )
+    inc("avatar_bytes_in", len(data))
+    inc("avatar_bytes_out", sum(len(b) for b in renditions.values()))
 
     user = await db.get(User, user_id)
     if user is None:
         raise NotFound()
-    user.avatar_path = str(dest.as_posix())
+    user.avatar_path = prefix
     await db.commit()
     await db.refresh(user)
     return UserOut.model_validate(user, from_attributes=True)
 
 
+@record_timing("profile_service.upload_resume_service")
 async def upload_resume_service(
     db: AsyncSession, user_id: int, file: UploadFile
 ) -> ResumeVersionOut:
-    data = await file.read()
-    ts = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
-    safe_name = Path(file.filename or f"resume_{ts}").name
-    dest = _uploads_dir() / "resumes" / f"{user_id}_{ts}_{safe_name}"
-    dest.write_bytes(data)
+    """Store a new current resume; its text is indexed later, in the background.
+
+    The body is capped by the route and streamed into the blob store in
+    chunks, so a resume is never held in memory whole.
+    """
+    limit = settings.RESUME_MAX_BYTES
+    if file.size is not None and file.size > limit:
+        raise BadRequest(f"Resume size must be <= {limit // (1024 * 1024)}MB")
+    # a body without a declared size is cut off while streaming, before
+    # anything is written
+    (stored,) = await store_uploads(db, [file], Path(settings.UPLOAD_DIR), max_bytes=limit)
 
     attach = Attachment(
         message_id=None,
         uploader_id=user_id,
-        s3_key=str(dest.as_posix()),
-        filename=safe_name,
-        content_type=file.content_type or "application/octet-stream",
-        size_bytes=len(data),
-        status="ready",
-        checksum=None,
+        s3_key=stored.key,
+        filename=stored.filename,
+        content_type=stored.content_type,
+        size_bytes=stored.size,
+        status=status_after_upload(),
+        checksum=stored.checksum,
     )
     db.add(attach)
     await db.flush()
@@ -159,6 +196,8 @@ async def upload_resume_service(
     db.add(ur)
     await db.commit()
     await db.refresh(ur)
+    notify_attachment_scanner()
+    notify_resume_indexer()
     return ResumeVersionOut(
         id=ur.id,
         attachment_id=attach.id,
@@ -166,9 +205,11 @@ async def upload_resume_service(
         size_bytes=attach.size_bytes,
         created_at=ur.created_at,
         path=attach.s3_key,
+        text_status=ur.text_status,
     )
 
 
+@record_timing("profile_service.list_resume_versions_service")
 async def list_resume_versions_service(
     db: AsyncSession, user_id: int
 ) -> list[ResumeVersionOut]:
@@ -180,6 +221,7 @@ async def list_resume_versions_service(
             Attachment.filename,
             Attachment.size_bytes,
             Attachment.s3_key,
+            UserResume.text_status,
         )
         .join(Attachment, Attachment.id == UserResume.attachment_id)
         .where(UserResume.user_id == user_id)
@@ -187,7 +229,7 @@ async def list_resume_versions_service(
     )
     rows = (await db.execute(q)).all()
     out: list[ResumeVersionOut] = []
-    for rid, created_at, aid, fname, size, path in rows:
+    for rid, created_at, aid, fname, size, path, text_status in rows:
         out.append(
             ResumeVersionOut(
                 id=rid,
@@ -196,11 +238,13 @@ async def list_resume_versions_service(
                 size_bytes=int(size),
                 created_at=created_at,
                 path=str(path),
+                text_status=text_status,
             )
         )
     return out
 
 
+@record_timing("profile_service.search_by_skills_service")
 async def search_by_skills_service(
     db: AsyncSession, skills: Iterable[str], limit: int
 ) -> list[UserOut]:
@@ -213,6 +257,87 @@ async def search_by_skills_service(
     return [UserOut.model_validate(u, from_attributes=True) for u in rows]
 
 
+# ts_headline marks hits with these instead of HTML: the resume text is
+# escaped first and only then are the marks turned into <b></b>
+_HIT_START = "\x02"
+_HIT_STOP = "\x03"
+
+
+def _highlight(snippet: str) -> str:
+    return (
+        html.escape(snippet)
+        .replace(_HIT_START, "<b>")
+        .replace(_HIT_STOP, "</b>")
+    )
+
+
+@record_timing("profile_service.search_resumes_service")
+async def search_resumes_service(
+    db: AsyncSession, q: str, limit: int
+) -> list[ResumeSearchHitOut]:
+    """Current resumes matching ``q`` (web-search syntax), best match first.
+
+    Ranking uses the GIN-indexed ``search_vector``; snippets are only built
+    for the page of hits that is returned.
+    """
+    q = q.strip()
+    if not q:
+        return []
+    query = func.websearch_to_tsquery("simple", q)
+    rank = func.ts_rank_cd(UserResume.search_vector, query)
+    top = (
+        select(UserResume.id, rank.label("rank"))
+        .where(
+            UserResume.is_current == True,  # noqa: E712
+            UserResume.search_vector.bool_op("@@")(query),
+        )
+        .order_by(rank.desc(), UserResume.id.desc())
+        .limit(limit)
+        .subquery()
+    )
+    snippet = func.ts_headline(
+        "simple",
+        # a resume containing the marks itself must not inject tags
+        func.translate(UserResume.content_text, _HIT_START + _HIT_STOP, ""),
+        query,
+        f'StartSel="{_HIT_START}", StopSel="{_HIT_STOP}", '
+        'MaxFragments=2, MinWords=5, MaxWords=20, FragmentDelimiter=" … "',
+    )
+    rows = (
+        await db.execute(
+            select(
+                User.id,
+                User.name,
+                User.email,
+                UserResume.id,
+                Attachment.id,
+                Attachment.filename,
+                top.c.rank,
+                snippet,
+            )
+            .select_from(top)
+            .join(UserResume, UserResume.id == top.c.id)
+            .join(User, User.id == UserResume.user_id)
+            .join(Attachment, Attachment.id == UserResume.attachment_id)
+            .order_by(top.c.rank.desc(), UserResume.id.desc())
+        )
+    ).all()
+    return [
+        ResumeSearchHitOut(
+            user_id=uid,
+            name=name,
+            email=email,
+            resume_id=rid,
+            attachment_id=aid,
+            filename=str(fname),
+            rank=float(r),
+            snippet=_highlight(str(snip or "")),
+        )
+        for uid, name, email, rid, aid, fname, r, snip in rows
+    ]
+
+
+@record_timing("profile_service.list_users_service")
 async def list_users_service(
     db: AsyncSession, *, q: str | None, limit: int, cursor: int | None
 ) -> list[UserOut]:
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.documents import extract_text
+from app.core.executors import run_cpu
+from app.core.logging import get_logger
+from app.core.metrics import inc, set_gauge
+from app.core.storage import get_storage
+from app.db.session import AsyncSessionLocal
+from app.models.attachment import Attachment
+from app.models.user_resume import UserResume
+
+
+_ACTIVE_STATUSES = ("pending", "extracting")
+
+
+def _result(
+    resume_id: int, status: str, next_attempt_at: datetime, text: str | None = None
+) -> dict[str, object]:
+    return {
+        "id": resume_id,
+        "text_status": status,
+        "text_next_attempt_at": next_attempt_at,
+        "content_text": text,
+    }
+
+
+class ResumeIndexer:
+    """Extracts resume text into ``user_resumes.content_text`` for search.
+
+    Rows are claimed with ``FOR UPDATE SKIP LOCKED`` and leased by pushing
+    ``text_next_attempt_at`` forward, as the mail outbox worker does, so every
+    app process can run one. Parsing runs in the CPU process pool; no DB
+    connection is held while files are fetched or parsed.
+    """
+
+    def __init__(
+        self, db_factory: async_sessionmaker[AsyncSession] = AsyncSessionLocal
+    ) -> None:
+        self._db_factory = db_factory
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        self._logger = get_logger("app.resume_indexer")
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def notify(self) -> None:
+        """Wake the indexer early, e.g. right after a resume was committed."""
+        self._wake.set()
+
+    async def _run(self) -> None:
+        batch_size = settings.RESUME_INDEX_BATCH_SIZE
+        while True:
+            self._wake.clear()
+            try:
+                processed = await self.process_batch()
+            except Exception:
+                self._logger.exception("resume indexing batch failed")
+                processed = 0
+            if processed >= batch_size:
+                continue
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    self._wake.wait(), timeout=settings.RESUME_INDEX_POLL_SECONDS
+                )
+
+    async def _claim(
+        self, db: AsyncSession
+    ) -> list[tuple[int, int, str, str, str]]:
+        due = (
+            select(UserResume.id)
+            .where(
+                UserResume.text_status.in_(_ACTIVE_STATUSES),
+                UserResume.text_next_attempt_at <= func.now(),
+            )
+            .order_by(UserResume.text_next_attempt_at)
+            .limit(settings.RESUME_INDEX_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+        lease = timedelta(seconds=settings.RESUME_INDEX_LEASE_SECONDS)
+        claimed = (
+            update(UserResume)
+            .where(UserResume.id.in_(due.scalar_subquery()))
+            .values(
+                text_status="extracting",
+                text_attempts=UserResume.text_attempts + 1,
+                text_next_attempt_at=func.now() + lease,
+            )
+            .returning(UserResume.id, UserResume.attachment_id, UserResume.text_attempts)
+            .execution_options(synchronize_session=False)
+        )
+        rows = (await db.execute(claimed)).all()
+        await db.commit()
+        if not rows:
+            return []
+        attempts = {int(rid): int(n) for rid, _, n in rows}
+        files = (
+            await db.execute(
+                select(
+                    UserResume.id,
+                    Attachment.s3_key,
+                    Attachment.content_type,
+                    Attachment.filename,
+                )
+                .join(Attachment, Attachment.id == UserResume.attachment_id)
+                .where(UserResume.id.in_(list(attempts)))
+            )
+        ).all()
+        # a resume whose attachment is gone has nothing to extract; left
+        # "extracting" it would be leased again forever
+        missing = set(attempts) - {int(rid) for rid, *_ in files}
+        if missing:
+            await db.execute(
+                update(UserResume),
+                [_result(rid, "failed", datetime.now(timezone.utc)) for rid in sorted(missing)],
+            )
+            await db.commit()
+            inc("resume_text_failed", len(missing))
+            self._logger.warning(
+                "resume attachment missing", extra={"resume_ids": sorted(missing)}
+            )
+        return [
+            (int(rid), attempts[int(rid)], key, ctype, fname)
+            for rid, key, ctype, fname in files
+        ]
+
+    async def _extract(
+        self, resume_id: int, attempts: int, key: str, content_type: str, filename: str
+    ) -> dict[str, object]:
+        now = datetime.now(timezone.utc)
+        try:
+            data = await get_storage().read_bytes(key)
+            text = await run_cpu(
+                extract_text, data, content_type, filename, settings.RESUME_TEXT_MAX_CHARS
+            )
+        except ValueError as e:
+            # the file itself is unreadable: retrying will not help
+            inc("resume_text_failed")
+            self._logger.info(
+                "resume text extraction failed",
+                extra={"resume_id": resume_id, "error": str(e)[:200]},
+            )
+            return _result(resume_id, "failed", now)
+        except Exception as e:  # noqa: BLE001
+            if attempts >= settings.RESUME_INDEX_MAX_ATTEMPTS:
+                inc("resume_text_failed")
+                self._logger.warning(
+                    "resume text extraction gave up",
+                    extra={"resume_id": resume_id, "attempts": attempts, "error": repr(e)[:200]},
+                )
+                return _result(resume_id, "failed", now)
+            inc("resume_text_retry")
+            delay = settings.RESUME_INDEX_POLL_SECONDS * (2**attempts)
+            return _result(resume_id, "pending", now + timedelta(seconds=delay))
+        if text is None:
+            inc("resume_text_unsupported")
+            return _result(resume_id, "unsupported", now)
+        inc("resume_text_indexed")
+        return _result(resume_id, "indexed", now, text)
+
+    async def _record_depth(self, db: AsyncSession) -> None:
+        depth = (
+            await db.execute(
+                select(func.count())
+                .select_from(UserResume)
+                .where(UserResume.text_status.in_(_ACTIVE_STATUSES))
+            )
+        ).scalar_one()
+        set_gauge("resume_index_depth", int(depth))
+
+    async def process_batch(self) -> int:
+        """Claim, extract and store one batch. Returns the number of rows claimed."""
+        async with self._db_factory() as db:
+            claimed = await self._claim(db)
+            if not claimed:
+                await self._record_depth(db)
+                await db.commit()
+                return 0
+
+        # a fetched resume is held in memory until it is parsed, so fetch no
+        # more at once than the process pool parses
+        slots = asyncio.Semaphore(max(1, settings.CPU_WORKERS))
+
+        async def _extract(c: tuple[int, int, str, str, str]) -> dict[str, object]:
+            async with slots:
+                return await self._extract(*c)
+
+        results = await asyncio.gather(*(_extract(c) for c in claimed))
+
+        async with self._db_factory() as db:
+            await db.execute(update(UserResume), results)
+            await self._record_depth(db)
+            await db.commit()
+        return len(claimed)
+
+
+_indexer: ResumeIndexer | None = None
+
+
+async def start_resume_indexer() -> None:
+    global _indexer
+    if _indexer is None:
+        _indexer = ResumeIndexer()
+        await _indexer.start()
+
+
+def notify_resume_indexer() -> None:
+    if _indexer is not None:
+        _indexer.notify()
+
+
+async def stop_resume_indexer() -> None:
+    global _indexer
+    if _indexer is not None:
+        await _indexer.stop()
+        _indexer = None
@@ -0,0 +1,450 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import hashlib
+import os
+import re
+import shutil
+from collections.abc import AsyncIterator
+from datetime import timedelta
+from pathlib import Path
+from typing import BinaryIO
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.decorators import record_timing
+from app.core.exceptions import BadRequest, Conflict, Forbidden, NotFound
+from app.core.executors import run_io
+from app.core.logging import get_logger
+from app.core.metrics import inc
+from app.core.storage import get_storage
+from app.db.session import AsyncSessionLocal, release_connection
+from app.models.attachment import Attachment
+from app.schemas.chat import (
+    AttachmentInitIn,
+    AttachmentInitOut,
+    DirectUploadIn,
+    DirectUploadOut,
+    PresignedUploadOut,
+    UploadPartOut,
+    UploadSessionOut,
+)
+from app.services.attachment_scanner import notify_attachment_scanner, status_after_upload
+from app.services.blob_store import add_blobs, blob_key, lock_blobs
+from app.services.uploads import adopt_blob, open_temp, sanitize_filename, stage
+
+
+logger = get_logger(__name__)
+
+_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _parts_dir(attachment_id: int) -> Path:
+    return Path(settings.UPLOAD_DIR) / ".parts" / str(attachment_id)
+
+
+def _part_path(attachment_id: int, part_number: int) -> Path:
+    return _parts_dir(attachment_id) / f"{part_number:06d}"
+
+
+def _part_count(size: int, part_size: int) -> int:
+    return max(1, -(-size // part_size))
+
+
+def _expected_part_size(row: Attachment, part_number: int) -> int:
+    part_size = int(row.part_size or 0)
+    count = _part_count(int(row.size_bytes), part_size)
+    if part_number < count:
+        return part_size
+    return int(row.size_bytes) - part_size * (count - 1)
+
+
+def _upload_url(attachment_id: int) -> str:
+    base = settings.BACKEND_PUBLIC_BASE_URL or ""
+    return f"{base}/api/chat/attachments/{attachment_id}/parts"
+
+
+async def _open_session(
+    db: AsyncSession, attachment_id: int, user_id: int, *, for_update: bool = False
+) -> tuple[Attachment, bool]:
+    """The session's row and whether it has expired (judged by the DB clock)."""
+    stmt = select(
+        Attachment,
+        func.coalesce(Attachment.expires_at < func.now(), False).label("expired"),
+    ).where(Attachment.id == attachment_id)
+    if for_update:
+        stmt = stmt.with_for_update(of=Attachment)
+    found = (await db.execute(stmt)).one_or_none()
+    if found is None:
+        raise NotFound("upload session not found")
+    row, expired = found
+    if int(row.uploader_id) != int(user_id):
+        raise Forbidden("forbidden")
+    return row, bool(expired)
+
+
+def _require_parts(row: Attachment) -> None:
+    # direct uploads (and plain multipart ones) have no parts to list or take
+    if row.part_size is None:
+        raise NotFound("upload session not found")
+
+
+def _require_uploading(row: Attachment, expired: bool) -> None:
+    if row.status != "uploading":
+        raise Conflict("upload already completed", data={"status": row.status})
+    if expired:
+        raise NotFound("upload session expired")
+
+
+@record_timing("upload_sessions.init_upload_service")
+async def init_upload_service(
+    db: AsyncSession, user_id: int, payload: AttachmentInitIn
+) -> AttachmentInitOut:
+    if payload.size <= 0:
+        raise BadRequest("size must be positive")
+    if payload.size > settings.UPLOAD_RESUMABLE_MAX_BYTES:
+        raise BadRequest(
+            f"size must be <= {settings.UPLOAD_RESUMABLE_MAX_BYTES}",
+            data={"max_bytes": settings.UPLOAD_RESUMABLE_MAX_BYTES},
+        )
+    part_size = max(64 * 1024, settings.UPLOAD_PART_BYTES)
+    row = Attachment(
+        uploader_id=user_id,
+        s3_key="",
+        filename=sanitize_filename(payload.filename),
+        content_type=payload.content_type[:127] or "application/octet-stream",
+        size_bytes=payload.size,
+        status="uploading",
+        checksum=None,
+        part_size=part_size,
+        expires_at=func.now()
+        + timedelta(seconds=settings.UPLOAD_SESSION_TTL_SECONDS),
+    )
+    db.add(row)
+    await db.commit()
+    await db.refresh(row)
+    assert row.expires_at is not None
+    return AttachmentInitOut(
+        attachment_id=int(row.id),
+        upload_url=_upload_url(int(row.id)),
+        part_size=part_size,
+        part_count=_part_count(payload.size, part_size),
+        expires_at=row.expires_at,
+    )
+
+
+@record_timing("upload_sessions.init_direct_upload_service")
+async def init_direct_upload_service(
+    db: AsyncSession, user_id: int, payload: DirectUploadIn
+) -> DirectUploadOut:
+    """Start an upload the client sends straight to storage.
+
+    The object is written at its blob key, so content the store already
+    holds needs no upload at all and the attachment is stored at once.
+    """
+    sha256 = payload.sha256.lower()
+    if not _SHA256.match(sha256):
+        raise BadRequest("sha256 must be the file's hex SHA-256")
+    if payload.size <= 0:
+        raise BadRequest("size must be positive")
+    if payload.size > settings.UPLOAD_RESUMABLE_MAX_BYTES:
+        raise BadRequest(
+            f"size must be <= {settings.UPLOAD_RESUMABLE_MAX_BYTES}",
+            data={"max_bytes": settings.UPLOAD_RESUMABLE_MAX_BYTES},
+        )
+    content_type = payload.content_type[:127] or "application/octet-stream"
+    row = Attachment(
+        uploader_id=user_id,
+        s3_key=blob_key(sha256),
+        filename=sanitize_filename(payload.filename),
+        content_type=content_type,
+        size_bytes=payload.size,
+    )
+    known = (await lock_blobs(db, [sha256])).get(sha256)
+    if known is not None:
+        # the FOR SHARE lock keeps GC off the blob until this row references it
+        row.s3_key = known
+        row.status = status_after_upload()
+        row.checksum = sha256
+        db.add(row)
+        await db.commit()
+        notify_attachment_scanner()
+        inc("upload_dedup_bytes", payload.size)
+        return DirectUploadOut(attachment_id=int(row.id), status=row.status)
+
+    ttl = settings.STORAGE_UPLOAD_URL_TTL_SECONDS
+    row.status = "uploading"
+    row.expires_at = func.now() + timedelta(seconds=ttl)
+    db.add(row)
+    await db.commit()
+    await db.refresh(row)
+    upload = get_storage().presign_put(
+        row.s3_key,
+        content_type=content_type,
+        size=payload.size,
+        sha256=sha256,
+        ttl_seconds=ttl,
+    )
+    return DirectUploadOut(
+        attachment_id=int(row.id),
+        status=row.status,
+        upload=PresignedUploadOut(**upload.model_dump()),
+        expires_at=row.expires_at,
+    )
+
+
+async def _complete_direct_upload(
+    db: AsyncSession, row: Attachment, user_id: int
+) -> Attachment:
+    attachment_id, key = int(row.id), row.s3_key
+    expected = int(row.size_bytes)
+    # the direct upload was bound to its blob key, which ends in the checksum
+    checksum = key.rsplit("/", 1)[-1]
+    await release_connection(db)
+    storage = get_storage()
+    size = await storage.size(key)
+    if size is None:
+        raise BadRequest("file has not been uploaded")
+    if size != expected:
+        raise BadRequest(
+            f"stored object is {size} bytes, expected {expected}",
+            data={"expected": expected, "received": size},
+        )
+
+    row, _ = await _open_session(db, attachment_id, user_id, for_update=True)
+    if row.status != "uploading":
+        await db.commit()
+        return row
+    if checksum not in await lock_blobs(db, [checksum]):
+        await add_blobs(db, {checksum: size})
+        # blob GC may have removed an older unreferenced copy at this key
+        # (and the object with it) while we waited for the lock above
+        if await storage.size(key) != size:
+            await db.rollback()
+            raise Conflict("file was removed, upload it again")
+    row.checksum = checksum
+    row.status = status_after_upload()
+    row.expires_at = None
+    await db.commit()
+    notify_attachment_scanner()
+    inc("upload_direct_completed")
+    return row
+
+
+def _list_parts(attachment_id: int) -> list[int]:
+    try:
+        names = os.listdir(_parts_dir(attachment_id))
+    except FileNotFoundError:
+        return []
+    return sorted(int(n) for n in names if n.isdigit())
+
+
+@record_timing("upload_sessions.upload_session_status_service")
+async def upload_session_status_service(
+    db: AsyncSession, attachment_id: int, user_id: int
+) -> UploadSessionOut:
+    row, _ = await _open_session(db, attachment_id, user_id)
+    _require_parts(row)
+    await release_connection(db)
+    part_size = int(row.part_size or 0)
+    received = (
+        await run_io(_list_parts, attachment_id) if row.status == "uploading" else []
+    )
+    return UploadSessionOut(
+        attachment_id=int(row.id),
+        status=row.status,
+        part_size=part_size,
+        part_count=_part_count(int(row.size_bytes), part_size),
+        received_parts=received,
+        expires_at=row.expires_at,
+    )
+
+
+def _publish_part(tmp: Path, dest: Path) -> None:
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(tmp, dest)
+
+
+@record_timing("upload_sessions.upload_part_service")
+async def upload_part_service(
+    db: AsyncSession,
+    attachment_id: int,
+    part_number: int,
+    user_id: int,
+    chunks: AsyncIterator[bytes],
+    sha256: str | None,
+) -> UploadPartOut:
+    """Store one part. Parts may arrive in any order, in parallel, and again."""
+    if sha256 is None or not _SHA256.match(sha256.lower()):
+        raise BadRequest("X-Part-SHA256 header with the part's hex SHA-256 is required")
+    row, expired = await _open_session(db, attachment_id, user_id)
+    _require_parts(row)
+    _require_uploading(row, expired)
+    part_count = _part_count(int(row.size_bytes), int(row.part_size or 0))
+    if not 1 <= part_number <= part_count:
+        raise BadRequest(f"part_number must be between 1 and {part_count}")
+    expected = _expected_part_size(row, part_number)
+    # the body streams straight to disk; no connection is held meanwhile
+    await release_connection(db)
+
+    tmp, digest, size = await stage(chunks, Path(settings.UPLOAD_DIR))
+    try:
+        if size != expected:
+            raise BadRequest(
+                f"part {part_number} must be {expected} bytes, got {size}",
+                data={"expected": expected, "received": size},
+            )
+        if digest != sha256.lower():
+            raise BadRequest("part checksum mismatch", data={"sha256": digest})
+        await run_io(_publish_part, tmp, _part_path(attachment_id, part_number))
+    except BaseException:
+        await run_io(tmp.unlink, True)
+        raise
+    inc("upload_parts_received")
+    return UploadPartOut(part_number=part_number, size=size, sha256=digest)
+
+
+def _assemble(parts: list[Path], out: BinaryIO) -> str:
+    """Concatenate ``parts`` into ``out`` through one reused buffer, hashing as it goes."""
+    hasher = hashlib.sha256()
+    buf = bytearray(max(64 * 1024, settings.UPLOAD_CHUNK_BYTES))
+    view = memoryview(buf)
+    for part in parts:
+        with part.open("rb") as src:
+            while n := src.readinto(buf):
+                hasher.update(view[:n])
+                out.write(view[:n])
+    return hasher.hexdigest()
+
+
+def _part_sizes(attachment_id: int, count: int) -> list[int | None]:
+    sizes: list[int | None] = []
+    for n in range(1, count + 1):
+        try:
+            sizes.append(_part_path(attachment_id, n).stat().st_size)
+        except FileNotFoundError:
+            sizes.append(None)
+    return sizes
+
+
+@record_timing("upload_sessions.complete_upload_service")
+async def complete_upload_service(
+    db: AsyncSession, attachment_id: int, user_id: int
+) -> Attachment:
+    """Assemble the parts into a blob and hand the attachment to the scanner."""
+    row, expired = await _open_session(db, attachment_id, user_id)
+    if row.status != "uploading":
+        # completed already; scanning or done
+        return row
+    _require_uploading(row, expired)
+    if row.part_size is None:
+        return await _complete_direct_upload(db, row, user_id)
+    count = _part_count(int(row.size_bytes), int(row.part_size or 0))
+    await release_connection(db)
+
+    sizes = await run_io(_part_sizes, attachment_id, count)
+    missing = [n for n, s in enumerate(sizes, 1) if s != _expected_part_size(row, n)]
+    if missing:
+        raise BadRequest("upload incomplete", data={"missing_parts": missing[:1000]})
+
+    root = Path(settings.UPLOAD_DIR)
+    tmp, out = await run_io(open_temp, root)
+    try:
+        try:
+            checksum = await run_io(
+                _assemble, [_part_path(attachment_id, n) for n in range(1, count + 1)], out
+            )
+        finally:
+            await run_io(out.close)
+
+        # a concurrent complete may have won while we were assembling
+        row, _ = await _open_session(db, attachment_id, user_id, for_update=True)
+        if row.status != "uploading":
+            await run_io(tmp.unlink, True)
+            await db.commit()
+            return row
+        row.s3_key = await adopt_blob(db, tmp, checksum, int(row.size_bytes))
+    except BaseException:
+        await run_io(tmp.unlink, True)
+        raise
+    row.checksum = checksum
+    row.status = status_after_upload()
+    row.expires_at = None
+    await db.commit()
+    notify_attachment_scanner()
+    await run_io(shutil.rmtree, _parts_dir(attachment_id), True)
+    inc("upload_sessions_completed")
+    return row
+
+
+async def expire_upload_sessions(db: AsyncSession, limit: int = 500) -> int:
+    """Delete unfinished sessions past ``expires_at`` together with their parts."""
+    ids = list(
+        (
+            await db.execute(
+                select(Attachment.id)
+                .where(Attachment.status == "uploading", Attachment.expires_at < func.now())
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+        )
+        .scalars()
+        .all()
+    )
+    if not ids:
+        await release_connection(db)
+        return 0
+    await db.execute(delete(Attachment).where(Attachment.id.in_(ids)))
+    await db.commit()
+    for attachment_id in ids:
+        await run_io(shutil.rmtree, _parts_dir(attachment_id), True)
+    inc("upload_sessions_expired", len(ids))
+    logger.info("expired upload sessions", extra={"count": len(ids)})
+    return len(ids)
+
+
+class UploadSessionReaper:
+    """Periodically discards expired upload sessions (safe on every worker)."""
+
+    def __init__(self) -> None:
+        self._task: asyncio.Task[None] | None = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.UPLOAD_SESSION_REAP_SECONDS)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await expire_upload_sessions(db)
+            except Exception:
+                logger.exception("upload session reaping failed")
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+
+_reaper: UploadSessionReaper | None = None
+
+
+async def start_upload_reaper() -> None:
+    global _reaper
+    if _reaper is None:
+        _reaper = UploadSessionReaper()
+        await _reaper.start()
+
+
+async def stop_upload_reaper() -> None:
+    global _reaper
+    if _reaper is not None:
+        await _reaper.stop()
+        _reaper = None
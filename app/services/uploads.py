@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import re
+import uuid
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable
+from pathlib import Path
+from typing import BinaryIO, NamedTuple, TypeVar, cast
+
+from fastapi import UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.exceptions import BadRequest
+from app.core.executors import run_io
+from app.core.metrics import inc
+from app.core.security import UploadGrant
+from app.core.storage import get_storage
+from app.db.session import release_connection
+from app.services.blob_store import add_blobs, blob_key, blob_keys, lock_blobs
+
+
+T = TypeVar("T")
+
+
+class StoredFile(NamedTuple):
+    key: str
+    filename: str
+    size: int
+    content_type: str
+    checksum: str
+
+
+def sanitize_filename(name: str) -> str:
+    base = name.rsplit("/", 1)[-1].rsplit("\\", 1)[-1]
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", base)[:255] or f"file_{uuid.uuid4().hex}"
+
+
+async def drain(chunks: AsyncIterator[bytes], sink: Callable[[bytes], object]) -> int:
+    """Feed ``chunks`` through ``sink`` on the I/O pool; returns the byte count.
+
+    Chunk N+1 is received while ``sink`` handles chunk N, so receiving and
+    hashing or writing overlap instead of running back to back.
+    """
+    pending: asyncio.Future[object] | None = None
+    size = 0
+    try:
+        async for chunk in chunks:
+            if pending is not None:
+                await pending
+                pending = None
+            if not chunk:
+                continue
+            size += len(chunk)
+            pending = asyncio.ensure_future(run_io(sink, chunk))
+        if pending is not None:
+            await pending
+            pending = None
+        return size
+    finally:
+        if pending is not None:
+            # never let the caller close what a sink call is still using
+            await asyncio.gather(pending, return_exceptions=True)
+
+
+def _chunk_size() -> int:
+    return max(64 * 1024, settings.UPLOAD_CHUNK_BYTES)
+
+
+async def _read_upload(
+    file: UploadFile, max_bytes: int | None = None
+) -> AsyncIterator[bytes]:
+    chunk_size = _chunk_size()
+    await file.seek(0)
+    received = 0
+    while chunk := await file.read(chunk_size):
+        received += len(chunk)
+        if max_bytes is not None and received > max_bytes:
+            raise BadRequest(
+                f"size must be <= {max_bytes}",
+                data={"max_bytes": max_bytes, "filename": file.filename},
+            )
+        yield chunk
+
+
+def open_temp(root: Path) -> tuple[Path, BinaryIO]:
+    tmp = root / ".tmp" / uuid.uuid4().hex
+    tmp.parent.mkdir(parents=True, exist_ok=True)
+    return tmp, tmp.open("wb")
+
+
+def _unlink_all(paths: list[Path]) -> None:
+    for p in paths:
+        p.unlink(missing_ok=True)
+
+
+async def stage(chunks: AsyncIterator[bytes], root: Path) -> tuple[Path, str, int]:
+    """Write ``chunks`` to a temp file under ``root``, hashing them on the way.
+
+    Returns the temp file, its SHA-256 and its size; the caller hands the file
+    to storage or removes it. On error nothing is left behind.
+    """
+    hasher = hashlib.sha256()
+    tmp, out = await run_io(open_temp, root)
+
+    def _sink(chunk: bytes, out: BinaryIO = out) -> None:
+        hasher.update(chunk)
+        out.write(chunk)
+
+    try:
+        try:
+            size = await drain(chunks, _sink)
+        finally:
+            await run_io(out.close)
+    except BaseException:
+        await run_io(tmp.unlink, True)
+        raise
+    return tmp, hasher.hexdigest(), size
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _raise_first(results: list[T | BaseException]) -> list[T]:
+    for r in results:
+        if isinstance(r, BaseException):
+            raise r
+    return cast("list[T]", results)
+
+
+async def _settle(aws: Iterable[Awaitable[T]]) -> list[T]:
+    # like gather, but every call has finished before the first error is raised,
+    # so no temp file is removed while a call is still using it
+    return _raise_first(await asyncio.gather(*aws, return_exceptions=True))
+
+
+async def receive_object(grant: UploadGrant, chunks: AsyncIterator[bytes]) -> None:
+    """Accept a direct upload for ``LocalStorage``, as S3 would a presigned PUT.
+
+    The body is stored only if it is exactly the granted size and SHA-256.
+    """
+    tmp, checksum, size = await stage(chunks, Path(settings.UPLOAD_DIR))
+    try:
+        if size != grant.size:
+            raise BadRequest(
+                f"body must be {grant.size} bytes, got {size}",
+                data={"expected": grant.size, "received": size},
+            )
+        if checksum != grant.sha256:
+            raise BadRequest("checksum mismatch", data={"sha256": checksum})
+        await get_storage().put_file(grant.key, tmp)
+    except BaseException:
+        await run_io(tmp.unlink, True)
+        raise
+
+
+async def store_uploads(
+    db: AsyncSession, files: list[UploadFile], root: Path, max_bytes: int | None = None
+) -> list[StoredFile]:
+    """Put a request's files into the content-addressed blob store.
+
+    Each file is read once: hashed while it is staged under ``root``
+    (concurrently, at most ``UPLOAD_CONCURRENCY`` at once). Content the store
+    does not hold yet is then committed from its staged copy, which for local
+    storage is a rename; staged copies of known content are dropped. A file
+    that fits in one chunk is held in memory instead, so a duplicate of it
+    costs no write at all. A file over ``max_bytes`` fails the request with
+    BadRequest while it is read.
+    Returns with a transaction open holding ``FOR SHARE`` locks on the reused
+    blobs; the caller inserts its ``Attachment`` rows and commits. If that
+    fails, blobs written here are left to the file GC (see upload_attachments).
+    """
+    slots = asyncio.Semaphore(max(1, settings.UPLOAD_CONCURRENCY))
+    storage = get_storage()
+
+    async def _stage(f: UploadFile) -> tuple[Path | bytes, str, int]:
+        async with slots:
+            if f.size is not None and f.size <= _chunk_size():
+                data = b"".join([chunk async for chunk in _read_upload(f, max_bytes)])
+                return data, await run_io(_sha256, data), len(data)
+            return await stage(_read_upload(f, max_bytes), root)
+
+    async def _commit(c: str) -> None:
+        src = staged[c]
+        async with slots:
+            if isinstance(src, bytes):
+                await storage.put_bytes(blob_key(c), src, "application/octet-stream")
+            else:
+                await storage.put_file(blob_key(c), src)
+
+    results = await asyncio.gather(*(_stage(f) for f in files), return_exceptions=True)
+    temps = [
+        r[0] for r in results if not isinstance(r, BaseException) and isinstance(r[0], Path)
+    ]
+    try:
+        digests = _raise_first(results)
+        # one staged copy per distinct content; put_file consumes what it stores
+        staged: dict[str, Path | bytes] = {}
+        for tmp, c, _ in digests:
+            staged.setdefault(c, tmp)
+        sizes = {c: size for _, c, size in digests}
+
+        known = await blob_keys(db, staged)
+        # nothing else runs on this session until the files are stored
+        await release_connection(db)
+        missing = [c for c in staged if c not in known]
+        await _settle(_commit(c) for c in missing)
+
+        # a blob collected between the lookup and this lock is simply stored again
+        locked = await lock_blobs(db, known)
+        vanished = [c for c in known if c not in locked]
+        await _settle(_commit(c) for c in vanished)
+        await add_blobs(db, {c: sizes[c] for c in (*missing, *vanished)})
+    finally:
+        await run_io(_unlink_all, temps)
+
+    pending_writes = set(missing) | set(vanished)
+    stored: list[StoredFile] = []
+    for f, (_, c, size) in zip(files, digests):
+        inc("upload_bytes", size)
+        if c in pending_writes:
+            pending_writes.discard(c)
+        else:
+            inc("upload_dedup_bytes", size)
+        stored.append(
+            StoredFile(
+                key=locked.get(c) or blob_key(c),
+                filename=sanitize_filename(f.filename or "file"),
+                size=size,
+                content_type=f.content_type or "application/octet-stream",
+                checksum=c,
+            )
+        )
+    return stored
+
+
+async def adopt_blob(
+    db: AsyncSession, tmp: Path, checksum: str, size: int
+) -> str:
+    """Turn a fully written temp file into a blob; returns its storage key.
+
+    If the content is already stored the temp file is dropped. The blob row
+    is locked (or inserted) in the caller's transaction, which must commit
+    the referencing attachment.
+    """
+    existing = (await lock_blobs(db, [checksum])).get(checksum)
+    if existing is not None:
+        await run_io(tmp.unlink, True)
+        inc("upload_dedup_bytes", size)
+        return existing
+    key = blob_key(checksum)
+    await get_storage().put_file(key, tmp)
+    await add_blobs(db, {checksum: size})
+    return key
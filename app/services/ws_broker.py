@@ -1,21 +1,75 @@
 from __future__ import annotations
 
 import asyncio
+import sys
 from typing import Any, Awaitable, Protocol, cast
 
-from app.core.redis import get_redis
-from app.core.metrics import inc, add_gauge
+from app.core.redis import get_pubsub_redis
+from app.core.metrics import inc, add_gauge, set_gauge
 from app.core.logging import get_logger
 
 
+def _task_size(task: asyncio.Task[Any] | None) -> int:
+    if task is None or task.done():
+        return 0
+    coro = task.get_coro()
+    frame = getattr(coro, "cr_frame", None)
+    return (
+        sys.getsizeof(task)
+        + sys.getsizeof(coro)
+        + (sys.getsizeof(frame) if frame is not None else 0)
+    )
+
+
 class WebSocketConnection:
     def __init__(self, ws: Any, *, queue_size: int = 256) -> None:
         import asyncio as _asyncio
 
         self.ws = ws
+        self.room_id: int | None = None
         self.queue: _asyncio.Queue[str] = _asyncio.Queue(maxsize=queue_size)
         self._sender_task: _asyncio.Task[None] | None = None
+        self._extra_tasks: list[_asyncio.Task[Any]] = []
         self._closed = False
+        # str payloads as held in memory (sys.getsizeof), not wire bytes
+        self.queued_bytes = 0
+        self.peak_queued_bytes = 0
+        self.dropped = 0
+
+    def attach_task(self, task: asyncio.Task[Any]) -> None:
+        """Count a per-connection helper task (e.g. presence heartbeat) in the estimate."""
+        self._extra_tasks.append(task)
+
+    def _track(self, payload: str, sign: int) -> None:
+        size = sys.getsizeof(payload) * sign
+        self.queued_bytes += size
+        add_gauge("ws_queued_bytes", size)
+        add_gauge("ws_queued_messages", sign)
+        if self.queued_bytes > self.peak_queued_bytes:
+            self.peak_queued_bytes = self.queued_bytes
+
+    def memory_estimate(self) -> int:
+        """Approximate bytes this connection keeps alive.
+
+        Connection object, queue and its buffer, queued payloads, the sender and
+        helper tasks with their coroutine frames, and the ASGI websocket with its
+        scope. Shared objects (the app, the event loop) are not included.
+        """
+        ws_size = sys.getsizeof(self.ws)
+        scope = getattr(self.ws, "scope", None)
+        if isinstance(scope, dict):
+            ws_size += sys.getsizeof(scope) + sum(
+                sys.getsizeof(v) for v in cast(dict[str, Any], scope).values()
+            )
+        return (
+            sys.getsizeof(self)
+            + sys.getsizeof(self.queue)
+            + sys.getsizeof(getattr(self.queue, "_queue", ()))
+            + self.queued_bytes
+            + _task_size(self._sender_task)
+            + sum(_task_size(t) for t in self._extra_tasks)
+            + ws_size
+        )
 
     async def start(self) -> None:
         loop = asyncio.get_running_loop()
@@ -29,19 +83,27 @@ class WebSocketConnection:
 
             with _contextlib.suppress(_asyncio.CancelledError):
                 await self._sender_task
+        # release whatever was never sent so the aggregate gauges stay exact
+        while not self.queue.empty():
+            self._track(self.queue.get_nowait(), -1)
+        self._extra_tasks.clear()
 
     async def enqueue(self, payload: str) -> None:
         try:
             self.queue.put_nowait(payload)
+            self._track(payload, 1)
         except asyncio.QueueFull:
             try:
-                _ = self.queue.get_nowait()
+                dropped = self.queue.get_nowait()
                 self.queue.task_done()
+                self._track(dropped, -1)
             except Exception:
                 pass
             inc("ws_queue_drop")
+            self.dropped += 1
             try:
                 self.queue.put_nowait(payload)
+                self._track(payload, 1)
             except Exception:
                 pass
 
@@ -49,6 +111,7 @@ class WebSocketConnection:
         try:
             while not self._closed:
                 payload = await self.queue.get()
+                self._track(payload, -1)
                 try:
                     await self.ws.send_text(payload)
                 finally:
@@ -76,11 +139,13 @@ class ChatBroker:
         self._consumer_task: asyncio.Task[None] | None = None
         self._started = False
         self._logger = get_logger("app.ws")
+        # one line per published message: sample it via LOG_SAMPLE_RATES
+        self._fanout_logger = get_logger("app.ws.fanout")
 
     async def start(self) -> None:
         if self._started:
             return
-        redis = await get_redis()
+        redis = await get_pubsub_redis()
         pubsub = cast(PubSubLike, cast(Any, redis).pubsub())
         self._pubsub = pubsub
         await pubsub.psubscribe("chat:room:*")
@@ -106,9 +171,11 @@ class ChatBroker:
     async def subscribe(self, room_id: int, conn: WebSocketConnection) -> None:
         subs = self._room_subscribers.setdefault(room_id, set())
         subs.add(conn)
+        conn.room_id = room_id
         await conn.start()
         inc("ws_subscribe")
         add_gauge("ws_connections", 1)
+        set_gauge("ws_rooms", len(self._room_subscribers))
         self._logger.info(
             "ws subscribed", extra={"room_id": room_id, "subscribers": len(subs)}
         )
@@ -122,6 +189,7 @@ class ChatBroker:
         await conn.close()
         inc("ws_unsubscribe")
         add_gauge("ws_connections", -1)
+        set_gauge("ws_rooms", len(self._room_subscribers))
         cnt = len(subs) if subs is not None else 0
         self._logger.info(
             "ws unsubscribed", extra={"room_id": room_id, "subscribers": cnt}
@@ -169,13 +237,39 @@ class ChatBroker:
                 for conn in tuple(subs):
                     await conn.enqueue(payload)
                 inc("ws_fanout_messages", len(subs))
-                self._logger.info(
+                self._fanout_logger.info(
                     "ws fanout",
                     extra={"room_id": room_id, "subscribers": len(subs)},
                 )
         except Exception:
             pass
 
+    def memory_stats(self, top: int = 10) -> dict[str, Any]:
+        """Per-connection memory estimates, largest first (O(connections))."""
+        conns = [c for subs in self._room_subscribers.values() for c in subs]
+        estimates = [(c.memory_estimate(), c) for c in conns]
+        total = sum(e for e, _ in estimates)
+        estimates.sort(key=lambda item: item[0], reverse=True)
+        return {
+            "connections": len(conns),
+            "rooms": len(self._room_subscribers),
+            "queued_messages": sum(c.queue.qsize() for c in conns),
+            "queued_bytes": sum(c.queued_bytes for c in conns),
+            "estimate_bytes_total": total,
+            "estimate_bytes_avg": total // len(conns) if conns else 0,
+            "top": [
+                {
+                    "room_id": c.room_id,
+                    "queued_messages": c.queue.qsize(),
+                    "queued_bytes": c.queued_bytes,
+                    "peak_queued_bytes": c.peak_queued_bytes,
+                    "dropped": c.dropped,
+                    "estimate_bytes": e,
+                }
+                for e, c in estimates[: max(0, top)]
+            ],
+        }
+
     @staticmethod
     def _parse_room_id(channel: str) -> int | None:
         if not channel.startswith("chat:room:"):
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import hashlib
+import re
+from email.utils import formatdate
+from pathlib import Path
+
+import pytest
+
+import app.core.storage as app_storage
+from app.core.config import settings
+from app.core.security import DownloadGrant, sign_download
+from app.core.storage import LocalStorage
+from app.main import create_app
+from app.services.blob_store import blob_key
+from tests.conftest import Response, asgi_request
+
+
+pytestmark = pytest.mark.anyio
+
+DATA = b"%PDF-1.4 a resume"
+CHECKSUM = hashlib.sha256(DATA).hexdigest()
+KEY = blob_key(CHECKSUM)
+MODIFIED = 1_700_000_000
+ETAG = f'"{CHECKSUM}"'
+LAST_MODIFIED = formatdate(MODIFIED, usegmt=True)
+
+NGINX_CONF = Path(__file__).resolve().parents[1] / "frontend" / "nginx.conf"
+
+
+@pytest.fixture(params=["stream", "accel"])
+def delivery(
+    request: pytest.FixtureRequest, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> str:
+    monkeypatch.setattr(settings, "ATTACHMENT_DELIVERY", request.param)
+    monkeypatch.setattr(app_storage, "_storage", LocalStorage(tmp_path))
+    path = tmp_path / KEY
+    path.parent.mkdir(parents=True)
+    path.write_bytes(DATA)
+    return request.param
+
+
+def _url() -> str:
+    grant = DownloadGrant(
+        attachment_id=7,
+        key=KEY,
+        filename="cv.pdf",
+        content_type="application/pdf",
+        checksum=CHECKSUM,
+        modified=MODIFIED,
+    )
+    token, _ = sign_download(grant, 60)
+    return f"/api/chat/attachments/7/file?token={token}"
+
+
+async def _get(headers: dict[str, str] | None = None) -> Response:
+    return await asgi_request(create_app(), "GET", _url(), headers)
+
+
+def _assert_validators(resp: Response) -> None:
+    assert resp.headers["etag"] == ETAG
+    assert resp.headers["last-modified"] == LAST_MODIFIED
+    assert "immutable" in resp.headers["cache-control"]
+
+
+async def test_full_response_carries_the_validators(delivery: str) -> None:
+    resp = await _get()
+    assert resp.status == 200
+    _assert_validators(resp)
+    if delivery == "accel":
+        # nginx sends the file; see test_nginx_keeps_the_app_validators
+        assert resp.headers["x-accel-redirect"] == settings.ATTACHMENT_ACCEL_PREFIX + KEY
+        assert resp.body == b""
+    else:
+        assert resp.body == DATA
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [
+        {"If-None-Match": ETAG},
+        {"If-None-Match": f'W/{ETAG}, "other"'},
+        {"If-None-Match": "*"},
+        {"If-Modified-Since": LAST_MODIFIED},
+        {"If-Modified-Since": formatdate(MODIFIED + 3600, usegmt=True)},
+    ],
+)
+async def test_revalidation_is_answered_with_304(
+    delivery: str, headers: dict[str, str]
+) -> None:
+    resp = await _get(headers)
+    assert resp.status == 304
+    assert resp.body == b""
+    assert "x-accel-redirect" not in resp.headers
+    _assert_validators(resp)
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [
+        {"If-None-Match": '"other"'},
+        {"If-Modified-Since": formatdate(MODIFIED - 3600, usegmt=True)},
+        {"If-Modified-Since": "not a date"},
+        # If-Modified-Since is ignored once If-None-Match is present
+        {"If-None-Match": '"other"', "If-Modified-Since": LAST_MODIFIED},
+    ],
+)
+async def test_a_stale_copy_gets_the_file(delivery: str, headers: dict[str, str]) -> None:
+    resp = await _get(headers)
+    assert resp.status == 200
+    _assert_validators(resp)
+
+
+async def test_304_does_not_touch_the_file(delivery: str, tmp_path: Path) -> None:
+    (tmp_path / KEY).unlink()
+    assert (await _get({"If-None-Match": ETAG})).status == 304
+    if delivery == "stream":
+        assert (await _get()).status == 404
+
+
+def test_nginx_keeps_the_app_validators() -> None:
+    # X-Accel-Redirect drops the upstream ETag and Last-Modified; without these
+    # nginx would answer with validators derived from the file's mtime
+    conf = NGINX_CONF.read_text(encoding="utf-8")
+    block = re.search(r"location /_uploads/ \{(.*?)\}", conf, re.S)
+    assert block is not None
+    directives = {" ".join(line.split()) for line in block.group(1).splitlines()}
+    assert {
+        "internal;",
+        "etag off;",
+        "if_modified_since off;",
+        "add_header ETag $upstream_http_etag always;",
+        "add_header Last-Modified $upstream_http_last_modified always;",
+    } <= directives
+    assert settings.ATTACHMENT_ACCEL_PREFIX == "/_uploads/"
+
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from typing import Any
+
+import pytest
+from sqlalchemy import insert, select
+
+import app.services.auth_service as auth_service
+import app.services.chat_service as chat_service
+import app.services.mail_worker as mail_worker
+from app.core.config import settings
+from app.models.chat import ChatParticipant, ChatRoom, Message
+from app.models.mail_outbox import MailOutbox
+from app.schemas.chat import MessageCreate
+from app.schemas.user import UserCreate
+from tests.conftest import PythonNow, create_tables
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_send_message_publishes_without_a_connection(
+    engine, session_factory, pool_probe, redis, monkeypatch
+) -> None:
+    await create_tables(engine, "chat_rooms", "chat_participants", "messages", "attachments")
+    async with session_factory() as db:
+        await db.execute(insert(ChatRoom).values(id=1, type="direct"))
+        await db.execute(
+            insert(ChatParticipant), [{"room_id": 1, "user_id": 1}, {"room_id": 1, "user_id": 2}]
+        )
+        await db.commit()
+
+    held: dict[str, int] = {}
+
+    async def publish(channel: str, payload: Any) -> None:
+        held["publish"] = pool_probe.checked_out
+
+    real_redis_call = chat_service.redis_call
+
+    async def redis_call(op: Any, **kw: Any) -> Any:
+        held["unread"] = pool_probe.checked_out
+        return await real_redis_call(op, **kw)
+
+    monkeypatch.setattr(chat_service, "publish_model", publish)
+    monkeypatch.setattr(chat_service, "redis_call", redis_call)
+
+    async with session_factory() as db:
+        out = await chat_service.send_message_service(
+            db, MessageCreate(room_id=1, content="hi"), current_user_id=1
+        )
+
+    assert held == {"publish": 0, "unread": 0}
+    assert await redis.get("chat:unread:1:2") == b"1"
+    async with session_factory() as db:
+        assert (await db.execute(select(Message.id))).scalars().all() == [out.id]
+
+
+class _RecordingSMTPPool:
+    def __init__(self, probe: Any) -> None:
+        self.probe = probe
+        self.held: list[int] = []
+
+    async def send(self, msg: EmailMessage, to: str) -> None:
+        self.held.append(self.probe.checked_out)
+
+    async def close(self) -> None:
+        pass
+
+
+async def test_mail_worker_sends_without_a_connection(
+    engine, session_factory, pool_probe, monkeypatch
+) -> None:
+    await create_tables(engine, "mail_outbox")
+    monkeypatch.setattr(mail_worker, "func", PythonNow())
+    monkeypatch.setattr(settings, "MAIL_FROM", "Career Fair <noreply@example.com>")
+    due = datetime.now(timezone.utc) - timedelta(minutes=1)
+    async with session_factory() as db:
+        await db.execute(
+            insert(MailOutbox),
+            [
+                {"recipient": f"u{i}@example.com", "subject": "s", "html": "<p>x</p>",
+                 "next_attempt_at": due}
+                for i in range(3)
+            ],
+        )
+        await db.commit()
+
+    smtp = _RecordingSMTPPool(pool_probe)
+    worker = mail_worker.MailOutboxWorker(db_factory=session_factory, pool=smtp)
+    assert await worker.process_batch() == 3
+
+    assert smtp.held == [0, 0, 0]
+    async with session_factory() as db:
+        statuses = (await db.execute(select(MailOutbox.status))).scalars().all()
+    assert statuses == ["sent"] * 3
+
+
+async def test_inline_registration_mail_is_sent_without_a_connection(
+    engine, session_factory, pool_probe, redis, monkeypatch
+) -> None:
+    await create_tables(engine, "users")
+    monkeypatch.setattr(settings, "MAIL_OUTBOX_ENABLED", False)
+    monkeypatch.setattr(settings, "SMTP_HOST", "smtp.example.com")
+    monkeypatch.setattr(settings, "SMTP_PORT", 587)
+    monkeypatch.setattr(settings, "MAIL_FROM", "noreply@example.com")
+
+    held: list[int] = []
+
+    async def send_mail(to: str, subject: str, html: str) -> None:
+        held.append(pool_probe.checked_out)
+
+    monkeypatch.setattr(auth_service, "send_mail", send_mail)
+
+    async with session_factory() as db:
+        await auth_service.register_user(
+            db, UserCreate(email="new@example.com", password="s3cret!pass")
+        )
+
+    assert held == [0]
+    assert len(await redis.keys("reg:*")) == 1
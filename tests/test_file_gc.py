@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+
+import pytest
+from sqlalchemy import insert, select
+
+import app.core.storage as app_storage
+import app.services.file_gc as file_gc
+from app.core.config import settings
+from app.core.storage import LocalStorage
+from app.models.attachment import Attachment, AttachmentBlob
+from app.models.user_resume import UserResume
+from app.schemas.debug import FileGCOut
+from app.services.blob_store import blob_key
+from tests.conftest import PoolProbe, PythonNow, create_tables
+
+
+pytestmark = pytest.mark.anyio
+
+OLD = (datetime.now(timezone.utc) - timedelta(days=2)).replace(tzinfo=None)
+RECENT = datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class _Storage(LocalStorage):
+    """Local storage that records, per delete, how many connections were checked out."""
+
+    def __init__(self, root: Path, probe: PoolProbe) -> None:
+        super().__init__(root)
+        self.probe = probe
+        self.held: list[int] = []
+        self.fail = False
+
+    async def delete(self, keys: Any) -> None:
+        self.held.append(self.probe.checked_out)
+        if self.fail:
+            raise OSError("storage unavailable")
+        await super().delete(keys)
+
+
+@pytest.fixture
+async def storage(
+    engine, pool_probe: PoolProbe, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> _Storage:
+    await create_tables(engine, "attachment_blobs", "attachments", "user_resumes", "users")
+    monkeypatch.setattr(file_gc, "func", PythonNow())
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    store = _Storage(tmp_path, pool_probe)
+    monkeypatch.setattr(app_storage, "_storage", store)
+    return store
+
+
+def _legacy_key(n: int) -> str:
+    return f"202501/15/{n:032x}_cv.pdf"
+
+
+def _write(root: Path, key: str, data: bytes, age: float = 3 * 86400) -> None:
+    path = root / key
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    past = path.stat().st_mtime - age
+    os.utime(path, (past, past))
+
+
+def _attachment(id: int, key: str, size: int, **kw: Any) -> dict[str, Any]:
+    row = {"id": id, "uploader_id": 1, "s3_key": key, "filename": "cv.pdf",
+           "content_type": "application/pdf", "size_bytes": size, "status": "ready",
+           "checksum": None, "message_id": None, "created_at": OLD}
+    row.update(kw)
+    return row
+
+
+async def _seed(session_factory, attachments: list[dict[str, Any]], **rows: Any) -> None:
+    async with session_factory() as db:
+        if rows.get("blobs"):
+            await db.execute(insert(AttachmentBlob), rows["blobs"])
+        await db.execute(insert(Attachment), attachments)
+        if rows.get("resumes"):
+            await db.execute(insert(UserResume), rows["resumes"])
+        await db.commit()
+
+
+async def _attachment_ids(session_factory) -> list[int]:
+    async with session_factory() as db:
+        return list((await db.execute(select(Attachment.id).order_by(Attachment.id))).scalars())
+
+
+async def test_orphans_are_deleted_before_their_files(
+    storage: _Storage, session_factory, tmp_path: Path
+) -> None:
+    data = b"x" * 100
+    checksum = hashlib.sha256(data).hexdigest()
+    _write(tmp_path, _legacy_key(1), data)
+    _write(tmp_path, blob_key(checksum), data)
+    _write(tmp_path, _legacy_key(3), data)
+    await _seed(
+        session_factory,
+        [
+            _attachment(1, _legacy_key(1), 100),
+            # blob-backed: drops its reference, the blob is collected later
+            _attachment(2, blob_key(checksum), 100, checksum=checksum),
+            _attachment(3, _legacy_key(3), 100, message_id=9),
+            _attachment(4, _legacy_key(4), 100, created_at=RECENT),
+            _attachment(5, _legacy_key(5), 100),
+        ],
+        blobs=[{"checksum": checksum, "storage_key": blob_key(checksum), "size_bytes": 100,
+                "ref_count": 1, "created_at": OLD}],
+        resumes=[{"id": 1, "user_id": 1, "attachment_id": 5, "is_current": True,
+                  "created_at": OLD}],
+    )
+
+    async with session_factory() as db:
+        assert await file_gc.collect_orphan_attachments(db, grace_seconds=3600) == (2, 100)
+
+    assert await _attachment_ids(session_factory) == [3, 4, 5]
+    assert not (tmp_path / _legacy_key(1)).exists()
+    assert (tmp_path / blob_key(checksum)).exists()
+    assert (tmp_path / _legacy_key(3)).exists()
+    # storage was only touched once the row deletion had committed
+    assert storage.held == [0]
+
+
+async def test_superseded_resumes_go_with_their_unshared_attachments(
+    storage: _Storage, session_factory, tmp_path: Path
+) -> None:
+    for n in (1, 2, 3, 4):
+        _write(tmp_path, _legacy_key(n), b"r" * n)
+    day = timedelta(days=1)
+    await _seed(
+        session_factory,
+        [
+            _attachment(1, _legacy_key(1), 1),
+            # this old version was also sent in a chat
+            _attachment(2, _legacy_key(2), 2, message_id=9),
+            _attachment(3, _legacy_key(3), 3),
+            _attachment(4, _legacy_key(4), 4),
+        ],
+        resumes=[
+            {"id": n, "user_id": 1, "attachment_id": n, "is_current": n == 4,
+             "created_at": OLD + n * day}
+            for n in (1, 2, 3, 4)
+        ],
+    )
+
+    async with session_factory() as db:
+        assert await file_gc.collect_superseded_resumes(db, keep=1) == (2, 1)
+
+    async with session_factory() as db:
+        resumes = list((await db.execute(select(UserResume.id).order_by(UserResume.id))).scalars())
+    assert resumes == [3, 4]
+    assert await _attachment_ids(session_factory) == [2, 3, 4]
+    assert not (tmp_path / _legacy_key(1)).exists()
+    assert all((tmp_path / _legacy_key(n)).exists() for n in (2, 3, 4))
+    assert storage.held == [0]
+
+
+async def test_a_failed_file_delete_is_swept_by_reconcile(
+    storage: _Storage, session_factory, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    data = b"y" * 10
+    checksum = hashlib.sha256(data).hexdigest()
+    _write(tmp_path, _legacy_key(1), data)
+    _write(tmp_path, _legacy_key(2), data)
+    # a checksummed legacy file the blob store migration adopted in place
+    _write(tmp_path, _legacy_key(3), data)
+    # recent: an upload could still be about to register it
+    _write(tmp_path, _legacy_key(4), data, age=0)
+    await _seed(
+        session_factory,
+        [_attachment(1, _legacy_key(1), 10), _attachment(2, _legacy_key(2), 10, message_id=9)],
+        blobs=[{"checksum": checksum, "storage_key": _legacy_key(3), "size_bytes": 10,
+                "ref_count": 1, "created_at": OLD}],
+    )
+
+    storage.fail = True
+    async with session_factory() as db:
+        # the rows are gone even though their files could not be removed
+        assert await file_gc.collect_orphan_attachments(db, grace_seconds=3600) == (1, 0)
+    assert await _attachment_ids(session_factory) == [2]
+    assert (tmp_path / _legacy_key(1)).exists()
+
+    storage.fail = False
+    monkeypatch.setattr(settings, "BLOB_GC_GRACE_SECONDS", 3600)
+    monkeypatch.setattr(settings, "STORAGE_UPLOAD_URL_TTL_SECONDS", 0)
+    out = FileGCOut()
+    async with session_factory() as db:
+        await file_gc.reconcile_files(db, out)
+
+    assert out.reconciled
+    assert out.unowned_files == 1
+    assert out.reclaimed_bytes == 10
+    assert out.stray_blobs == 0
+    assert not (tmp_path / _legacy_key(1)).exists()
+    assert all((tmp_path / _legacy_key(n)).exists() for n in (2, 3, 4))
+
+
+async def test_reconcile_adopts_stray_blobs_and_drops_stale_temp_files(
+    storage: _Storage, session_factory, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    data = b"z" * 7
+    checksum = hashlib.sha256(data).hexdigest()
+    _write(tmp_path, blob_key(checksum), data)
+    _write(tmp_path, ".tmp/dead-upload", b"t" * 5)
+    _write(tmp_path, ".tmp/live-upload", b"t" * 5, age=0)
+    monkeypatch.setattr(settings, "BLOB_GC_GRACE_SECONDS", 3600)
+    monkeypatch.setattr(settings, "STORAGE_UPLOAD_URL_TTL_SECONDS", 0)
+
+    out = FileGCOut()
+    async with session_factory() as db:
+        await file_gc.reconcile_files(db, out)
+
+    assert (out.stray_blobs, out.temp_files, out.unowned_files) == (1, 1, 0)
+    async with session_factory() as db:
+        blob = await db.get(AttachmentBlob, checksum)
+    # registered unreferenced; collect_blobs removes it after its grace
+    assert blob is not None and blob.size_bytes == 7
+    assert (tmp_path / blob_key(checksum)).exists()
+    assert not (tmp_path / ".tmp" / "dead-upload").exists()
+    assert (tmp_path / ".tmp" / "live-upload").exists()
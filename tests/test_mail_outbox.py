@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import socket
+from collections.abc import Iterator
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+import aiosmtplib
+import pytest
+from aiosmtpd.controller import Controller
+from sqlalchemy import insert, select, update
+
+import app.services.mail_worker as mail_worker
+from app.core.config import settings
+from app.models.mail_outbox import MailOutbox
+from app.services.mailer import SMTPConnectionPool, build_message, is_permanent_failure
+from tests.conftest import PythonNow, create_tables
+
+
+pytestmark = pytest.mark.anyio
+
+BACKOFF_BASE = 30.0
+
+
+class _Handler:
+    """Accepts every recipient unless ``refuse`` maps it to a reply line."""
+
+    def __init__(self) -> None:
+        self.refuse: dict[str, str] = {}
+        self.delivered: list[tuple[Any, str]] = []
+
+    async def handle_RCPT(
+        self, server: Any, session: Any, envelope: Any, address: str, rcpt_options: Any
+    ) -> str:
+        if address in self.refuse:
+            return self.refuse[address]
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server: Any, session: Any, envelope: Any) -> str:
+        for rcpt in envelope.rcpt_tos:
+            self.delivered.append((session.peer, rcpt))
+        return "250 Message accepted for delivery"
+
+    @property
+    def peers(self) -> list[Any]:
+        return [peer for peer, _ in self.delivered]
+
+
+class Relay:
+    """An aiosmtpd server on a fixed local port that can be taken down and brought back."""
+
+    def __init__(self) -> None:
+        self.handler = _Handler()
+        # Controller cannot bind port 0, so reserve a free port up front
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        self._controller: Controller | None = None
+
+    def start(self) -> None:
+        self._controller = Controller(self.handler, hostname="127.0.0.1", port=self.port)
+        self._controller.start()
+
+    def stop(self) -> None:
+        if self._controller is not None:
+            self._controller.stop()
+            self._controller = None
+
+
+@pytest.fixture
+def relay(monkeypatch: pytest.MonkeyPatch) -> Iterator[Relay]:
+    relay = Relay()
+    relay.start()
+    monkeypatch.setattr(settings, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(settings, "SMTP_PORT", relay.port)
+    monkeypatch.setattr(settings, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(settings, "SMTP_USERNAME", None)
+    monkeypatch.setattr(settings, "SMTP_PASSWORD", None)
+    monkeypatch.setattr(settings, "SMTP_TIMEOUT_SECONDS", 5.0)
+    monkeypatch.setattr(settings, "MAIL_FROM", "Career Fair <noreply@example.com>")
+    yield relay
+    relay.stop()
+
+
+@pytest.fixture
+async def outbox(engine, session_factory, monkeypatch: pytest.MonkeyPatch) -> Any:
+    await create_tables(engine, "mail_outbox")
+    monkeypatch.setattr(mail_worker, "func", PythonNow())
+    monkeypatch.setattr(settings, "MAIL_OUTBOX_BACKOFF_BASE_SECONDS", BACKOFF_BASE)
+
+    async def add(*recipients: str) -> None:
+        due = datetime.now(timezone.utc) - timedelta(minutes=1)
+        async with session_factory() as db:
+            await db.execute(
+                insert(MailOutbox),
+                [
+                    {"recipient": r, "subject": "s", "html": "<p>x</p>", "next_attempt_at": due}
+                    for r in recipients
+                ],
+            )
+            await db.commit()
+
+    return add
+
+
+async def _rows(session_factory) -> dict[str, MailOutbox]:
+    async with session_factory() as db:
+        rows = (await db.execute(select(MailOutbox))).scalars().all()
+    return {r.recipient: r for r in rows}
+
+
+async def _make_due(session_factory) -> None:
+    async with session_factory() as db:
+        await db.execute(
+            update(MailOutbox).values(
+                next_attempt_at=datetime.now(timezone.utc) - timedelta(seconds=1)
+            )
+        )
+        await db.commit()
+
+
+def _aware(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+async def _send(pool: SMTPConnectionPool, to: str) -> None:
+    await pool.send(build_message(to, "s", "<p>x</p>"), to)
+
+
+async def test_pool_reuses_one_session_across_messages(relay: Relay) -> None:
+    pool = SMTPConnectionPool(size=1)
+    for i in range(3):
+        await _send(pool, f"u{i}@example.com")
+    await pool.close()
+
+    assert [rcpt for _, rcpt in relay.handler.delivered] == [
+        "u0@example.com", "u1@example.com", "u2@example.com"
+    ]
+    assert len(set(relay.handler.peers)) == 1
+
+
+async def test_idle_session_is_replaced(relay: Relay, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "SMTP_POOL_IDLE_SECONDS", 0.0)
+    pool = SMTPConnectionPool(size=1)
+    await _send(pool, "a@example.com")
+    await _send(pool, "b@example.com")
+    await pool.close()
+
+    assert len(set(relay.handler.peers)) == 2
+
+
+async def test_a_failed_send_drops_its_session(relay: Relay) -> None:
+    relay.handler.refuse["gone@example.com"] = "550 5.1.1 No such user"
+    pool = SMTPConnectionPool(size=1)
+    await _send(pool, "a@example.com")
+    with pytest.raises(aiosmtplib.SMTPRecipientsRefused) as exc:
+        await _send(pool, "gone@example.com")
+    await _send(pool, "b@example.com")
+    await pool.close()
+
+    assert is_permanent_failure(exc.value)
+    first, second = relay.handler.peers
+    assert first != second
+
+
+async def test_pool_reconnects_after_the_server_restarts(relay: Relay) -> None:
+    pool = SMTPConnectionPool(size=1)
+    await _send(pool, "a@example.com")
+    relay.stop()
+    relay.start()
+    await _send(pool, "b@example.com")
+    await pool.close()
+
+    assert len(set(relay.handler.peers)) == 2
+
+
+async def test_worker_retries_4xx_and_fails_5xx(relay: Relay, outbox, session_factory) -> None:
+    relay.handler.refuse["busy@example.com"] = "450 4.2.1 Mailbox busy, try later"
+    relay.handler.refuse["gone@example.com"] = "550 5.1.1 No such user"
+    await outbox("ok@example.com", "busy@example.com", "gone@example.com")
+    worker = mail_worker.MailOutboxWorker(db_factory=session_factory, pool=SMTPConnectionPool())
+
+    before = datetime.now(timezone.utc)
+    assert await worker.process_batch() == 3
+    rows = await _rows(session_factory)
+
+    assert rows["ok@example.com"].status == "sent"
+    assert rows["ok@example.com"].sent_at is not None
+
+    busy = rows["busy@example.com"]
+    assert busy.status == "pending"
+    assert busy.attempts == 1
+    assert "450" in busy.last_error
+    # first retry waits between half and all of the base delay
+    wait = (_aware(busy.next_attempt_at) - before).total_seconds()
+    assert BACKOFF_BASE / 2 - 1 <= wait <= BACKOFF_BASE + 1
+
+    gone = rows["gone@example.com"]
+    assert gone.status == "failed"
+    assert gone.attempts == 1
+    assert "550" in gone.last_error
+
+    # not due yet: the backoff holds the row back
+    assert await worker.process_batch() == 0
+
+    del relay.handler.refuse["busy@example.com"]
+    await _make_due(session_factory)
+    assert await worker.process_batch() == 1
+    await worker.stop()
+
+    busy = (await _rows(session_factory))["busy@example.com"]
+    assert busy.status == "sent"
+    assert busy.attempts == 2
+    assert busy.last_error is None
+    assert [rcpt for _, rcpt in relay.handler.delivered] == [
+        "ok@example.com", "busy@example.com"
+    ]
+
+
+async def test_worker_gives_up_after_max_attempts(
+    relay: Relay, outbox, session_factory, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "MAIL_OUTBOX_MAX_ATTEMPTS", 2)
+    relay.handler.refuse["busy@example.com"] = "451 4.3.0 Temporary failure"
+    await outbox("busy@example.com")
+    worker = mail_worker.MailOutboxWorker(db_factory=session_factory, pool=SMTPConnectionPool())
+
+    await worker.process_batch()
+    assert (await _rows(session_factory))["busy@example.com"].status == "pending"
+    await _make_due(session_factory)
+    await worker.process_batch()
+    await worker.stop()
+
+    busy = (await _rows(session_factory))["busy@example.com"]
+    assert busy.status == "failed"
+    assert busy.attempts == 2
+
+
+async def test_worker_survives_a_server_restart_between_batches(
+    relay: Relay, outbox, session_factory
+) -> None:
+    worker = mail_worker.MailOutboxWorker(
+        db_factory=session_factory, pool=SMTPConnectionPool(size=1)
+    )
+    await outbox("a@example.com")
+    assert await worker.process_batch() == 1
+
+    # down for a whole batch: connection refused is retried, not failed
+    relay.stop()
+    await outbox("b@example.com")
+    assert await worker.process_batch() == 1
+    b = (await _rows(session_factory))["b@example.com"]
+    assert b.status == "pending"
+    assert b.last_error
+
+    relay.start()
+    await _make_due(session_factory)
+    assert await worker.process_batch() == 1
+    await worker.stop()
+
+    rows = await _rows(session_factory)
+    assert {r.status for r in rows.values()} == {"sent"}
+    assert rows["b@example.com"].attempts == 2
+    assert len(set(relay.handler.peers)) == 2
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import time
+from collections.abc import AsyncIterator
+from pathlib import Path
+from typing import Any
+
+import pytest
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+import app.api.deps as deps
+import app.db.session as session
+from app.core.config import settings
+from app.core.metrics import registry
+from app.core.security import create_access_token
+from app.db.session import ReplicaRouter, _Replica
+from app.main import create_app
+from app.models.user import User
+from tests.conftest import PoolProbe, asgi_request, create_tables
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def replica(tmp_path: Path) -> AsyncIterator[AsyncEngine]:
+    eng = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}", poolclass=AsyncAdaptedQueuePool
+    )
+    yield eng
+    await eng.dispose()
+
+
+def _user(id: int, email: str, **kw: Any) -> dict[str, Any]:
+    return {"id": id, "email": email, "hashed_password": "x", "is_active": True,
+            "is_superuser": False, **kw}
+
+
+@pytest.fixture
+async def routed(
+    engine: AsyncEngine,
+    replica: AsyncEngine,
+    session_factory: async_sessionmaker,
+    monkeypatch: pytest.MonkeyPatch,
+) -> PoolProbe:
+    """Primary and replica databases; returns a probe on the primary's pool.
+
+    The replica lags: it does not have new@example.com yet.
+    """
+    for eng in (engine, replica):
+        await create_tables(eng, "users")
+    async with engine.begin() as conn:
+        await conn.execute(
+            insert(User),
+            [_user(1, "old@example.com"), _user(2, "new@example.com"),
+             _user(3, "gone@example.com", is_active=False)],
+        )
+    async with replica.begin() as conn:
+        await conn.execute(
+            insert(User),
+            [_user(1, "old@example.com"), _user(3, "gone@example.com", is_active=False)],
+        )
+
+    replica_sessions = async_sessionmaker(replica, expire_on_commit=False)
+
+    async def open_read_session(sticky_key: str | None) -> Any:
+        return replica_sessions()
+
+    monkeypatch.setattr(deps, "open_read_session", open_read_session)
+    monkeypatch.setattr(deps, "AsyncSessionLocal", session_factory)
+    return PoolProbe(engine)
+
+
+async def _get(path: str, email: str) -> Any:
+    headers = {"Authorization": f"Bearer {create_access_token(email)}"}
+    return await asgi_request(create_app(), "GET", path, headers)
+
+
+async def test_read_route_authenticates_on_the_replica(routed: PoolProbe) -> None:
+    resp = await _get("/api/profile/users", "old@example.com")
+    assert resp.status == 200
+    assert routed.checkouts == 0
+
+
+async def test_user_missing_on_the_replica_falls_back_to_the_primary(
+    routed: PoolProbe,
+) -> None:
+    resp = await _get("/api/profile/users", "new@example.com")
+    assert resp.status == 200
+    assert routed.checkouts == 1
+
+
+async def test_read_route_rejects_inactive_and_unknown_users(routed: PoolProbe) -> None:
+    assert (await _get("/api/profile/users", "gone@example.com")).status == 401
+    assert (await _get("/api/profile/users", "nobody@example.com")).status == 401
+
+
+async def test_staff_read_route_checks_superuser_on_the_replica(routed: PoolProbe) -> None:
+    resp = await _get("/api/profile/resumes/search?q=python", "old@example.com")
+    assert resp.status == 403
+    assert routed.checkouts == 0
+
+
+class _HangingEngine:
+    """Stands in for a replica whose host accepts the TCP connection, then goes silent."""
+
+    def connect(self) -> Any:
+        @contextlib.asynccontextmanager
+        async def hang() -> AsyncIterator[Any]:
+            await asyncio.Event().wait()
+            yield None
+
+        return hang()
+
+    async def dispose(self) -> None:
+        pass
+
+
+async def test_a_hanging_replica_does_not_block_startup(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "DB_REPLICA_PROBE_TIMEOUT_SECONDS", 0.05)
+    router = ReplicaRouter([])
+    router._replicas = [_Replica(0, _HangingEngine())]  # type: ignore[arg-type]
+
+    start = time.perf_counter()
+    await router.start()
+    try:
+        assert time.perf_counter() - start < 1.0
+        assert router.pick() is None
+    finally:
+        await router.stop()
+
+
+async def test_replica_lag_is_labelled_with_its_pool(
+    replica: AsyncEngine, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "DB_REPLICA_PROBE_TIMEOUT_SECONDS", 0.05)
+    # SQLite has no replication functions; stand in a fixed lag
+    monkeypatch.setattr(session, "_REPLICA_LAG_SQL", text("SELECT 0.5"))
+    router = ReplicaRouter([])
+    router._replicas = [
+        _Replica(0, _HangingEngine()),  # type: ignore[arg-type]
+        _Replica(1, replica),
+    ]
+
+    await router.check()
+
+    lag = registry.gauge("db_replica_lag_seconds", labelnames=("pool",))
+    assert lag.value(("replica_0",)) == 1e9
+    assert lag.value(("replica_1",)) == 0.5
+    assert router.pick() is replica
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any
+
+import pytest
+from redis.exceptions import ResponseError
+
+import app.core.redis as app_redis
+from app.core.config import settings
+from app.core.exceptions import RedisUnavailable
+from app.core.metrics import snapshot
+from app.core.redis import CircuitBreaker, redis_call
+from tests.conftest import LatencyRedis
+
+
+pytestmark = pytest.mark.anyio
+
+OP_TIMEOUT = 0.05
+RESET = 0.1
+
+
+@pytest.fixture
+def breaker(redis: LatencyRedis, monkeypatch: pytest.MonkeyPatch) -> CircuitBreaker:
+    monkeypatch.setattr(settings, "REDIS_OP_TIMEOUT_SECONDS", OP_TIMEOUT)
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=RESET)
+    monkeypatch.setattr(app_redis, "breaker", breaker)
+    return breaker
+
+
+def _counter(name: str) -> float:
+    return snapshot()["counters"].get(name, 0)
+
+
+async def _get(redis: Any) -> Any:
+    return await redis.get("key")
+
+
+async def _timeouts(n: int) -> None:
+    for _ in range(n):
+        with pytest.raises(RedisUnavailable):
+            await redis_call(_get)
+
+
+async def test_slow_command_is_cut_off_at_the_deadline(
+    redis: LatencyRedis, breaker: CircuitBreaker
+) -> None:
+    redis.delay = 1.0
+    before = _counter("redis_timeouts")
+
+    start = time.perf_counter()
+    with pytest.raises(RedisUnavailable):
+        await redis_call(_get)
+
+    assert time.perf_counter() - start < 0.5
+    assert _counter("redis_timeouts") == before + 1
+    assert breaker.state == "closed"
+
+
+async def test_per_call_timeout_overrides_the_default(
+    redis: LatencyRedis, breaker: CircuitBreaker
+) -> None:
+    await redis.set("key", b"v")
+    redis.delay = OP_TIMEOUT * 2
+
+    assert await redis_call(_get, timeout=1.0) == b"v"
+
+
+async def test_consecutive_timeouts_open_the_breaker(
+    redis: LatencyRedis, breaker: CircuitBreaker
+) -> None:
+    redis.delay = 1.0
+    await _timeouts(3)
+    assert breaker.state == "open"
+    assert snapshot()["gauges"]["redis_breaker_open"] == 1
+
+    calls = 0
+
+    async def op(r: Any) -> Any:
+        nonlocal calls
+        calls += 1
+        return await r.get("key")
+
+    rejected = _counter("redis_breaker_rejected")
+    start = time.perf_counter()
+    with pytest.raises(RedisUnavailable):
+        await redis_call(op)
+
+    # rejected without touching Redis, long before the op timeout
+    assert time.perf_counter() - start < OP_TIMEOUT / 2
+    assert calls == 0
+    assert _counter("redis_breaker_rejected") == rejected + 1
+
+
+async def test_a_success_resets_the_failure_count(
+    redis: LatencyRedis, breaker: CircuitBreaker
+) -> None:
+    redis.delay = 1.0
+    await _timeouts(2)
+    redis.delay = 0.0
+    await redis_call(_get)
+    redis.delay = 1.0
+    await _timeouts(2)
+
+    assert breaker.state == "closed"
+
+
+async def test_half_open_lets_a_single_probe_through(
+    redis: LatencyRedis, breaker: CircuitBreaker
+) -> None:
+    redis.delay = 1.0
+    await _timeouts(3)
+    await asyncio.sleep(RESET)
+
+    redis.delay = OP_TIMEOUT / 2
+    probe = asyncio.create_task(redis_call(_get))
+    await asyncio.sleep(0)
+    assert breaker.state == "half_open"
+    with pytest.raises(RedisUnavailable):
+        await redis_call(_get)
+
+    await probe
+    assert breaker.state == "closed"
+    assert snapshot()["gauges"]["redis_breaker_open"] == 0
+    await redis_call(_get)
+
+
+async def test_a_slow_probe_reopens_the_breaker(
+    redis: LatencyRedis, breaker: CircuitBreaker
+) -> None:
+    redis.delay = 1.0
+    await _timeouts(3)
+    await asyncio.sleep(RESET)
+
+    await _timeouts(1)
+
+    assert breaker.state == "open"
+    with pytest.raises(RedisUnavailable):
+        await redis_call(_get)
+
+
+async def test_command_errors_do_not_open_the_breaker(
+    redis: LatencyRedis, breaker: CircuitBreaker
+) -> None:
+    async def wrong_type(r: Any) -> Any:
+        await r.rpush("list", b"x")
+        return await r.get("list")
+
+    for _ in range(5):
+        with pytest.raises(ResponseError):
+            await redis_call(wrong_type)
+
+    assert breaker.state == "closed"
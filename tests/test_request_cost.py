@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import re
+import time
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, field_serializer
+from starlette.middleware import Middleware
+
+from app.api.middlewares import RequestContextMiddleware
+from app.api.routing import TimedRoute
+from app.api.routers import auth, chat, debug, health, profile, storage
+from tests.conftest import asgi_request
+
+
+pytestmark = pytest.mark.anyio
+
+ENDPOINT_S = 0.2
+SERIALIZE_S = 0.03
+
+
+class Item(BaseModel):
+    n: int
+
+    @field_serializer("n")
+    def _slow(self, n: int) -> int:
+        time.sleep(SERIALIZE_S / 10)
+        return n
+
+
+def _app() -> FastAPI:
+    router = APIRouter(route_class=TimedRoute)
+
+    @router.get("/async", response_model=list[Item])
+    async def async_items() -> list[Item]:
+        time.sleep(ENDPOINT_S)
+        return [Item(n=i) for i in range(10)]
+
+    @router.get("/sync", response_model=list[Item])
+    def sync_items() -> list[Item]:
+        time.sleep(ENDPOINT_S)
+        return [Item(n=i) for i in range(10)]
+
+    app = FastAPI(middleware=[Middleware(RequestContextMiddleware)])
+    app.include_router(router)
+    return app
+
+
+def _timing(header: str) -> dict[str, float]:
+    return {m[0]: float(m[1]) for m in re.findall(r"(\w+);dur=([\d.]+)", header)}
+
+
+@pytest.mark.parametrize("path", ["/async", "/sync"])
+async def test_serialize_covers_the_response_model_not_the_endpoint(path: str) -> None:
+    resp = await asgi_request(_app(), "GET", path)
+    assert resp.status == 200
+    timing = _timing(resp.headers["server-timing"])
+    assert SERIALIZE_S * 1000 <= timing["serialize"] < ENDPOINT_S * 1000
+    assert timing["total"] >= (ENDPOINT_S + SERIALIZE_S) * 1000
+
+
+def test_every_api_route_is_timed() -> None:
+    routers = [auth.router, chat.router, debug.router, health.router, profile.router,
+               storage.router]
+    routes = [r for router in routers for r in router.routes if isinstance(r, APIRoute)]
+    assert routes
+    assert [r.path for r in routes if not isinstance(r, TimedRoute)] == []
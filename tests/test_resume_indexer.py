@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+
+import pytest
+from sqlalchemy import insert, select
+
+import app.core.storage as app_storage
+import app.services.resume_indexer as resume_indexer
+from app.core.config import settings
+from app.core.storage import LocalStorage
+from app.models.attachment import Attachment
+from app.models.user_resume import UserResume
+from tests.conftest import PythonNow, create_tables
+
+
+pytestmark = pytest.mark.anyio
+
+PAST = datetime.now(timezone.utc) - timedelta(minutes=1)
+
+
+class _Storage(LocalStorage):
+    """Local storage that tracks how many reads are in flight at once."""
+
+    def __init__(self, root: Path) -> None:
+        super().__init__(root)
+        self.reading = 0
+        self.peak = 0
+
+    async def read_bytes(self, key: str) -> bytes:
+        self.reading += 1
+        self.peak = max(self.peak, self.reading)
+        try:
+            await asyncio.sleep(0.01)
+            return await super().read_bytes(key)
+        finally:
+            self.reading -= 1
+
+
+async def _run_inline(func: Callable[..., Any], *args: Any) -> Any:
+    # the parse itself is not under test; spare spawning the process pool
+    return func(*args)
+
+
+@pytest.fixture
+async def indexer(
+    engine, session_factory, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> resume_indexer.ResumeIndexer:
+    await create_tables(engine, "attachments", "user_resumes")
+    monkeypatch.setattr(resume_indexer, "func", PythonNow())
+    monkeypatch.setattr(resume_indexer, "run_cpu", _run_inline)
+    monkeypatch.setattr(app_storage, "_storage", _Storage(tmp_path))
+    return resume_indexer.ResumeIndexer(db_factory=session_factory)
+
+
+async def _seed(
+    session_factory, tmp_path: Path, count: int, missing: frozenset[int] = frozenset()
+) -> None:
+    attachments, resumes = [], []
+    for n in range(1, count + 1):
+        key = f"resumes/{n}.txt"
+        (tmp_path / "resumes").mkdir(exist_ok=True)
+        (tmp_path / key).write_text(f"resume number {n}")
+        if n not in missing:
+            attachments.append(
+                {"id": n, "uploader_id": n, "s3_key": key, "filename": f"{n}.txt",
+                 "content_type": "text/plain", "size_bytes": 16, "status": "ready"}
+            )
+        resumes.append(
+            {"id": n, "user_id": n, "attachment_id": n, "created_at": PAST,
+             "text_next_attempt_at": PAST}
+        )
+    async with session_factory() as db:
+        await db.execute(insert(Attachment), attachments)
+        await db.execute(insert(UserResume), resumes)
+        await db.commit()
+
+
+async def _statuses(session_factory) -> dict[int, tuple[str, int]]:
+    async with session_factory() as db:
+        rows = await db.execute(
+            select(UserResume.id, UserResume.text_status, UserResume.text_attempts)
+        )
+        return {rid: (status, attempts) for rid, status, attempts in rows}
+
+
+async def test_resume_without_an_attachment_fails_in_the_same_pass(
+    indexer: resume_indexer.ResumeIndexer, session_factory, tmp_path: Path
+) -> None:
+    await _seed(session_factory, tmp_path, 3, missing=frozenset({2}))
+
+    assert await indexer.process_batch() == 2
+    assert await _statuses(session_factory) == {
+        1: ("indexed", 1),
+        2: ("failed", 1),
+        3: ("indexed", 1),
+    }
+    # nothing is left to lease again
+    assert await indexer.process_batch() == 0
+
+
+async def test_fetches_are_bounded_by_the_process_pool(
+    indexer: resume_indexer.ResumeIndexer,
+    session_factory,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "CPU_WORKERS", 2)
+    monkeypatch.setattr(settings, "RESUME_INDEX_BATCH_SIZE", 8)
+    await _seed(session_factory, tmp_path, 8)
+
+    assert await indexer.process_batch() == 8
+    assert app_storage._storage.peak == 2
+    assert {s for s, _ in (await _statuses(session_factory)).values()} == {"indexed"}
+    async with session_factory() as db:
+        texts = (await db.execute(select(UserResume.content_text))).scalars().all()
+    assert sorted(texts) == sorted(f"resume number {n}" for n in range(1, 9))
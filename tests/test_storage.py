@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import os
+import uuid
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+from sqlalchemy import select
+
+import app.core.storage as app_storage
+import app.services.upload_sessions as upload_sessions
+from app.core.config import settings
+from app.core.exceptions import BadRequest
+from app.core.storage import LocalStorage, PresignedUpload, S3Storage, Storage
+from app.main import create_app
+from app.models.attachment import Attachment, AttachmentBlob
+from app.schemas.chat import DirectUploadIn
+from app.services.blob_store import blob_key
+from app.services.upload_sessions import complete_upload_service, init_direct_upload_service
+from tests.conftest import PythonNow, asgi_request, create_tables
+
+
+pytestmark = pytest.mark.anyio
+
+# Set to run the S3 tests against a real S3-compatible server (e.g. MinIO)
+# instead of moto; S3_TEST_ACCESS_KEY_ID / S3_TEST_SECRET_ACCESS_KEY go with it.
+REAL_S3 = os.environ.get("S3_TEST_ENDPOINT_URL")
+
+USER_ID = 1
+
+
+@pytest.fixture
+def s3_endpoint() -> Iterator[str | None]:
+    if REAL_S3:
+        yield REAL_S3
+        return
+    from moto import mock_aws
+
+    # boto3 calls and the presigned PUTs sent with requests are both answered
+    # in-process; None keeps the default AWS endpoint, which moto intercepts
+    with mock_aws():
+        yield None
+
+
+@pytest.fixture(params=["local", "s3"])
+def storage(
+    request: pytest.FixtureRequest, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> Iterator[Storage]:
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", request.param)
+    if request.param == "local":
+        store: Storage = LocalStorage(tmp_path / "uploads")
+    else:
+        endpoint = request.getfixturevalue("s3_endpoint")
+        monkeypatch.setattr(settings, "S3_BUCKET", f"test-{uuid.uuid4().hex[:12]}")
+        monkeypatch.setattr(settings, "S3_ENDPOINT_URL", endpoint)
+        monkeypatch.setattr(settings, "S3_PUBLIC_ENDPOINT_URL", None)
+        monkeypatch.setattr(settings, "S3_REGION", "us-east-1")
+        monkeypatch.setattr(settings, "S3_ADDRESSING_STYLE", "path")
+        monkeypatch.setattr(
+            settings, "S3_ACCESS_KEY_ID", os.environ.get("S3_TEST_ACCESS_KEY_ID", "testing")
+        )
+        monkeypatch.setattr(
+            settings,
+            "S3_SECRET_ACCESS_KEY",
+            os.environ.get("S3_TEST_SECRET_ACCESS_KEY", "testing"),
+        )
+        store = S3Storage()
+        store._client.create_bucket(Bucket=store.bucket)
+    monkeypatch.setattr(app_storage, "_storage", store)
+    yield store
+    if isinstance(store, S3Storage):
+        _empty_bucket(store)
+
+
+def _empty_bucket(store: S3Storage) -> None:
+    client = store._client
+    for page in client.get_paginator("list_objects_v2").paginate(Bucket=store.bucket):
+        keys = [{"Key": o["Key"]} for o in page.get("Contents", [])]
+        if keys:
+            client.delete_objects(Bucket=store.bucket, Delete={"Objects": keys})
+    client.delete_bucket(Bucket=store.bucket)
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _http_put(url: str, body: bytes, headers: dict[str, str]) -> int:
+    import requests
+
+    return requests.put(url, data=body, headers=headers, timeout=10).status_code
+
+
+async def _upload(upload: PresignedUpload | Any, body: bytes) -> int:
+    """Send a presigned PUT as a browser would: to S3, or to the app itself."""
+    if upload.url.startswith("http"):
+        return await asyncio.to_thread(_http_put, upload.url, body, dict(upload.headers))
+    app = create_app()
+    resp = await asgi_request(app, upload.method, upload.url, dict(upload.headers), body)
+    return resp.status
+
+
+async def test_missing_keys(storage: Storage, tmp_path: Path) -> None:
+    assert await storage.size("blobs/no/such/key") is None
+    with pytest.raises(FileNotFoundError):
+        await storage.read_bytes("blobs/no/such/key")
+    with pytest.raises(FileNotFoundError):
+        await storage.get_file("blobs/no/such/key", tmp_path / "out.bin")
+    # deleting what is not there is not an error
+    await storage.delete(["blobs/no/such/key"])
+
+
+async def test_put_read_and_size(storage: Storage, tmp_path: Path) -> None:
+    src = tmp_path / "src.bin"
+    src.write_bytes(b"x" * 1000)
+    await storage.put_file("a/file.bin", src)
+    await storage.put_bytes("a/bytes.txt", b"hello", "text/plain")
+
+    assert not src.exists()
+    assert await storage.size("a/file.bin") == 1000
+    assert await storage.read_bytes("a/bytes.txt") == b"hello"
+    await storage.get_file("a/file.bin", tmp_path / "out" / "copy.bin")
+    assert (tmp_path / "out" / "copy.bin").read_bytes() == b"x" * 1000
+
+
+async def test_list_and_delete_past_one_thousand_keys(
+    storage: Storage, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    keys = [f"many/{i:05d}" for i in range(1003)]
+    await asyncio.gather(*(storage.put_bytes(k, b"v", "text/plain") for k in keys))
+    await storage.put_bytes("other/keep", b"v", "text/plain")
+
+    batches = [b async for b in storage.list_objects("many/")]
+    assert [len(b) for b in batches] == [1000, 3]
+    listed = sorted(o.key for b in batches for o in b)
+    assert listed == keys
+    assert {o.size for b in batches for o in b} == {1}
+
+    calls: list[int] = []
+    if isinstance(storage, S3Storage):
+        real = storage._client.delete_objects
+
+        def delete_objects(**kw: Any) -> Any:
+            calls.append(len(kw["Delete"]["Objects"]))
+            return real(**kw)
+
+        monkeypatch.setattr(storage._client, "delete_objects", delete_objects)
+
+    await storage.delete(keys)
+
+    if isinstance(storage, S3Storage):
+        # DeleteObjects takes at most 1000 keys a call
+        assert calls == [1000, 3]
+    assert [b async for b in storage.list_objects("many/")] == []
+    assert await storage.size("other/keep") == 1
+
+
+async def test_presigned_put_signs_length_and_checksum(storage: Storage) -> None:
+    body = b"resume bytes"
+    upload = storage.presign_put(
+        "blobs/x", content_type="application/pdf", size=len(body),
+        sha256=_sha256(body), ttl_seconds=60,
+    )
+    assert upload.headers["Content-Type"] == "application/pdf"
+    if isinstance(storage, S3Storage):
+        checksum = base64.b64encode(hashlib.sha256(body).digest()).decode()
+        assert upload.headers["x-amz-checksum-sha256"] == checksum
+        signed = parse_qs(urlsplit(upload.url).query)["X-Amz-SignedHeaders"][0].split(";")
+        # a client cannot swap any of these without invalidating the signature
+        assert {"content-length", "content-type", "x-amz-checksum-sha256"} <= set(signed)
+
+
+async def test_presigned_put_rejects_other_bytes(storage: Storage) -> None:
+    if isinstance(storage, S3Storage) and not REAL_S3:
+        pytest.skip("moto does not verify x-amz-checksum-sha256 on presigned PUTs")
+    body = b"the signed content"
+    other = b"different content!"
+    assert len(other) == len(body)
+    upload = storage.presign_put(
+        "blobs/x", content_type="text/plain", size=len(body),
+        sha256=_sha256(body), ttl_seconds=60,
+    )
+
+    assert await _upload(upload, other) == 400
+    assert await storage.size("blobs/x") is None
+    assert await _upload(upload, body + b"!") in (400, 403)
+    assert await storage.size("blobs/x") is None
+
+    assert await _upload(upload, body) in (200, 204)
+    assert await storage.read_bytes("blobs/x") == body
+
+
+async def test_local_upload_needs_a_valid_link(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(app_storage, "_storage", LocalStorage(tmp_path))
+    resp = await asgi_request(
+        create_app(), "PUT", "/api/storage/objects?token=forged", {}, b"x"
+    )
+    assert resp.status == 403
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.fixture
+async def attachments(engine, monkeypatch: pytest.MonkeyPatch) -> None:
+    await create_tables(engine, "attachment_blobs", "attachments")
+    monkeypatch.setattr(upload_sessions, "func", PythonNow())
+    monkeypatch.setattr(settings, "ATTACHMENT_SCANNER", "none")
+
+
+async def _init(session_factory, body: bytes, name: str = "cv.pdf") -> Any:
+    async with session_factory() as db:
+        return await init_direct_upload_service(
+            db,
+            USER_ID,
+            DirectUploadIn(
+                filename=name, content_type="application/pdf",
+                size=len(body), sha256=_sha256(body),
+            ),
+        )
+
+
+async def _complete(session_factory, attachment_id: int) -> Attachment:
+    async with session_factory() as db:
+        return await complete_upload_service(db, attachment_id, USER_ID)
+
+
+async def test_direct_upload_round_trip(
+    storage: Storage, attachments: None, session_factory
+) -> None:
+    body = os.urandom(64 * 1024)
+    key = blob_key(_sha256(body))
+
+    out = await _init(session_factory, body)
+    assert out.status == "uploading"
+    assert out.upload is not None
+
+    with pytest.raises(BadRequest, match="not been uploaded"):
+        await _complete(session_factory, out.attachment_id)
+
+    assert await _upload(out.upload, body) in (200, 204)
+    row = await _complete(session_factory, out.attachment_id)
+    assert row.status == "ready"
+    assert row.checksum == _sha256(body)
+    assert row.s3_key == key
+    assert await storage.read_bytes(key) == body
+
+    # completing again is a no-op
+    assert (await _complete(session_factory, out.attachment_id)).status == "ready"
+
+    # the same content again is stored at once, without an upload
+    again = await _init(session_factory, body, name="copy.pdf")
+    assert again.status == "ready"
+    assert again.upload is None
+    async with session_factory() as db:
+        rows = (await db.execute(select(Attachment).order_by(Attachment.id))).scalars().all()
+        blobs = (await db.execute(select(AttachmentBlob))).scalars().all()
+    assert [(r.s3_key, r.status) for r in rows] == [(key, "ready"), (key, "ready")]
+    assert [(b.checksum, b.size_bytes) for b in blobs] == [(_sha256(body), len(body))]
+
+
+async def test_direct_upload_of_the_wrong_size_is_not_completed(
+    storage: Storage, attachments: None, session_factory
+) -> None:
+    body = b"%PDF-1.4 resume"
+    out = await _init(session_factory, body)
+    assert out.upload is not None
+    # written behind the app's back, e.g. by a client ignoring the signed length
+    await storage.put_bytes(blob_key(_sha256(body)), body + b"+", "text/plain")
+
+    with pytest.raises(BadRequest, match="expected"):
+        await _complete(session_factory, out.attachment_id)
+    async with session_factory() as db:
+        row = await db.get(Attachment, out.attachment_id)
+        assert row is not None and row.status == "uploading"
+        assert (await db.execute(select(AttachmentBlob))).scalars().all() == []
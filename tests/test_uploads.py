@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+from pathlib import Path
+from typing import Any
+
+import pytest
+from fastapi import UploadFile
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from starlette.datastructures import Headers
+
+import app.core.storage as app_storage
+import app.services.blob_store as blob_store
+from app.core.config import settings
+from app.core.exceptions import BadRequest
+from app.core.storage import LocalStorage
+from app.models.attachment import Attachment, AttachmentBlob
+from app.schemas.debug import FileGCOut
+from app.services.blob_store import blob_key, collect_blobs
+from app.services.file_gc import reconcile_files
+from app.services.uploads import store_uploads
+from tests.conftest import PythonNow, create_tables
+
+
+pytestmark = pytest.mark.anyio
+
+CHUNK = 64 * 1024
+SMALL = b"a resume that fits in one chunk"
+LARGE = os.urandom(3 * CHUNK + 5)
+
+
+class _Storage(LocalStorage):
+    """Local storage that records every write."""
+
+    def __init__(self, root: Path) -> None:
+        super().__init__(root)
+        self.writes: list[str] = []
+
+    async def put_file(self, key: str, src: Path) -> None:
+        self.writes.append(key)
+        await super().put_file(key, src)
+
+    async def put_bytes(self, key: str, data: bytes, content_type: str) -> None:
+        self.writes.append(key)
+        await super().put_bytes(key, data, content_type)
+
+
+@pytest.fixture
+async def storage(engine, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> _Storage:
+    await create_tables(engine, "attachment_blobs", "attachments")
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "UPLOAD_CHUNK_BYTES", CHUNK)
+    store = _Storage(tmp_path)
+    monkeypatch.setattr(app_storage, "_storage", store)
+    return store
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _file(data: bytes, name: str = "cv.pdf") -> UploadFile:
+    return UploadFile(
+        io.BytesIO(data),
+        size=len(data),
+        filename=name,
+        headers=Headers({"content-type": "application/pdf"}),
+    )
+
+
+async def _store(session_factory, tmp_path: Path, *files: UploadFile) -> list[Any]:
+    async with session_factory() as db:
+        stored = await store_uploads(db, list(files), tmp_path)
+        await db.commit()
+    return stored
+
+
+async def _blobs(session_factory) -> list[str]:
+    async with session_factory() as db:
+        return sorted((await db.execute(select(AttachmentBlob.checksum))).scalars())
+
+
+async def test_each_content_is_written_once(
+    storage: _Storage, session_factory, tmp_path: Path
+) -> None:
+    stored = await _store(
+        session_factory, tmp_path, _file(SMALL), _file(LARGE, "big.bin"), _file(SMALL, "copy.pdf")
+    )
+    assert [(s.key, s.size, s.filename) for s in stored] == [
+        (blob_key(_sha256(SMALL)), len(SMALL), "cv.pdf"),
+        (blob_key(_sha256(LARGE)), len(LARGE), "big.bin"),
+        (blob_key(_sha256(SMALL)), len(SMALL), "copy.pdf"),
+    ]
+    assert sorted(storage.writes) == sorted(s.key for s in stored[:2])
+    assert (tmp_path / stored[0].key).read_bytes() == SMALL
+    assert (tmp_path / stored[1].key).read_bytes() == LARGE
+    assert await _blobs(session_factory) == sorted([_sha256(SMALL), _sha256(LARGE)])
+
+    # stored content is neither written nor left staged again
+    storage.writes.clear()
+    again = await _store(session_factory, tmp_path, _file(LARGE), _file(SMALL))
+    assert [s.key for s in again] == [stored[1].key, stored[0].key]
+    assert storage.writes == []
+    assert list((tmp_path / ".tmp").iterdir()) == []
+
+
+async def test_an_oversized_file_fails_the_request_unwritten(
+    storage: _Storage, session_factory, tmp_path: Path
+) -> None:
+    async with session_factory() as db:
+        with pytest.raises(BadRequest, match="size must be"):
+            await store_uploads(db, [_file(SMALL), _file(LARGE)], tmp_path, max_bytes=CHUNK)
+        await db.rollback()
+    assert storage.writes == []
+    assert list((tmp_path / ".tmp").iterdir()) == []
+
+
+async def test_blobs_of_a_failed_insert_are_left_to_gc(
+    storage: _Storage, session_factory, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    key = blob_key(_sha256(LARGE))
+    async with session_factory() as db:
+        (stored,) = await store_uploads(db, [_file(LARGE)], tmp_path)
+        with pytest.raises(IntegrityError):
+            # as in upload_attachments, if the INSERT after store_uploads fails
+            await db.execute(insert(Attachment), [{"s3_key": stored.key, "uploader_id": None}])
+        await db.rollback()
+
+    # the blob row went with the rollback; the file stays for the GC
+    assert await _blobs(session_factory) == []
+    assert (tmp_path / key).exists()
+    os.utime(tmp_path / key, (0, 0))
+
+    monkeypatch.setattr(blob_store, "func", PythonNow())
+    monkeypatch.setattr(settings, "BLOB_GC_GRACE_SECONDS", 0)
+    monkeypatch.setattr(settings, "STORAGE_UPLOAD_URL_TTL_SECONDS", 0)
+    out = FileGCOut()
+    async with session_factory() as db:
+        await reconcile_files(db, out)
+    assert out.stray_blobs == 1
+    assert await _blobs(session_factory) == [_sha256(LARGE)]
+
+    async with session_factory() as db:
+        assert await collect_blobs(db, grace_seconds=0) == (1, len(LARGE))
+    assert await _blobs(session_factory) == []
+    assert not (tmp_path / key).exists()